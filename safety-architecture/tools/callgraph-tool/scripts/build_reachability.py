@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import logging
+import os
+
+import utils
+import callgraph_reachability
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+
+def getargs():
+    desc = "Build the entry point reachability index of the callgraph: the "\
+        "set of functions reachable from each entry point through any number "\
+        "of calls, stored as packed bitsets. Given the index with "\
+        "--reachability, query_callgraph.py, find_callchains.py and "\
+        "find_related.py answer the reachability questions without "\
+        "traversing the callgraph."
+
+    epil = "Example: ./%s --calls callgraph.csv --entry_regex '^__x64_sys_'" % \
+        os.path.basename(__file__)
+    parser = argparse.ArgumentParser(description=desc, epilog=epil)
+
+    required_named = parser.add_argument_group('required named arguments')
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
+    required_named.add_argument('--calls', help=help, required=True)
+
+    help = "regular expression matching the entry point function names, "\
+        "defaults to the system call functions '%s'" % \
+        callgraph_reachability.DEFAULT_ENTRY_REGEX
+    parser.add_argument(
+        '--entry_regex', help=help,
+        default=callgraph_reachability.DEFAULT_ENTRY_REGEX)
+    help = "Set the output file name, defaults to the --calls file name "\
+        "with suffix '%s'" % callgraph_reachability.REACH_SUFFIX
+    parser.add_argument('--out', help=help, default="")
+    help = "Set the verbosity level (e.g. -vv for debug level)"
+    parser.add_argument(
+        '-v', '--verbose', help=help, action='count', default=1)
+    return parser.parse_args()
+
+
+################################################################################
+
+
+if __name__ == "__main__":
+    args = getargs()
+
+    utils.exit_unless_accessible(args.calls)
+    utils.setup_logging(verbosity=args.verbose)
+
+    df = callgraph_reachability.read_calls(args.calls)
+    index = callgraph_reachability.ReachabilityIndex.from_df(df, args.entry_regex)
+    out = args.out or callgraph_reachability.default_filename(args.calls)
+    index.save(out, args.calls)
+
+################################################################################
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import html
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_dot
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Pen width of the edge with the most calls, the others are proportional
+MAX_PENWIDTH = 8.0
+
+################################################################################
+
+
+def parse_spec(spec):
+    # Aggregation level and directory depth of 'file', 'dir' or 'dir:N'.
+    # Depth None means the whole directory.
+    level, sep, depth = spec.partition(':')
+    if level in ['file', 'dir'] and not sep:
+        return level, None
+    if level == 'dir' and depth.isdigit() and int(depth) > 0:
+        return level, int(depth)
+    raise argparse.ArgumentTypeError(
+        "invalid aggregation '%s', expected 'file', 'dir' or 'dir:N'" % spec)
+
+
+def check_aggregate(spec):
+    parse_spec(spec)
+    return spec
+
+
+def group_names(filenames, spec):
+    # Group of each filename: the file, or the directory, or its first N
+    # path components with 'dir:N'. Top-level files are in the directory
+    # '.', and the root of absolute paths is not counted as a component.
+    # Missing filenames are in the group ''. Each distinct filename is
+    # mapped once.
+    level, depth = parse_spec(spec)
+    codes, uniques = pd.factorize(pd.Series(filenames, dtype=object).fillna(''))
+    groups = []
+    for filename in uniques:
+        if level == 'dir' and filename:
+            filename = _directory(filename, depth)
+        groups.append(filename)
+    return np.asarray(groups, dtype=object)[codes]
+
+
+def _directory(filename, depth):
+    directory = os.path.dirname(os.path.normpath(filename))
+    if not directory:
+        return "."
+    if depth is None:
+        return directory
+    root = "/" if directory.startswith("/") else ""
+    components = [c for c in directory[len(root):].split("/") if c]
+    return root + "/".join(components[:depth])
+
+
+def aggregate_edges(df, spec):
+    # Number of calls between each caller and callee group, the most
+    # calls first
+    df_groups = pd.DataFrame({
+        "caller_group": group_names(df['caller_filename'].values, spec),
+        "callee_group": group_names(df['callee_filename'].values, spec),
+    })
+    df_edges = df_groups.groupby(
+        ["caller_group", "callee_group"], sort=False).size().reset_index(name="calls")
+    df_edges.sort_values(
+        by=["calls", "caller_group", "callee_group"], ascending=[False, True, True],
+        inplace=True)
+    return df_edges.reset_index(drop=True)
+
+
+def group_functions(df, spec):
+    # Number of distinct functions in each group
+    df_functions = pd.concat([
+        pd.DataFrame({
+            "group": group_names(df['%s_filename' % side].values, spec),
+            "filename": df['%s_filename' % side].fillna('').values,
+            "function": df['%s_function' % side].fillna('').values,
+        }) for side in ["caller", "callee"]])
+    return df_functions.drop_duplicates().groupby("group").size()
+
+
+def _node_name(group):
+    # Graphviz doesn't like colons in the node names
+    return ("group_%s" % group).replace(":", "")
+
+
+def to_dot(df, spec):
+    # Graph of the groups of the calls in df, with the edges labelled with
+    # the number of calls and drawn with proportional width
+    df_edges = aggregate_edges(df, spec)
+    functions = group_functions(df, spec)
+    _LOGGER.info(
+        "Aggregated %s calls into %s edges between %s groups" % (
+            len(df), len(df_edges), len(functions)))
+    digraph = callgraph_dot.DotGraph(
+        graph_attr={'rankdir': 'LR'},
+        node_attr={'shape': 'box', 'style': 'rounded', 'margin': '0.3,0.1'})
+    for group, count in functions.items():
+        label = html.escape(group if group else "(unknown)")
+        digraph.node(
+            _node_name(group), label, ["functions: %s" % count],
+            style='rounded,filled', fillcolor='#EEEEEE')
+    maxcalls = df_edges['calls'].max() if len(df_edges) else 1
+    penwidths = 1.0 + (MAX_PENWIDTH - 1.0) * df_edges['calls'].values / maxcalls
+    for caller, callee, calls, penwidth in zip(
+            df_edges['caller_group'], df_edges['callee_group'],
+            df_edges['calls'], penwidths):
+        digraph.edge(
+            _node_name(caller), _node_name(callee),
+            label=str(calls), penwidth="%.2f" % penwidth)
+    return digraph
+
+
+################################################################################
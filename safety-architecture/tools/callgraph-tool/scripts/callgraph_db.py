@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import zipfile
+import numpy as np
+import pandas as pd
+
+import utils
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Version of the callgraph database file format, bump on incompatible changes
+DB_VERSION = 1
+
+# Callgraph database files are uncompressed numpy .npz archives. This member
+# is present in every callgraph database and is used to tell database files
+# apart from csv files regardless of the file extension.
+DB_HEADER = "cgdb_header"
+
+# Columns that share the filename and function dictionaries. Sharing the
+# dictionary makes the caller and callee codes directly comparable.
+FILENAME_COLS = ["caller_filename", "callee_filename", "callee_inlined_from_file"]
+FUNCTION_COLS = ["caller_function", "callee_function"]
+INT_COLS = [
+    "caller_def_line", "caller_line", "callee_line",
+    "callee_inlined_from_line", "call_depth"]
+
+# Missing values in integer columns
+INT_NA = -1
+
+################################################################################
+
+
+def is_callgraph_db(filename):
+    if not zipfile.is_zipfile(filename):
+        return False
+    with zipfile.ZipFile(filename) as zf:
+        return "%s.npy" % DB_HEADER in zf.namelist()
+
+
+def strings_to_arrays(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return data, offsets
+
+
+def arrays_to_strings(data, offsets):
+    buf = data.tobytes()
+    return [
+        buf[offsets[i]:offsets[i + 1]].decode('utf-8')
+        for i in range(len(offsets) - 1)]
+
+
+def _column_kind(name, series):
+    if name in FILENAME_COLS:
+        return "filename"
+    if name in FUNCTION_COLS:
+        return "function"
+    values = pd.to_numeric(series.cat.categories, errors='coerce')
+    if name in INT_COLS or (
+            len(values) > 0 and not np.isnan(values).any() and
+            (values >= 0).all() and (values == np.floor(values)).all()):
+        return "int"
+    return "category"
+
+
+def _int_codes(series):
+    # Convert the categories once, then map the codes: the conversion is
+    # done per unique value instead of per row
+    values = pd.to_numeric(series.cat.categories, errors='coerce')
+    values = np.where(np.isnan(values), INT_NA, np.floor(values)).astype(np.int64)
+    # Missing values have code -1, which picks the appended INT_NA
+    return np.append(values, INT_NA)[series.cat.codes.values]
+
+
+def _dict_codes(series, dictionary):
+    lookup = np.array(
+        [dictionary.setdefault(s, len(dictionary)) for s in series.cat.categories]
+        + [-1], dtype=np.int32)
+    return lookup[series.cat.codes.values]
+
+
+def write_callgraph_db(df, filename, drop_duplicates=True):
+    dictionaries = {"filename": {}, "function": {}}
+    header = {"version": DB_VERSION, "columns": []}
+    arrays = {}
+    for name in df.columns:
+        series = df[name]
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            if series.dtype != object:
+                series = series.astype(str).where(series.notna())
+            series = series.astype('category')
+        kind = _column_kind(name, series)
+        header["columns"].append({"name": name, "kind": kind})
+        if kind == "int":
+            arrays["col__%s" % name] = _int_codes(series)
+        elif kind == "category":
+            arrays["col__%s" % name] = series.cat.codes.values.astype(np.int32)
+            data, offsets = strings_to_arrays(series.cat.categories)
+            arrays["cat__%s__data" % name] = data
+            arrays["cat__%s__offsets" % name] = offsets
+        else:
+            arrays["col__%s" % name] = _dict_codes(series, dictionaries[kind])
+
+    for kind, dictionary in dictionaries.items():
+        data, offsets = strings_to_arrays(list(dictionary))
+        arrays["dict__%s__data" % kind] = data
+        arrays["dict__%s__offsets" % kind] = offsets
+
+    nrows = len(df)
+    if drop_duplicates and nrows > 0:
+        keep = ~pd.DataFrame(
+            {k: v for k, v in arrays.items() if k.startswith("col__")}
+        ).duplicated().values
+        for key in list(arrays):
+            if key.startswith("col__"):
+                arrays[key] = arrays[key][keep]
+        nrows = int(keep.sum())
+
+    header["rows"] = nrows
+    arrays[DB_HEADER] = np.frombuffer(
+        json.dumps(header).encode('utf-8'), dtype=np.uint8)
+    with open(filename, 'wb') as fp:
+        np.savez(fp, **arrays)
+    _LOGGER.info("wrote: %s" % filename)
+
+
+def read_callgraph_db(filename, na_strings=None, str_ints=False):
+    # na_strings: value for missing strings, defaults to NaN. Use '' to
+    # get the same values as pd.read_csv(..., keep_default_na=False).
+    # str_ints: return integer columns as strings instead of Int64
+    with np.load(filename, allow_pickle=False) as npz:
+        header = json.loads(npz[DB_HEADER].tobytes().decode('utf-8'))
+        if header["version"] != DB_VERSION:
+            _LOGGER.error(
+                "Unsupported callgraph database version in '%s': %s" % (
+                    filename, header["version"]))
+            exit(1)
+        dictionaries = {}
+        data = {}
+        for col in header["columns"]:
+            name, kind = col["name"], col["kind"]
+            codes = npz["col__%s" % name]
+            if kind == "int":
+                mask = codes == INT_NA
+                if str_ints:
+                    values = pd.Series(codes.astype(str), dtype=object)
+                    values[mask] = np.nan if na_strings is None else na_strings
+                else:
+                    values = pd.arrays.IntegerArray(codes.astype(np.int64), mask)
+                data[name] = values
+                continue
+            dictkey = "cat__%s" % name if kind == "category" else "dict__%s" % kind
+            if dictkey not in dictionaries:
+                dictionaries[dictkey] = _read_dictionary(npz, dictkey, na_strings)
+            categories, na_code = dictionaries[dictkey]
+            if na_code >= 0:
+                codes = np.where(codes < 0, na_code, codes)
+            data[name] = pd.Categorical.from_codes(codes, categories=categories)
+    df = pd.DataFrame(data, columns=[c["name"] for c in header["columns"]])
+    return df
+
+
+def read_chunks(filename, columns, chunksize):
+    # The given columns of callgraph csv or database 'filename' as strings,
+    # with missing values as '', 'chunksize' rows at a time. Database
+    # files are read whole. The integer columns of csv files are given in
+    # the form of the database, so that '12.0' and '12' compare equal.
+    is_db = is_callgraph_db(filename)
+    if is_db:
+        df = read_callgraph_db(filename, na_strings='', str_ints=True)
+        header = df.columns
+    else:
+        header = pd.read_csv(filename, nrows=0).columns
+    missing = [x for x in columns if x not in header]
+    if missing:
+        _LOGGER.error(
+            "Calls file '%s' missing required headers: %s" % (filename, missing))
+        exit(1)
+    if is_db:
+        yield df[columns]
+        return
+    int_cols = [x for x in columns if x in INT_COLS]
+    for df in pd.read_csv(
+            filename, usecols=columns, dtype=str, keep_default_na=False,
+            chunksize=chunksize):
+        for col in int_cols:
+            df[col] = _canonical_ints(df[col])
+        yield df
+
+
+def _canonical_ints(series):
+    # Numbers as the database stores them, converted once per unique value.
+    # Values that are not numbers are kept as they are.
+    uniques = series.unique()
+    values = pd.to_numeric(uniques, errors='coerce')
+    canonical = {
+        unique: str(int(np.floor(value))) if np.isfinite(value) else unique
+        for unique, value in zip(uniques, values)}
+    return series.map(canonical)
+
+
+def _read_dictionary(npz, key, na_strings):
+    strings = arrays_to_strings(
+        npz["%s__data" % key], npz["%s__offsets" % key])
+    na_code = -1
+    if na_strings is not None:
+        # Missing values get a category of their own. The category is added
+        # to the shared dictionary so that all columns using the dictionary
+        # keep identical categories and remain comparable with each other.
+        if na_strings in strings:
+            na_code = strings.index(na_strings)
+        else:
+            strings.append(na_strings)
+            na_code = len(strings) - 1
+    return pd.Index(strings, dtype=object), na_code
+
+
+################################################################################
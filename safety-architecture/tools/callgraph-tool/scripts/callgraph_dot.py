@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import html
+import json
+import logging
+import os
+import re
+import subprocess
+from graphviz import quoting
+
+import utils
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Graphs with more nodes than this are laid out with sfdp instead of dot
+# when the layout engine is 'auto'
+LARGE_GRAPH_NODES = 2000
+
+# Layout engines tried with 'auto': dot is retried with sfdp if it fails
+# or times out
+LAYOUTS = ['auto', 'dot', 'sfdp']
+
+# Seconds each layout engine is given by default
+DEFAULT_LAYOUT_TIMEOUT = 300
+
+# Output formats laid out in the browser instead of graphviz: Cytoscape.js
+# elements as json, or a html page drawing them
+BROWSER_FORMATS = ['json', 'html']
+
+# Cytoscape.js version the html output is written for: the first version
+# with the WebGL renderer
+CYTOSCAPE_VERSION = "3.31.0"
+
+# With this value instead of a file, the html page loads the pinned version
+# of Cytoscape.js from the CDN. Given a file, Cytoscape.js is inlined into
+# the page, so that it works offline.
+CYTOSCAPE_CDN = "cdn"
+CYTOSCAPE_URL = \
+    "https://unpkg.com/cytoscape@%s/dist/cytoscape.min.js" % CYTOSCAPE_VERSION
+DEFAULT_CYTOSCAPE_JS = CYTOSCAPE_CDN
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+%(cytoscape)s
+<style>
+  html, body, #graph { margin: 0; width: 100%%; height: 100%%; }
+</style>
+</head>
+<body>
+<div id="graph"></div>
+<script>
+var elements = %(elements)s;
+cytoscape({
+  container: document.getElementById('graph'),
+  elements: elements,
+  // WebGL renderer of Cytoscape.js 3.31, ignored by the older versions
+  renderer: { name: 'canvas', webgl: true },
+  layout: { name: '%(layout)s', animate: false },
+  style: [
+    { selector: 'node', style: {
+        'shape': 'round-rectangle', 'label': 'data(text)',
+        'text-wrap': 'wrap', 'text-valign': 'center', 'font-size': 10,
+        'width': 'label', 'height': 'label', 'padding': 8,
+        'background-color': 'data(fillcolor)', 'border-width': 1,
+        'border-style': 'data(borderstyle)' } },
+    { selector: 'edge', style: {
+        'curve-style': 'bezier', 'target-arrow-shape': 'triangle',
+        'width': 'data(width)', 'line-style': 'data(linestyle)',
+        'label': 'data(label)', 'font-size': 8 } }
+  ]
+});
+</script>
+</body>
+</html>
+"""
+
+################################################################################
+
+
+class DotGraph():
+    # Directed graph gathered in dicts and written once as DOT source.
+    # Nodes are deduplicated by name: the labels given for the same node
+    # are merged, preserving order, and the latest attributes win.
+    # Edges are kept with their multiplicity, so multiedges are drawn as
+    # before unless the graph attribute concentrate merges them.
+    def __init__(self, graph_attr, node_attr):
+        self.graph_attr = graph_attr
+        self.node_attr = node_attr
+        # Key: node name, Value: (function, labels dict, attributes)
+        self.nodes = {}
+        # Key: (tail, head, attributes), Value: number of such edges
+        self.edges = {}
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def __len__(self):
+        return len(self.nodes) + len(self.edges)
+
+    def node(self, name, function, labels, **attrs):
+        # Node labelled with the function name, html escaped by the caller,
+        # on the first line followed by the labels
+        node = self.nodes.get(name)
+        if node is None:
+            self.nodes[name] = (function, dict.fromkeys(labels), attrs)
+        else:
+            node[1].update(dict.fromkeys(labels))
+            node[2].update(attrs)
+
+    def edge(self, tail, head, **attrs):
+        key = (tail, head, tuple(
+            (attr, value) for attr, value in attrs.items() if value is not None))
+        self.edges[key] = self.edges.get(key, 0) + 1
+
+    def write(self, filename):
+        # Stream the DOT source to filename
+        beg = "<FONT POINT-SIZE=\"10\">"
+        end = "</FONT>"
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("digraph {\n")
+            for kind, attrs in [('graph', self.graph_attr), ('node', self.node_attr)]:
+                if attrs:
+                    f.write("\t%s%s\n" % (kind, quoting.attr_list(None, attrs)))
+            for name, (function, labels, attrs) in self.nodes.items():
+                label = "<%s<BR/>%s%s%s>" % (function, beg, "<BR/>".join(labels), end)
+                f.write("\t%s%s\n" % (quoting.quote(name), quoting.attr_list(label, attrs)))
+            for (tail, head, attrs), count in self.edges.items():
+                line = "\t%s -> %s%s\n" % (
+                    quoting.quote_edge(tail), quoting.quote_edge(head),
+                    quoting.attr_list(None, dict(attrs)))
+                f.write(line * count)
+            f.write("}\n")
+
+    def elements(self):
+        # Cytoscape.js elements of the graph. The attributes are kept as
+        # element data, the labels as plain text.
+        nodes = []
+        for name, (function, labels, attrs) in self.nodes.items():
+            function = html.unescape(function)
+            labels = [label.strip() for label in labels if label.strip()]
+            style = attrs.get('style', '')
+            nodes.append({"data": {
+                "id": name,
+                "function": function,
+                "labels": labels,
+                "text": "\n".join([function] + labels),
+                "fillcolor": attrs.get('fillcolor', '#EEEEEE'),
+                "borderstyle": "dashed" if "dashed" in style else "solid",
+            }})
+        edges = []
+        for i, ((tail, head, attrs), count) in enumerate(self.edges.items()):
+            attrs = dict(attrs)
+            label = attrs.get('label', '')
+            if label.startswith('<') and label.endswith('>'):
+                # Html label: strip the font-tags
+                label = html.unescape(re.sub(r'<[^>]*>', '', label[1:-1]))
+            edges.append({"data": {
+                "id": "e%s" % i,
+                "source": tail,
+                "target": head,
+                "label": label,
+                "linestyle": attrs.get('style', 'solid'),
+                "width": float(attrs.get('penwidth', 1.0)),
+                "count": count,
+            }})
+        return {"nodes": nodes, "edges": edges}
+
+    def write_browser(self, filename, fileformat, cytoscape_js=DEFAULT_CYTOSCAPE_JS):
+        # Write the graph to be laid out in the browser: Cytoscape.js
+        # elements as json, or a html page drawing them with Cytoscape.js
+        # from the CDN or inlined from the file 'cytoscape_js'
+        if fileformat == 'html':
+            cytoscape = _cytoscape_script(cytoscape_js)
+        elements = self.elements()
+        with open(filename, 'w', encoding='utf-8') as f:
+            if fileformat == 'json':
+                json.dump({"elements": elements}, f)
+                return
+            # Large graphs are laid out with the faster force-directed layout
+            layout = 'cose' if len(self.nodes) > LARGE_GRAPH_NODES else 'breadthfirst'
+            f.write(HTML_TEMPLATE % {
+                "title": html.escape(os.path.basename(filename)),
+                "cytoscape": cytoscape,
+                "layout": layout,
+                # Escape the closing tags within the script element
+                "elements": json.dumps(elements).replace("</", "<\\/"),
+            })
+
+    def render(
+            self, filename, layout='auto', timeout=DEFAULT_LAYOUT_TIMEOUT,
+            cytoscape_js=DEFAULT_CYTOSCAPE_JS):
+        # Render to filename in the format given by its extension. With
+        # the 'auto' layout, large graphs are laid out with sfdp, and dot
+        # falls back to sfdp if it fails or runs out of time. The json and
+        # html formats are laid out in the browser.
+        _fname, extension = os.path.splitext(filename)
+        if extension[1:] in BROWSER_FORMATS:
+            self.write_browser(filename, extension[1:], cytoscape_js)
+            _LOGGER.info("wrote: %s" % filename)
+            return
+        source = "%s.tmp" % filename
+        self.write(source)
+        if layout != 'auto':
+            engines = [layout]
+        elif len(self.nodes) > LARGE_GRAPH_NODES:
+            _LOGGER.info(
+                "Graph has %s nodes, laying out with sfdp" % len(self.nodes))
+            engines = ['sfdp']
+        else:
+            engines = ['dot', 'sfdp']
+        try:
+            for engine in engines:
+                if _run_layout(engine, extension[1:], source, filename, timeout):
+                    _LOGGER.info("wrote: %s" % filename)
+                    return
+        finally:
+            os.remove(source)
+        _LOGGER.error("Failed rendering: %s" % filename)
+        exit(1)
+
+
+################################################################################
+
+
+def _cytoscape_script(cytoscape_js):
+    # Script element with Cytoscape.js inlined from the file, or loading
+    # it from the CDN if 'cytoscape_js' is CYTOSCAPE_CDN
+    if cytoscape_js == CYTOSCAPE_CDN:
+        return '<script src="%s"></script>' % CYTOSCAPE_URL
+    try:
+        with open(cytoscape_js, encoding='utf-8') as f:
+            source = f.read()
+    except OSError as e:
+        _LOGGER.error(
+            "Failed reading Cytoscape.js for the html output: %s. Download "
+            "it from %s, or leave out --cytoscape_js to load it from there" % (
+                e, CYTOSCAPE_URL))
+        exit(1)
+    # Escape the closing tags within the script element
+    return "<script>\n%s\n</script>" % source.replace("</script", "<\\/script")
+
+
+def _run_layout(engine, fileformat, source, filename, timeout):
+    # Returns True if the engine rendered the source to filename
+    cmd = [engine, "-T%s" % fileformat, "-o", filename, source]
+    try:
+        proc = subprocess.run(
+            cmd, stderr=subprocess.PIPE, universal_newlines=True, timeout=timeout)
+    except FileNotFoundError:
+        _LOGGER.error(
+            "Graphviz layout engine '%s' not found, make sure graphviz is "
+            "installed and in PATH" % engine)
+        return False
+    except subprocess.TimeoutExpired:
+        _LOGGER.warning("Layout engine '%s' timed out after %ss" % (engine, timeout))
+        return False
+    if proc.returncode != 0:
+        _LOGGER.warning(
+            "Layout engine '%s' failed: %s" % (engine, proc.stderr.strip()))
+        return False
+    return True
+
+
+################################################################################
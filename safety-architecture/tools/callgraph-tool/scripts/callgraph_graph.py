@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_names
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+
+class CallGraph():
+    # Function call graph where the nodes are the unique (filename, function)
+    # pairs of the callgraph database, identified with dense integer ids.
+    # Missing values are expected as empty strings, as read with
+    # keep_default_na=False.
+    def __init__(self, df):
+        rows = df.shape[0]
+        filenames = pd.concat(
+            [df['caller_filename'], df['callee_filename']], ignore_index=True)
+        functions = pd.concat(
+            [df['caller_function'], df['callee_function']], ignore_index=True)
+        filename_codes, filename_uniques = pd.factorize(filenames)
+        function_codes, function_uniques = pd.factorize(functions)
+        nfunctions = len(function_uniques)
+        ids, keys = pd.factorize(
+            filename_codes.astype(np.int64) * nfunctions + function_codes)
+        # Node id of the caller and callee of each row
+        self.caller = ids[:rows]
+        self.callee = ids[rows:]
+        # Filename and function of each node id
+        self.filenames = np.asarray(filename_uniques, dtype=object)[keys // nfunctions]
+        self.functions = np.asarray(function_uniques, dtype=object)[keys % nfunctions]
+        self.nodes = len(keys)
+        self._lookup = None
+        self._digraph = None
+        self._edge_keys = None
+        self._edge_rows = None
+
+    @property
+    def digraph(self):
+        # networkx DiGraph over the node ids, built on first use
+        if self._digraph is None:
+            _LOGGER.debug("Building graph with %s nodes" % self.nodes)
+            self._digraph = nx.DiGraph()
+            self._digraph.add_edges_from(zip(self.caller.tolist(), self.callee.tolist()))
+        return self._digraph
+
+    def node_ids(self, nodes):
+        # Node ids of the given (filename, function) pairs, -1 if not found
+        if self._lookup is None:
+            self._lookup = pd.MultiIndex.from_arrays([self.filenames, self.functions])
+        nodes = list(nodes)
+        if len(nodes) == 0:
+            return np.empty(0, dtype=np.int64)
+        return self._lookup.get_indexer(nodes)
+
+    def node_id(self, filename, function):
+        return self.node_ids([(filename, function)])[0]
+
+    def edge_rows(self, caller, callee):
+        # Rows of the calls from node caller to node callee
+        if self._edge_keys is None:
+            keys = self.caller.astype(np.int64) * self.nodes + self.callee
+            self._edge_rows = np.argsort(keys, kind='stable')
+            self._edge_keys = keys[self._edge_rows]
+        key = caller * self.nodes + callee
+        begin, end = np.searchsorted(self._edge_keys, [key, key + 1])
+        return self._edge_rows[begin:end]
+
+    def edges(self, orientation='original'):
+        # Unique edges as arrays of source and target node ids. With
+        # orientation 'reverse', the edges point from callee to caller.
+        src, dst = self.caller, self.callee
+        if orientation == 'reverse':
+            src, dst = dst, src
+        edges = np.unique(src.astype(np.int64) * self.nodes + dst)
+        return edges // self.nodes, edges % self.nodes
+
+    def search_bits(self, nodes, cutoff=None, orientation='original'):
+        # Breadth-first search from all the given nodes in one pass, at most
+        # 'cutoff' edges away (unbounded if None). Bit k of the bitset of a
+        # node is set if the node is reached from nodes[k]. Yields the nodes
+        # first reached on each level and their bits first set on that
+        # level, as rows of uint64 words. Recursive calls are skipped.
+        reverse = 'reverse' if orientation == 'original' else 'original'
+        targets, sources = self.edges(reverse)
+        recursive = targets == sources
+        targets, sources = targets[~recursive], sources[~recursive]
+        words = max(1, (len(nodes) + 63) // 64)
+        index = np.arange(len(nodes))
+        frontier = np.zeros((self.nodes, words), dtype=np.uint64)
+        np.bitwise_or.at(
+            frontier, (np.asarray(nodes, dtype=np.int64), index // 64),
+            np.left_shift(np.uint64(1), (index % 64).astype(np.uint64)))
+        reached = np.zeros_like(frontier)
+        level = 0
+        while cutoff is None or level < cutoff:
+            level += 1
+            # The edges are sorted by target: OR the bits of the sources
+            # per target
+            edges = np.flatnonzero(frontier.any(axis=1)[sources])
+            if len(edges) == 0:
+                break
+            edge_targets = targets[edges]
+            starts = np.flatnonzero(
+                np.concatenate([[True], edge_targets[1:] != edge_targets[:-1]]))
+            found = edge_targets[starts]
+            bits = np.bitwise_or.reduceat(frontier[sources[edges]], starts, axis=0)
+            bits &= ~reached[found]
+            new = bits.any(axis=1)
+            found, bits = found[new], bits[new]
+            if len(found) == 0:
+                break
+            reached[found] |= bits
+            frontier = np.zeros_like(frontier)
+            frontier[found] = bits
+            yield found, bits
+
+
+def fingerprints(df, columns):
+    # 64-bit hash of the given columns of each row: rows with equal values
+    # get equal fingerprints whether the columns are strings or categories
+    return pd.util.hash_pandas_object(df[columns], index=False).values.view(np.int64)
+
+
+def is_member(values, sorted_set):
+    # Values found in the sorted array 'sorted_set'
+    if len(sorted_set) == 0:
+        return np.zeros(len(values), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_set, values), len(sorted_set) - 1)
+    return sorted_set[pos] == values
+
+
+class NodeNames():
+    # Lookup of nodes by name, given as 'function' or 'filename:function'
+    def __init__(self, filenames, functions):
+        self.filenames = filenames
+        self._function_nodes = {}
+        for node, function in enumerate(functions):
+            self._function_nodes.setdefault(function, []).append(node)
+        # Name index for the suggestions, built on the first unknown name
+        self._names = None
+
+    def node(self, name):
+        # Raises ValueError if there is no single such function
+        nodes = self._function_nodes.get(name, [])
+        if not nodes and ":" in name:
+            filename, function = name.split(":", 1)
+            nodes = [
+                node for node in self._function_nodes.get(function, [])
+                if self.filenames[node] == filename]
+        if len(nodes) == 0:
+            raise ValueError(
+                "Function '%s' does not exist in call graph database%s" % (
+                    name, self._suggest(name.split(":", 1)[-1])))
+        if len(nodes) > 1:
+            raise ValueError(
+                "Multiple functions with the name '%s' exist in call graph database. "
+                "Please, specify the correct function using filepath:filename "
+                "format" % name)
+        return nodes[0]
+
+    def _suggest(self, function):
+        if self._names is None:
+            self._names = callgraph_names.NameIndex.from_names(
+                [function for function in self._function_nodes
+                 if isinstance(function, str) and function])
+        return callgraph_names.suggest(self._names, function)
+
+
+################################################################################
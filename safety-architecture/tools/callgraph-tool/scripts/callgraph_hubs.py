@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+import utils
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+
+def fan_in(caller, callee, nodes):
+    # Number of distinct callers of each node, given the caller and callee
+    # node of each call. Calls with missing nodes (-1) are not counted.
+    valid = (caller >= 0) & (callee >= 0)
+    edges = np.unique(caller[valid].astype(np.int64) * nodes + callee[valid])
+    return np.bincount(edges % nodes, minlength=nodes)
+
+
+def fan_out(caller, callee, nodes):
+    # Number of distinct callees of each node
+    return fan_in(callee, caller, nodes)
+
+
+class Hubs():
+    # Functions whose calls are not followed in the traversals, so that they
+    # appear as leaves: either the functions with at least 'threshold'
+    # distinct callers, or the functions listed in a prune list file with
+    # the column 'function', and optionally 'filename' (e.g. the output of
+    # find_hubs.py). Empty filename matches the function in any file.
+    def __init__(self, spec):
+        self.spec = spec
+        self.threshold = None
+        self.functions = set()
+        self.nodes = set()
+        if os.path.isfile(spec):
+            df = pd.read_csv(spec, keep_default_na=False, dtype=str)
+            if 'function' not in df.columns:
+                _LOGGER.error(
+                    "Prune list '%s' missing required headers: %s" % (spec, ['function']))
+                exit(1)
+            filenames = df['filename'] if 'filename' in df.columns else [''] * len(df)
+            for filename, function in zip(filenames, df['function']):
+                if filename:
+                    self.nodes.add((filename, function))
+                else:
+                    self.functions.add(function)
+        elif spec.isdigit() and int(spec) > 0:
+            self.threshold = int(spec)
+        else:
+            _LOGGER.error(
+                "Prune list file not found, or invalid fan-in threshold: \"%s\"" % spec)
+            exit(1)
+
+    def mask(self, caller, callee, functions, filenames=None):
+        # Hub mask of the nodes, given the caller and callee node of each
+        # call, and the function and filename of each node. Without the
+        # filenames, the nodes are functions identified by name only, and
+        # the listed functions match regardless of the filename.
+        if self.threshold is not None:
+            hubs = fan_in(caller, callee, len(functions)) >= self.threshold
+        else:
+            functions = pd.Series(functions, dtype=object).fillna('')
+            names = self.functions
+            if filenames is None:
+                names = names | set(function for _filename, function in self.nodes)
+            hubs = functions.isin(names).values
+            if filenames is not None and self.nodes:
+                filenames = pd.Series(filenames, dtype=object).fillna('')
+                hubs |= pd.MultiIndex.from_arrays(
+                    [filenames, functions]).isin(list(self.nodes))
+        _LOGGER.info("Pruning the calls made by %s hub functions" % hubs.sum())
+        return hubs
+
+
+################################################################################
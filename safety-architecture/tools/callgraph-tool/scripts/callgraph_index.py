@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_db
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Version of the index format, bump on incompatible changes
+INDEX_VERSION = 2
+
+# The index is stored in a directory next to the callgraph file
+INDEX_SUFFIX = ".cgindex"
+
+# Arrays stored as .npy files in the index directory
+INDEX_ARRAYS = [
+    # Node table: one entry per unique (filename, function, line) triplet.
+    # Filename and function are codes to the string dictionaries, missing
+    # values are -1.
+    "node_filename", "node_function", "node_line",
+    # Caller and callee node of each row in the callgraph
+    "caller_node", "callee_node",
+    # Forward adjacency in CSR format: the rows where node 'n' is the
+    # caller are fwd_rows[fwd_indptr[n]:fwd_indptr[n+1]]
+    "fwd_indptr", "fwd_rows",
+    # Reverse adjacency: the rows where node 'n' is the callee
+    "rev_indptr", "rev_rows",
+    # Call of each row: rows with the same caller filename and function,
+    # caller line, and callee filename, function and line get the same key
+    "edge_key",
+    # Rows where the call type is indirect
+    "indirect",
+]
+
+################################################################################
+
+
+class CallGraphIndex():
+    def __init__(self, arrays, filenames, functions):
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.filenames = filenames
+        self.functions = functions
+        self.nodes = len(self.node_function)
+        # Nodes with any of the identifying values missing never match
+        # any other node when following the call chains
+        self.node_valid = \
+            (self.node_filename >= 0) & \
+            (self.node_function >= 0) & \
+            (self.node_line >= 0)
+        self._function_codes = None
+        self._filename_codes = None
+
+    @classmethod
+    def from_df(cls, df):
+        filename_codes, filenames = _factorize(
+            df['caller_filename'], df['callee_filename'])
+        function_codes, functions = _factorize(
+            df['caller_function'], df['callee_function'])
+        line_codes = np.concatenate([
+            _line_codes(df['caller_def_line']), _line_codes(df['callee_line'])])
+
+        # Unique (filename, function, line) triplets become the nodes
+        keys = np.stack([filename_codes, function_codes, line_codes], axis=1)
+        node_keys, node_codes = np.unique(keys, axis=0, return_inverse=True)
+        node_codes = node_codes.reshape(-1).astype(np.int32)
+        nodes = node_keys.shape[0]
+        rows = len(df)
+
+        arrays = {
+            "node_filename": node_keys[:, 0].astype(np.int32),
+            "node_function": node_keys[:, 1].astype(np.int32),
+            "node_line": node_keys[:, 2],
+            "caller_node": node_codes[:rows],
+            "callee_node": node_codes[rows:],
+        }
+        arrays["fwd_indptr"], arrays["fwd_rows"] = csr(arrays["caller_node"], nodes)
+        arrays["rev_indptr"], arrays["rev_rows"] = csr(arrays["callee_node"], nodes)
+
+        edges = np.stack([
+            filename_codes[:rows], function_codes[:rows],
+            _line_codes(df['caller_line']),
+            filename_codes[rows:], function_codes[rows:], line_codes[rows:]], axis=1)
+        _keys, edge_key = np.unique(edges, axis=0, return_inverse=True)
+        arrays["edge_key"] = edge_key.reshape(-1).astype(np.int64)
+        if 'callee_calltype' in df.columns:
+            arrays["indirect"] = (df['callee_calltype'] == "indirect").values
+        else:
+            arrays["indirect"] = np.zeros(rows, dtype=bool)
+        return cls(arrays, filenames, functions)
+
+    @classmethod
+    def load(cls, dirname):
+        arrays = {
+            name: np.load(os.path.join(dirname, "%s.npy" % name), mmap_mode='r')
+            for name in INDEX_ARRAYS}
+        strings = {}
+        for name in ["filenames", "functions"]:
+            strings[name] = callgraph_db.arrays_to_strings(
+                np.load(os.path.join(dirname, "%s_data.npy" % name)),
+                np.load(os.path.join(dirname, "%s_offsets.npy" % name)))
+        return cls(arrays, strings["filenames"], strings["functions"])
+
+    def save(self, dirname, meta):
+        parent = os.path.dirname(os.path.abspath(dirname))
+        tmpdir = tempfile.mkdtemp(dir=parent, prefix=".cgindex-")
+        try:
+            for name in INDEX_ARRAYS:
+                np.save(os.path.join(tmpdir, "%s.npy" % name), getattr(self, name))
+            for name in ["filenames", "functions"]:
+                data, offsets = callgraph_db.strings_to_arrays(getattr(self, name))
+                np.save(os.path.join(tmpdir, "%s_data.npy" % name), data)
+                np.save(os.path.join(tmpdir, "%s_offsets.npy" % name), offsets)
+            # Write the meta file last: index without meta file is not valid
+            _write_meta(tmpdir, meta)
+            shutil.rmtree(dirname, ignore_errors=True)
+            os.rename(tmpdir, dirname)
+        except OSError:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+    def rename_filenames(self, filenames):
+        # Replace the filename strings keeping the codes, e.g. after
+        # normalizing the paths
+        self.filenames = filenames
+        self._filename_codes = None
+
+    def function_code(self, function):
+        if self._function_codes is None:
+            self._function_codes = {f: i for i, f in enumerate(self.functions)}
+        return self._function_codes.get(function, -1)
+
+    def filename_code(self, filename):
+        if self._filename_codes is None:
+            self._filename_codes = {f: i for i, f in enumerate(self.filenames)}
+        return self._filename_codes.get(filename, -1)
+
+    def function_nodes(self, function, filename=None):
+        code = self.function_code(function)
+        if code < 0:
+            return np.empty(0, dtype=np.int64)
+        match = np.asarray(self.node_function) == code
+        if filename is not None:
+            match &= np.asarray(self.node_filename) == self.filename_code(filename)
+        return np.flatnonzero(match)
+
+    def function_rows(self, function, filename=None, inverse=False):
+        # Rows where the caller (or callee if inverse) matches the given
+        # function and, optionally, filename. Rows are in callgraph order.
+        nodes = self.function_nodes(function, filename)
+        if inverse:
+            rows = [self.rows_calling(node) for node in nodes]
+        else:
+            rows = [self.rows_called_by(node) for node in nodes]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(rows))
+
+    def rows_called_by(self, node):
+        # Rows where 'node' is the caller
+        return self.fwd_rows[self.fwd_indptr[node]:self.fwd_indptr[node + 1]]
+
+    def rows_calling(self, node):
+        # Rows where 'node' is the callee
+        return self.rev_rows[self.rev_indptr[node]:self.rev_indptr[node + 1]]
+
+    def next_rows(self, row, inverse=False):
+        # Rows that continue the call chain from the given row
+        if inverse:
+            node = self.caller_node[row]
+            if not self.node_valid[node]:
+                return np.empty(0, dtype=np.int64)
+            return self.rows_calling(node)
+        node = self.callee_node[row]
+        if not self.node_valid[node]:
+            return np.empty(0, dtype=np.int64)
+        return self.rows_called_by(node)
+
+
+################################################################################
+
+
+def index_dirname(filename):
+    return "%s%s" % (filename, INDEX_SUFFIX)
+
+
+def load_or_build(filename, df):
+    # Return the index for callgraph 'filename', whose content is 'df'.
+    # The index is loaded from the index directory if it's up-to-date,
+    # otherwise, it's built from 'df' and saved for later use.
+    dirname = index_dirname(filename)
+    meta = _read_meta(dirname)
+    if meta and meta.get("version") == INDEX_VERSION and \
+            meta.get("rows") == len(df) and \
+            utils.signature_matches(filename, meta.get("signature")):
+        _LOGGER.debug("Using index: %s" % dirname)
+        index = CallGraphIndex.load(dirname)
+        signature = utils.file_signature(filename, with_hash=False)
+        if signature["mtime_ns"] != meta["signature"]["mtime_ns"]:
+            # Content matches, but the file was touched: update the
+            # modification time to skip the hash check on next load
+            meta["signature"]["mtime_ns"] = signature["mtime_ns"]
+            _try_write_meta(dirname, meta)
+        return index
+
+    _LOGGER.info("Building index: %s" % dirname)
+    index = CallGraphIndex.from_df(df)
+    meta = {
+        "version": INDEX_VERSION,
+        "rows": len(df),
+        "signature": utils.file_signature(filename),
+    }
+    try:
+        index.save(dirname, meta)
+    except OSError as e:
+        _LOGGER.warning("Failed writing index '%s': %s" % (dirname, e))
+    return index
+
+
+def _factorize(caller, callee):
+    # Factorize caller and callee values with a shared dictionary, so that
+    # the codes are comparable between the caller and callee columns
+    values = pd.concat([caller, callee], ignore_index=True)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.remove_unused_categories()
+        codes = values.cat.codes.values.astype(np.int64)
+        uniques = [str(x) for x in values.cat.categories]
+    else:
+        codes, uniques = pd.factorize(values)
+        uniques = [str(x) for x in uniques]
+    return codes, uniques
+
+
+def _line_codes(lines):
+    lines = pd.to_numeric(lines, errors='coerce').astype('float64').values
+    return np.where(np.isnan(lines), -1, np.floor(lines)).astype(np.int64)
+
+
+def csr(nodes, count):
+    # Group the positions of 'nodes' by node: the positions where the value
+    # is 'n' are rows[indptr[n]:indptr[n+1]], in their original order
+    rows = np.argsort(nodes, kind='stable')
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(nodes, minlength=count), out=indptr[1:])
+    return indptr, rows
+
+
+def csr_gather(indptr, rows, nodes):
+    # Concatenation of the CSR slices of all the given nodes
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = counts.sum()
+    if total == 0:
+        return np.empty(0, dtype=rows.dtype)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return rows[offsets + np.arange(total)]
+
+
+def _read_meta(dirname):
+    try:
+        with open(os.path.join(dirname, "meta.json")) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(dirname, meta):
+    with open(os.path.join(dirname, "meta.json"), 'w') as fp:
+        json.dump(meta, fp, indent=4)
+
+
+def _try_write_meta(dirname, meta):
+    try:
+        _write_meta(dirname, meta)
+    except OSError as e:
+        _LOGGER.debug("Failed updating index meta: %s" % e)
+
+
+################################################################################
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import bisect
+import json
+import logging
+import os
+import re
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_db
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Version of the name index file format, bump on incompatible changes
+NAMES_VERSION = 1
+
+# Name index files are uncompressed numpy .npz archives with this member
+# holding the json header
+NAMES_HEADER = "names_header"
+
+# Default name index file name is the callgraph file name with this suffix
+NAMES_SUFFIX = ".names"
+
+# Kinds of names in the index, and the callgraph columns they are read from
+KINDS = {
+    "functions": ["caller_function", "callee_function"],
+    "filenames": ["caller_filename", "callee_filename"],
+}
+
+# Arrays of each kind of names in the index file
+NAME_ARRAYS = ["data", "offsets", "keys", "indptr", "postings", "counts", "order"]
+
+# Names sharing less than this share of trigrams are not suggested
+MIN_SIMILARITY = 0.2
+
+################################################################################
+
+
+class NameIndex():
+    # Trigram index over a list of distinct names. The trigrams are taken
+    # from the lower case name padded with two spaces in front and one
+    # behind, and packed into int64 keys of three 21-bit code points. The
+    # names of trigram keys[t] are postings[indptr[t]:indptr[t+1]], and
+    # counts[n] is the number of distinct trigrams of name n. The names
+    # in sorted order are names[order].
+    def __init__(self, names, arrays):
+        self.names = names
+        self.keys = arrays["keys"]
+        self.indptr = arrays["indptr"]
+        self.postings = arrays["postings"]
+        self.counts = arrays["counts"]
+        self.order = arrays["order"]
+        self._sorted = None
+        self._ranks = None
+
+    @classmethod
+    def from_names(cls, names):
+        names = [str(name) for name in names]
+        keys, postings = _trigrams(names)
+        # Distinct (trigram, name) pairs sorted by trigram
+        order = np.lexsort((postings, keys))
+        keys, postings = keys[order], postings[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (postings[1:] != postings[:-1])
+        keys, postings = keys[distinct], postings[distinct]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]])) \
+            if len(keys) else np.empty(0, dtype=np.int64)
+        arrays = {
+            "keys": keys[starts],
+            "indptr": np.append(starts, len(keys)).astype(np.int64),
+            "postings": postings.astype(np.int32),
+            "counts": np.bincount(postings, minlength=len(names)).astype(np.int32),
+            "order": np.asarray(
+                sorted(range(len(names)), key=names.__getitem__), dtype=np.int64),
+        }
+        return cls(names, arrays)
+
+    def to_arrays(self):
+        data, offsets = callgraph_db.strings_to_arrays(self.names)
+        return {
+            "data": data, "offsets": offsets, "keys": self.keys,
+            "indptr": self.indptr, "postings": self.postings,
+            "counts": self.counts, "order": self.order,
+        }
+
+    def closest(self, name, limit=5, min_similarity=MIN_SIMILARITY):
+        # Names most similar to 'name' by the share of common trigrams,
+        # the most similar first
+        if not self.names:
+            return []
+        query = np.unique(_trigrams([name])[0])
+        pos = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        found = pos[self.keys[pos] == query]
+        starts = self.indptr[found]
+        lengths = self.indptr[found + 1] - starts
+        postings = self.postings[
+            np.repeat(starts - np.cumsum(lengths) + lengths, lengths) +
+            np.arange(lengths.sum())]
+        shared = np.bincount(postings, minlength=len(self.names))
+        candidates = np.flatnonzero(shared)
+        similarity = shared[candidates] / (
+            len(query) + self.counts[candidates] - shared[candidates])
+        keep = similarity >= min_similarity
+        if keep.sum() > limit:
+            # Only the names at least as similar as the limit:th are ranked
+            kth = -np.partition(-similarity[keep], limit - 1)[limit - 1]
+            keep &= similarity >= kth
+        candidates, similarity = candidates[keep], similarity[keep]
+        # Most similar first, equally similar in name order
+        best = candidates[np.lexsort((self._rank()[candidates], -similarity))[:limit]]
+        return [self.names[n] for n in best]
+
+    def prefix(self, prefix):
+        # Names starting with 'prefix', sorted
+        names = self._sorted_names()
+        begin = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + chr(0x10FFFF), lo=begin)
+        return names[begin:end]
+
+    def regex(self, regex):
+        # Names where 'regex' matches (re.search), sorted. Regexes anchored
+        # to a literal prefix are only tried on the names with the prefix.
+        pattern = re.compile(regex)
+        literal = _literal_prefix(regex)
+        names = self.prefix(literal) if literal else self._sorted_names()
+        return [name for name in names if pattern.search(name)]
+
+    def _rank(self):
+        # Position of each name in the sorted order
+        if self._ranks is None:
+            self._ranks = np.empty(len(self.order), dtype=np.int64)
+            self._ranks[self.order] = np.arange(len(self.order))
+        return self._ranks
+
+    def _sorted_names(self):
+        if self._sorted is None:
+            self._sorted = [self.names[n] for n in self.order]
+        return self._sorted
+
+
+class CallGraphNames():
+    # Name indexes of the distinct function and file names of a callgraph
+    def __init__(self, header, indexes):
+        self.header = header
+        self.functions = indexes["functions"]
+        self.filenames = indexes["filenames"]
+
+    @classmethod
+    def from_names(cls, functions, filenames):
+        # Missing names ('' or nan) are left out
+        indexes = {}
+        for kind, names in [("functions", functions), ("filenames", filenames)]:
+            names = pd.Series(names, dtype=object).dropna().astype(str)
+            indexes[kind] = NameIndex.from_names(names[names != ""].unique())
+        return cls({"version": NAMES_VERSION}, indexes)
+
+    @classmethod
+    def from_calls(cls, filename, chunksize=1000000):
+        # Reads only the name columns of the callgraph
+        uniques = {kind: set() for kind in KINDS}
+        columns = KINDS["functions"] + KINDS["filenames"]
+        for df in callgraph_db.read_chunks(filename, columns, chunksize):
+            for kind, kind_columns in KINDS.items():
+                for column in kind_columns:
+                    uniques[kind].update(df[column].unique())
+        return cls.from_names(
+            sorted(uniques["functions"]), sorted(uniques["filenames"]))
+
+    @classmethod
+    def load(cls, filename):
+        try:
+            with np.load(filename, allow_pickle=False) as npz:
+                header = json.loads(npz[NAMES_HEADER].tobytes().decode('utf-8'))
+                arrays = {key: npz[key] for key in npz.files if key != NAMES_HEADER}
+        except (OSError, ValueError, KeyError) as e:
+            _LOGGER.error("Failed reading name index '%s': %s" % (filename, e))
+            exit(1)
+        if header.get("version") != NAMES_VERSION:
+            _LOGGER.error(
+                "Unsupported name index version in '%s': %s" % (
+                    filename, header.get("version")))
+            exit(1)
+        indexes = {}
+        for kind in KINDS:
+            kind_arrays = {name: arrays["%s_%s" % (kind, name)] for name in NAME_ARRAYS}
+            names = callgraph_db.arrays_to_strings(
+                kind_arrays["data"], kind_arrays["offsets"])
+            indexes[kind] = NameIndex(names, kind_arrays)
+        return cls(header, indexes)
+
+    def save(self, filename, calls):
+        # calls: the callgraph file the index was built from
+        self.header["calls"] = utils.file_signature(calls)
+        arrays = {}
+        for kind in KINDS:
+            for name, array in getattr(self, kind).to_arrays().items():
+                arrays["%s_%s" % (kind, name)] = array
+        arrays[NAMES_HEADER] = np.frombuffer(
+            json.dumps(self.header).encode('utf-8'), dtype=np.uint8)
+        tmpfile = "%s.tmp" % filename
+        with open(tmpfile, 'wb') as fp:
+            np.savez(fp, **arrays)
+        os.replace(tmpfile, filename)
+        _LOGGER.info("wrote: %s" % filename)
+
+    def is_built_from(self, calls):
+        return utils.signature_matches(calls, self.header.get("calls"))
+
+
+################################################################################
+
+
+def default_filename(calls):
+    return "%s%s" % (calls, NAMES_SUFFIX)
+
+
+def load_or_build(calls, functions=None, filenames=None):
+    # Name index of callgraph 'calls', loaded from the index file if it's
+    # up-to-date. Otherwise, it's built from the given names, or from the
+    # callgraph if not given, and saved for later use.
+    filename = default_filename(calls)
+    if os.path.exists(filename):
+        names = CallGraphNames.load(filename)
+        if names.is_built_from(calls):
+            _LOGGER.debug("Using name index: %s" % filename)
+            return names
+    _LOGGER.info("Building name index: %s" % filename)
+    if functions is None or filenames is None:
+        names = CallGraphNames.from_calls(calls)
+    else:
+        names = CallGraphNames.from_names(functions, filenames)
+    try:
+        names.save(filename, calls)
+    except OSError as e:
+        _LOGGER.warning("Failed writing name index '%s': %s" % (filename, e))
+    return names
+
+
+def suggest(index, name):
+    # Hint listing the names closest to 'name' in the NameIndex 'index'
+    closest = index.closest(name)
+    if not closest:
+        return ""
+    return "; did you mean: %s?" % ", ".join(closest)
+
+
+def _trigrams(names):
+    # Trigram keys of the padded lower case names, and the position of
+    # the name of each key in 'names'
+    padded = ["  %s " % name.lower() for name in names]
+    lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=len(padded))
+    points = np.frombuffer(
+        "".join(padded).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    counts = lengths - 2
+    starts = np.cumsum(lengths) - lengths
+    pos = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    keys = (points[pos] << 42) | (points[pos + 1] << 21) | points[pos + 2]
+    return keys, np.repeat(np.arange(len(names)), counts)
+
+
+def _literal_prefix(regex):
+    # Literal prefix that all the matches of a '^'-anchored regex start with
+    match = re.match(r'\^(\w*)(.?)', regex)
+    if not match or '|' in regex:
+        return ""
+    literal, following = match.groups()
+    if following and following in "*?{":
+        # The last character is optional
+        literal = literal[:-1]
+    return literal
+
+
+################################################################################
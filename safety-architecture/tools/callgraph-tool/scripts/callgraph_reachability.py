@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_db
+import callgraph_graph
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Version of the reachability index file format, bump on incompatible changes
+REACH_VERSION = 1
+
+# Reachability index files are uncompressed numpy .npz archives with this
+# member holding the json header
+REACH_HEADER = "reach_header"
+
+# Default reachability index file name is the callgraph file name with
+# this suffix
+REACH_SUFFIX = ".reach"
+
+# Entry points by default: the system call functions
+DEFAULT_ENTRY_REGEX = "^__x64_sys_"
+
+################################################################################
+
+
+class ReachabilityIndex():
+    # Functions reachable from each entry point through any number of calls,
+    # stored as packed bitsets in both directions: bit n of entry_bits[e]
+    # and bit e of node_bits[n] are set if entries[e] reaches node n.
+    # Entry points reach themselves.
+    def __init__(self, header, arrays):
+        self.header = header
+        self.entries = arrays["entries"]
+        self.entry_bits = arrays["entry_bits"]
+        self.node_bits = arrays["node_bits"]
+        self.filenames = np.asarray(callgraph_db.arrays_to_strings(
+            arrays["filenames_data"], arrays["filenames_offsets"]), dtype=object)
+        self.functions = np.asarray(callgraph_db.arrays_to_strings(
+            arrays["functions_data"], arrays["functions_offsets"]), dtype=object)
+        self.def_lines = np.asarray(callgraph_db.arrays_to_strings(
+            arrays["def_lines_data"], arrays["def_lines_offsets"]), dtype=object)
+        self.nodes = len(self.functions)
+        # Position of each node in entries, -1 if the node is not an entry
+        self.entry_position = np.full(self.nodes, -1, dtype=np.int64)
+        self.entry_position[self.entries] = np.arange(len(self.entries))
+        self._names = None
+        self._lookup = None
+
+    @classmethod
+    def from_df(cls, df, regex=DEFAULT_ENTRY_REGEX):
+        # df as read with keep_default_na=False
+        graph = callgraph_graph.CallGraph(df)
+        functions = pd.Series(graph.functions, dtype=object)
+        entries = np.flatnonzero(
+            functions.str.contains(regex, regex=True, na=False).values)
+        _LOGGER.info(
+            "Computing reachability from %s entry points over %s functions" % (
+                len(entries), graph.nodes))
+        reached = np.zeros(
+            (graph.nodes, max(1, (len(entries) + 63) // 64)), dtype=np.uint64)
+        index = np.arange(len(entries))
+        np.bitwise_or.at(
+            reached, (entries, index // 64),
+            np.left_shift(np.uint64(1), (index % 64).astype(np.uint64)))
+        for nodes, bits in graph.search_bits(entries):
+            reached[nodes] |= bits
+        # Bit k of the words is bit k % 8 of byte k // 8 in little-endian
+        reached = np.unpackbits(
+            reached.astype('<u8').view(np.uint8), axis=1,
+            count=len(entries), bitorder='little').astype(bool)
+        # Definition line of each node from its first row as a caller
+        nodes, rows = np.unique(graph.caller, return_index=True)
+        def_lines = np.full(graph.nodes, "", dtype=object)
+        def_lines[nodes] = df['caller_def_line'].values[rows]
+        arrays = {
+            "entries": entries,
+            "entry_bits": np.packbits(reached.T, axis=1),
+            "node_bits": np.packbits(reached, axis=1),
+        }
+        for name, strings in [("filenames", graph.filenames),
+                              ("functions", graph.functions),
+                              ("def_lines", def_lines)]:
+            data, offsets = callgraph_db.strings_to_arrays(
+                [str(s) for s in strings])
+            arrays["%s_data" % name] = data
+            arrays["%s_offsets" % name] = offsets
+        header = {"version": REACH_VERSION, "regex": regex}
+        return cls(header, arrays)
+
+    @classmethod
+    def load(cls, filename):
+        try:
+            with np.load(filename, allow_pickle=False) as npz:
+                header = json.loads(npz[REACH_HEADER].tobytes().decode('utf-8'))
+                arrays = {key: npz[key] for key in npz.files if key != REACH_HEADER}
+        except (OSError, ValueError, KeyError) as e:
+            _LOGGER.error("Failed reading reachability index '%s': %s" % (filename, e))
+            exit(1)
+        if header.get("version") != REACH_VERSION:
+            _LOGGER.error(
+                "Unsupported reachability index version in '%s': %s" % (
+                    filename, header.get("version")))
+            exit(1)
+        return cls(header, arrays)
+
+    def save(self, filename, calls):
+        # calls: the callgraph file the index was built from
+        self.header["calls"] = utils.file_signature(calls)
+        arrays = {
+            "entries": self.entries,
+            "entry_bits": self.entry_bits,
+            "node_bits": self.node_bits,
+        }
+        for name, strings in [("filenames", self.filenames),
+                              ("functions", self.functions),
+                              ("def_lines", self.def_lines)]:
+            data, offsets = callgraph_db.strings_to_arrays(strings)
+            arrays["%s_data" % name] = data
+            arrays["%s_offsets" % name] = offsets
+        arrays[REACH_HEADER] = np.frombuffer(
+            json.dumps(self.header).encode('utf-8'), dtype=np.uint8)
+        tmpfile = "%s.tmp" % filename
+        with open(tmpfile, 'wb') as fp:
+            np.savez(fp, **arrays)
+        os.replace(tmpfile, filename)
+        _LOGGER.info("wrote: %s" % filename)
+
+    def is_built_from(self, calls):
+        return utils.signature_matches(calls, self.header.get("calls"))
+
+    def node(self, name):
+        # Node of 'name', given as 'function' or 'filename:function'.
+        # Raises ValueError if there is no single such function.
+        if self._names is None:
+            self._names = callgraph_graph.NodeNames(self.filenames, self.functions)
+        return self._names.node(name)
+
+    def node_ids(self, nodes):
+        # Node ids of the given (filename, function) pairs, -1 if not found
+        if self._lookup is None:
+            self._lookup = pd.MultiIndex.from_arrays([self.filenames, self.functions])
+        nodes = list(nodes)
+        if len(nodes) == 0:
+            return np.empty(0, dtype=np.int64)
+        return self._lookup.get_indexer(nodes)
+
+    def entries_reaching(self, node):
+        # Entry point nodes that reach 'node'
+        bits = np.unpackbits(self.node_bits[node], count=len(self.entries))
+        return self.entries[bits.astype(bool)]
+
+    def common_entries(self, node1, node2):
+        # Entry point nodes that reach both 'node1' and 'node2'
+        bits = np.unpackbits(
+            self.node_bits[node1] & self.node_bits[node2], count=len(self.entries))
+        return self.entries[bits.astype(bool)]
+
+    def reached_from(self, entry):
+        # Nodes reachable from the entry point node 'entry'
+        position = self.entry_position[entry]
+        if position < 0:
+            raise ValueError(
+                "Function '%s' is not an entry point of the reachability index "
+                "(regex '%s')" % (self.functions[entry], self.header["regex"]))
+        bits = np.unpackbits(self.entry_bits[position], count=self.nodes)
+        return np.flatnonzero(bits)
+
+    def reaches(self, entry, node):
+        # True if the entry point node 'entry' reaches 'node', None if
+        # 'entry' is not an entry point
+        position = self.entry_position[entry]
+        if position < 0:
+            return None
+        byte = self.node_bits[node, position // 8]
+        return bool((byte >> (7 - position % 8)) & 1)
+
+    def to_df(self, nodes):
+        return pd.DataFrame({
+            "filename": self.filenames[nodes],
+            "function": self.functions[nodes],
+            "def_line": self.def_lines[nodes],
+        })
+
+
+################################################################################
+
+
+def default_filename(calls):
+    return "%s%s" % (calls, REACH_SUFFIX)
+
+
+def load_for(filename, calls):
+    # Reachability index 'filename' that must have been built from 'calls'
+    utils.exit_unless_accessible(filename)
+    index = ReachabilityIndex.load(filename)
+    if not index.is_built_from(calls):
+        _LOGGER.error(
+            "Reachability index '%s' was not built from '%s', rebuild it "
+            "with build_reachability.py" % (filename, calls))
+        exit(1)
+    return index
+
+
+def read_calls(filename):
+    if callgraph_db.is_callgraph_db(filename):
+        return callgraph_db.read_callgraph_db(filename, na_strings='', str_ints=True)
+    dtype = {"caller_def_line": str}
+    return pd.read_csv(filename, keep_default_na=False, dtype=dtype)
+
+
+################################################################################
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import logging
+import os
+import pandas as pd
+
+import utils
+import callgraph_db
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+
+def convert(csvfile, outfile, drop_duplicates=True):
+    # Read all columns as categories: repeating strings are stored only
+    # once while parsing, which keeps the memory usage down on big inputs
+    df = pd.read_csv(
+        csvfile, dtype='category', na_values=[''], keep_default_na=False)
+    _LOGGER.info("read %s rows from: %s" % (df.shape[0], csvfile))
+    callgraph_db.write_callgraph_db(df, outfile, drop_duplicates=drop_duplicates)
+
+
+def getargs():
+    desc = "Convert the callgraph csv database to the binary callgraph "\
+        "database format. All the callgraph scripts accept the converted "\
+        "database file in place of the csv file, and load it considerably "\
+        "faster than the csv file."
+
+    epil = "Example: ./%s --calls callgraph.csv --out callgraph.cgdb" % \
+        os.path.basename(__file__)
+    parser = argparse.ArgumentParser(description=desc, epilog=epil)
+
+    required_named = parser.add_argument_group('required named arguments')
+    help = "function call database csv file"
+    required_named.add_argument('--calls', help=help, required=True)
+
+    help = "Set the output file name. If not specified, the output is "\
+        "written next to the input file, replacing the input file "\
+        "extension with '.cgdb'"
+    parser.add_argument('--out', help=help, default="")
+    help = "Keep duplicate rows. By default, duplicate rows are removed."
+    parser.add_argument('--keep_duplicates', help=help, action='store_true')
+    help = "Set the verbosity level (e.g. -vv for debug level)"
+    parser.add_argument(
+        '-v', '--verbose', help=help, action='count', default=1)
+    return parser.parse_args()
+
+
+################################################################################
+
+
+if __name__ == "__main__":
+    args = getargs()
+
+    utils.exit_unless_accessible(args.calls)
+    utils.setup_logging(verbosity=args.verbose)
+
+    out = args.out
+    if not out:
+        out = "%s.cgdb" % os.path.splitext(args.calls)[0]
+    convert(args.calls, out, drop_duplicates=not args.keep_duplicates)
+
+################################################################################
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import csv
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_db
+import callgraph_graph
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+# Columns identifying a call edge, optionally with the call type
+EDGE_COLS = ["caller_filename", "caller_function", "callee_filename", "callee_function"]
+CALLTYPE_COL = "callee_calltype"
+
+# Names of the edge sets
+SETS = ["added", "removed", "common"]
+
+################################################################################
+
+
+class CallGraphDiff():
+    # Call edges added, removed and common between two callgraphs. The edges
+    # are compared by the fingerprints of the edge columns: the callgraphs
+    # are read twice, first for the fingerprints, then for writing the
+    # edges, so only the fingerprints of one callgraph are held in memory
+    # at a time.
+    def __init__(self, old, new, columns, chunksize):
+        self.old = old
+        self.new = new
+        self.columns = columns
+        self.chunksize = chunksize
+        old_edges = self._edges(old)
+        new_edges = self._edges(new)
+        self.sets = {
+            "added": np.setdiff1d(new_edges, old_edges, assume_unique=True),
+            "removed": np.setdiff1d(old_edges, new_edges, assume_unique=True),
+            "common": np.intersect1d(old_edges, new_edges, assume_unique=True),
+        }
+        for name in SETS:
+            _LOGGER.info("%s edges: %s" % (name, len(self.sets[name])))
+
+    def _edges(self, filename):
+        _LOGGER.info("Reading: %s" % filename)
+        return np.unique(np.concatenate([
+            np.unique(callgraph_graph.fingerprints(df, self.columns))
+            for df in callgraph_db.read_chunks(filename, self.columns, self.chunksize)]))
+
+    def write(self, prefix):
+        # Write the edge sets to '<prefix>_<set>.csv', each edge once.
+        # Returns the edge counts per set and caller filename.
+        counts = {}
+        files = {name: "%s_%s.csv" % (prefix, name) for name in SETS}
+        for name in SETS:
+            pd.DataFrame(columns=self.columns).to_csv(
+                files[name], quoting=csv.QUOTE_ALL, index=False, encoding='utf-8')
+        for filename, names in [(self.old, ["removed"]), (self.new, ["added", "common"])]:
+            written = {name: np.zeros(len(self.sets[name]), dtype=bool) for name in names}
+            for df in callgraph_db.read_chunks(filename, self.columns, self.chunksize):
+                fps = callgraph_graph.fingerprints(df, self.columns)
+                # First row of each edge in the chunk
+                fps, rows = np.unique(fps, return_index=True)
+                for name in names:
+                    edges = self.sets[name]
+                    member = callgraph_graph.is_member(fps, edges)
+                    pos = np.searchsorted(edges, fps[member])
+                    new = ~written[name][pos]
+                    written[name][pos[new]] = True
+                    df_out = df.iloc[np.sort(rows[member][new])]
+                    df_out.to_csv(
+                        files[name], mode='a', header=False, quoting=csv.QUOTE_ALL,
+                        index=False, encoding='utf-8')
+                    counts.setdefault(name, []).append(
+                        df_out['caller_filename'].astype(str).value_counts())
+        for name in SETS:
+            _LOGGER.info("wrote: %s" % files[name])
+        return pd.DataFrame({
+            name: pd.concat(counts[name]).groupby(level=0).sum()
+            if counts[name] else pd.Series(dtype=np.int64)
+            for name in SETS}).fillna(0).astype(np.int64)
+
+
+################################################################################
+
+
+def write_counts(counts, column, filename):
+    # Per-file or per-directory edge counts, the most changed first
+    counts = counts.rename_axis(column).reset_index()
+    counts["changed"] = counts["added"] + counts["removed"]
+    counts.sort_values(
+        by=["changed", column], ascending=[False, True], inplace=True)
+    counts.to_csv(
+        filename, columns=[column] + SETS, quoting=csv.QUOTE_ALL,
+        index=False, encoding='utf-8')
+    _LOGGER.info("wrote: %s" % filename)
+
+
+def check_positive(val):
+    intval = int(val)
+    if intval <= 0:
+        raise argparse.ArgumentTypeError(
+            "%s is not positive integer" % val)
+    return intval
+
+
+def getargs():
+    desc = "Compare the call edges of two callgraphs, for instance the "\
+        "callgraphs of two kernel versions or configurations. Writes the "\
+        "edges added in the new callgraph, removed from the old callgraph, "\
+        "and common to both, each in its own csv file. An edge is a unique "\
+        "caller filename and function, and callee filename and function "\
+        "(and call type with --calltype)."
+
+    epil = "Example: ./%s --old v5.9.csv --new v5.10.csv --out v5.10 "\
+        "--counts file dir" % os.path.basename(__file__)
+    parser = argparse.ArgumentParser(description=desc, epilog=epil)
+
+    required_named = parser.add_argument_group('required named arguments')
+    help = "old function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
+    required_named.add_argument('--old', help=help, required=True)
+    help = "new function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
+    required_named.add_argument('--new', help=help, required=True)
+
+    help = "Set the output file name prefix, defaults to 'callgraph_diff'. "\
+        "The edges are written to PREFIX_added.csv, PREFIX_removed.csv "\
+        "and PREFIX_common.csv."
+    parser.add_argument('--out', help=help, default="callgraph_diff", metavar="PREFIX")
+    help = "Consider the call type (direct or indirect) part of the edge: "\
+        "an edge whose call type changed is both added and removed."
+    parser.add_argument('--calltype', help=help, action='store_true')
+    help = "Also write the number of added, removed and common edges per "\
+        "caller filename (file) to PREFIX_files.csv, and per caller "\
+        "directory (dir) to PREFIX_dirs.csv."
+    parser.add_argument('--counts', help=help, nargs='+', choices=['file', 'dir'], default=[])
+    help = "Number of rows read at a time from csv files"
+    parser.add_argument(
+        '--chunksize', help=help, type=check_positive, default=1000000)
+    help = "Set the verbosity level (e.g. -vv for debug level)"
+    parser.add_argument(
+        '-v', '--verbose', help=help, action='count', default=1)
+    return parser.parse_args()
+
+
+################################################################################
+
+
+if __name__ == "__main__":
+    args = getargs()
+
+    utils.exit_unless_accessible(args.old)
+    utils.exit_unless_accessible(args.new)
+    utils.setup_logging(verbosity=args.verbose)
+
+    columns = EDGE_COLS + ([CALLTYPE_COL] if args.calltype else [])
+    diff = CallGraphDiff(args.old, args.new, columns, args.chunksize)
+    counts = diff.write(args.out)
+    if 'file' in args.counts:
+        write_counts(counts, "filename", "%s_files.csv" % args.out)
+    if 'dir' in args.counts:
+        dirs = counts.groupby(
+            [os.path.dirname(os.path.normpath(x)) if x else x
+             for x in counts.index]).sum()
+        write_counts(dirs, "directory", "%s_dirs.csv" % args.out)
+
+################################################################################
@@ -8,9 +8,12 @@ import argparse
 import csv
 import logging
 import os
+import sys
+import numpy as np
 import pandas as pd
 
 import utils
+import callgraph_db
 
 _LOGGER = logging.getLogger(utils.LOGGER_NAME)
 
@@ -18,21 +21,101 @@ _LOGGER = logging.getLogger(utils.LOGGER_NAME)
 
 
 def df_from_csv_file(name):
+    # '-' reads csv from stdin
+    if name == '-':
+        name = sys.stdin
+    elif callgraph_db.is_callgraph_db(name):
+        return callgraph_db.read_callgraph_db(name)
     df = pd.read_csv(name, na_values=[''], keep_default_na=False)
     df.reset_index(drop=True, inplace=True)
     return df
 
 
 def df_to_csv_file(df, name):
+    # '-' writes to stdout
     df.to_csv(
-        path_or_buf=name,
+        path_or_buf=sys.stdout if name == '-' else name,
         quoting=csv.QUOTE_ALL,
         sep=",", index=False, encoding='utf-8')
     _LOGGER.info("wrote: %s" % name)
 
 
-def df_regex_filter(df, column, regex):
-    return df[~df[column].str.contains(regex, regex=True, na=False)]
+def regex_match_mask(series, regexes, verdicts=None):
+    # Mask of the values in series that match any of the regexes. The
+    # regexes are evaluated once per unique value, not once per row.
+    # 'verdicts' caches the result per value between calls.
+    if verdicts is None:
+        verdicts = {}
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.values, series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    new = [value for value in uniques if value not in verdicts]
+    if new:
+        new_values = pd.Series(new)
+        matched = np.zeros(len(new), dtype=bool)
+        for regex in regexes:
+            matched |= new_values.str.contains(regex, regex=True, na=False).values
+        verdicts.update(zip(new, matched))
+    matched = np.array([verdicts[value] for value in uniques], dtype=bool)
+    # Missing values have code -1, which picks the appended False
+    return np.append(matched, False)[codes]
+
+
+class RegexFilter():
+    # Drops the rows where any of the (column, regex) filters matches. The
+    # filters are combined into one mask, so the rows are copied once. The
+    # verdicts per unique value are kept between the calls to filter().
+    def __init__(self, filters):
+        self.regexes = {}
+        for col, regex in filters:
+            self.regexes.setdefault(col, []).append(regex)
+        self.verdicts = {col: {} for col in self.regexes}
+
+    def filter(self, df):
+        drop = np.zeros(df.shape[0], dtype=bool)
+        for col, regexes in self.regexes.items():
+            drop |= regex_match_mask(df[col], regexes, self.verdicts[col])
+        return df[~drop]
+
+
+def df_regex_filter(df, filters):
+    return RegexFilter(filters).filter(df)
+
+
+def filter_chunks(calls, out, filters, chunksize):
+    # Filter the calls in chunks of 'chunksize' rows. Each chunk is written
+    # before reading the next one, so only one chunk is kept in memory.
+    # The csv values are kept as strings, so the chunks are written out as
+    # read regardless of the types in other chunks.
+    if calls != '-' and callgraph_db.is_callgraph_db(calls):
+        # Callgraph databases are read at once, they are compact in memory
+        chunks = [df_from_csv_file(calls)]
+    else:
+        chunks = pd.read_csv(
+            sys.stdin if calls == '-' else calls, na_values=[''],
+            keep_default_na=False, dtype=str, chunksize=chunksize)
+    regex_filter = RegexFilter(filters)
+    fp = sys.stdout if out == '-' else open(out, 'w', encoding='utf-8')
+    header = True
+    try:
+        for df in chunks:
+            df = regex_filter.filter(df)
+            df.to_csv(
+                path_or_buf=fp, quoting=csv.QUOTE_ALL, header=header,
+                sep=",", index=False)
+            header = False
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+    _LOGGER.info("wrote: %s" % out)
+
+
+def check_positive(val):
+    intval = int(val)
+    if intval <= 0:
+        raise argparse.ArgumentTypeError("%s is not positive integer" % val)
+    return intval
 
 
 def getargs():
@@ -54,19 +137,28 @@ def getargs():
     help = "Set the verbosity level (e.g. -vv for debug level)"
     parser.add_argument(
         '-v', '--verbose', help=help, action='count', default=1)
-    help = "Function call database csv file"
+    help = "Function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py. Use '-' to read csv from stdin"
     parser.add_argument('--calls', help=help, required=True)
     help = "The output CSV file. If not specified the resulting file will be stored"\
            "to the same directory where input file resides and will use the name of the"\
-           "original file with 'filtered_' prefix"
+           "original file with 'filtered_' prefix. Use '-' to write to stdout, "\
+           "which is the default if the input is read from stdin"
     parser.add_argument('--out', help=help, default="")
+    help = "Read and filter the input in chunks of CHUNKSIZE rows, writing each "\
+        "chunk out before reading the next one. Use it when the input does not fit "\
+        "in memory. The values are written as read from the input, whereas "\
+        "without --chunksize, integer columns with missing values are written "\
+        "as floats"
+    parser.add_argument('--chunksize', help=help, type=check_positive)
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = getargs()
 
-    utils.exit_unless_accessible(args.calls)
+    if args.calls != '-':
+        utils.exit_unless_accessible(args.calls)
     utils.setup_logging(verbosity=args.verbose)
 
     cols, col_cnt = args.cols, len(args.cols)
@@ -83,16 +175,18 @@ if __name__ == '__main__':
         col_cnt = filters_cnt
 
     if filters_cnt == col_cnt:
-        d = zip(cols, filters)
-        df = df_from_csv_file(args.calls)
-        for col, regex in d:
-            df = df_regex_filter(df, col, regex)
-
         if args.out:
             out = args.out
+        elif args.calls == '-':
+            out = '-'
         else:
             filename = os.path.basename(args.calls)
             path = os.path.dirname(args.calls)
             out = os.path.join(path, "filtered_" + filename)
 
-        df_to_csv_file(df, out)
+        if args.chunksize:
+            filter_chunks(args.calls, out, zip(cols, filters), args.chunksize)
+        else:
+            df = df_from_csv_file(args.calls)
+            df = df_regex_filter(df, zip(cols, filters))
+            df_to_csv_file(df, out)
@@ -9,11 +9,20 @@ import argparse
 import csv
 import logging
 import networkx as nx
+import numpy as np
 import os
 import pandas as pd
 import re
 import sys
 import utils
+import callgraph_aggregate
+import callgraph_db
+import callgraph_dot
+import callgraph_graph
+import callgraph_hubs
+import callgraph_index
+import callgraph_names
+import callgraph_reachability
 
 from collections import namedtuple
 from grapher import Grapher
@@ -32,12 +41,14 @@ SearchSettings = namedtuple(
         "to_col_func",
         "to_col_fn",
         "orientation",
-        "cutoff"
+        "cutoff",
+        "hubs"
     ]
 )
 
 
-def search_settings(direction, cutoff):
+def search_settings(direction, cutoff, hubs=None):
+    # hubs: mask of the graph nodes whose calls are not followed
     left_search, right_search = None, None
     if direction == "both" or direction == "left":
         left_search = SearchSettings(
@@ -46,7 +57,8 @@ def search_settings(direction, cutoff):
             to_col_func="caller_function",
             to_col_fn="caller_filename",
             orientation='reverse',
-            cutoff=cutoff
+            cutoff=cutoff,
+            hubs=hubs
         )
     if direction == "both" or direction == "right":
         right_search = SearchSettings(
@@ -55,7 +67,8 @@ def search_settings(direction, cutoff):
             to_col_func="callee_function",
             to_col_fn="callee_filename",
             orientation='original',
-            cutoff=cutoff
+            cutoff=cutoff,
+            hubs=hubs
         )
     return left_search, right_search
 
@@ -63,42 +76,9 @@ def search_settings(direction, cutoff):
 ################################################################################
 
 
-class Node():
-    def __init__(self, function=None, filename=None, row_id=None):
-        if not isinstance(filename, str):
-            print("Something odd happened")
-        self.function = function
-        self.filename = filename
-        self.row_id = row_id
-
-    def __eq__(self, other):
-        if isinstance(other, Node):
-            return (
-                self.function == other.function and
-                self.filename == other.filename)
-        return False
-
-    def __str__(self):
-        return ":".join([self.filename, self.function])
-
-    def __hash__(self):
-        return hash(self.__str__())
-
-
-class Edge():
-    def __init__(
-        self,
-        in_node,
-        out_node
-    ):
-        self.in_node = in_node
-        self.out_node = out_node
-
-
-################################################################################
-
-
 def df_from_csv_file(name):
+    if callgraph_db.is_callgraph_db(name):
+        return callgraph_db.read_callgraph_db(name, na_strings='')
     df = pd.read_csv(name, keep_default_na=False)
     df.reset_index(drop=True, inplace=True)
     return df
@@ -112,6 +92,22 @@ def df_to_csv_file(df, name):
     _LOGGER.info("wrote: %s" % name)
 
 
+def write_calls(df, out, aggregate=None, cytoscape_js=callgraph_dot.DEFAULT_CYTOSCAPE_JS):
+    # Write the calls as csv or graph, optionally aggregated by file or
+    # directory. The html output uses Cytoscape.js from 'cytoscape_js'.
+    if aggregate and out.endswith(".csv"):
+        df_to_csv_file(callgraph_aggregate.aggregate_edges(df, aggregate), out)
+    elif out.endswith(".csv"):
+        df_to_csv_file(df, out)
+    elif aggregate:
+        if not df.empty:
+            callgraph_aggregate.to_dot(df, aggregate).render(out, cytoscape_js=cytoscape_js)
+    else:
+        grapher = Grapher(out, cytoscape_js=cytoscape_js)
+        grapher.graph(df)
+        grapher.render(out)
+
+
 def def_regex_filter(df, column, regex):
     return df[df[column].str.contains(regex, regex=True, na=False)]
 
@@ -120,54 +116,227 @@ def get_edge_bfs_dir(g, from_node, direction):
     return nx.edge_bfs(g, source=from_node, orientation=direction.orientation)
 
 
-def find_all_chains(df, from_node, to_nodes, direction):
-    _LOGGER.info("Converting the database into a graph...")
-    G = graph_from_df(df)
-    _LOGGER.info("Generating paths from source function...")
-    g_edges = get_edge_bfs_dir(G, from_node, direction)
+def search_graph(graph, from_node, direction):
+    # Graph to search: without the calls made by the hubs, except from_node
+    hubs = direction.hubs
+    if hubs is None:
+        return graph.digraph
+    if direction.orientation == 'reverse':
+        def keep(u, v):
+            return v == from_node or not hubs[v]
+    else:
+        def keep(u, v):
+            return u == from_node or not hubs[u]
+    return nx.subgraph_view(graph.digraph, filter_edge=keep)
+
+
+def reachable_graph(graph, from_node, direction):
+    # Subgraph reachable from from_node, with the edges in search direction
+    g_edges = get_edge_bfs_dir(search_graph(graph, from_node, direction), from_node, direction)
     g_dir = nx.DiGraph()
     for u, v, orientation in g_edges:
         if orientation == 'reverse':
             v, u = u, v
         g_dir.add_edge(u, v)
+    return g_dir
+
+
+def find_all_chains(graph, from_node, to_nodes, direction):
+    # from_node and to_nodes are node ids in the graph
+    if len(to_nodes) == 0:
+        return chains_to_df(graph, to_nodes, to_nodes, direction)
+    _LOGGER.info("Generating paths from source function...")
+    g_dir = reachable_graph(graph, from_node, direction)
 
     _LOGGER.info("Filtering the paths...")
     if direction.cutoff:
         _LOGGER.warning("Using cutoff %s, "
                         "results might be incomplete" % direction.cutoff)
 
-    rows = []
+    links = []
     for to_node in to_nodes:
         # check every dest node for possible paths from source
         if g_dir.has_node(to_node):
             # special check for recursive call
             if from_node == to_node:
-                rows.append([
-                    from_node.filename, from_node.function,
-                    to_node.filename, to_node.function,
-                ])
+                links.append((from_node, to_node))
                 continue
 
             paths = nx.all_simple_paths(g_dir, from_node, to_node, cutoff=direction.cutoff)
             for path in paths:
-                chain = list(path)
-                if len(chain) > 2:
-                    chain = zip(chain[:-1], chain[1:])
-                else:
-                    chain = [chain]
-                for link in chain:
-                    out_node, in_node = link[0], link[1]
-                    rows.append([
-                        out_node.filename, out_node.function,
-                        in_node.filename, in_node.function,
-                    ])
-
-    cols = [
+                links.extend(zip(path[:-1], path[1:]))
+
+    out_nodes = np.array([link[0] for link in links], dtype=np.int64)
+    in_nodes = np.array([link[1] for link in links], dtype=np.int64)
+    return chains_to_df(graph, out_nodes, in_nodes, direction)
+
+
+def find_shortest_chains(graph, from_node, to_nodes, direction, k):
+    # Generate the k shortest simple chains from from_node to any of the
+    # to_nodes, shortest first. The chains to all the to_nodes are searched
+    # at once by connecting the to_nodes to a virtual sink node.
+    if len(to_nodes) == 0:
+        return
+    g_dir = reachable_graph(graph, from_node, direction)
+    found = 0
+    to_nodes = set(to_nodes.tolist())
+    if from_node in to_nodes and g_dir.has_edge(from_node, from_node):
+        # special check for recursive call
+        found += 1
+        yield [from_node, from_node]
+    sink = graph.nodes
+    for to_node in to_nodes:
+        if to_node != from_node and g_dir.has_node(to_node):
+            g_dir.add_edge(to_node, sink)
+    if found >= k or not g_dir.has_node(sink):
+        return
+    for path in nx.shortest_simple_paths(g_dir, from_node, sink):
+        chain = path[:-1]
+        if direction.cutoff and len(chain) - 1 > direction.cutoff:
+            break
+        found += 1
+        yield chain
+        if found >= k:
+            break
+
+
+def write_shortest_chains(
+        graph, df, from_fun, to_fun, directions, k, out, reach=None, aggregate=None,
+        cytoscape_js=callgraph_dot.DEFAULT_CYTOSCAPE_JS):
+    # Write the rows of each chain as soon as the chain is found
+    if out.endswith(".csv") and not aggregate:
+        writer = utils.CsvWriter(out)
+        writer.write_arr(["chain", "link", "direction"] + list(df.columns))
+    else:
+        writer = None
+        rows = []
+    chain_id = 0
+    for direction in directions:
+        name = "left" if direction.orientation == 'reverse' else "right"
+        from_node, to_nodes = find_nodes_directed(
+            graph, df, from_fun, to_fun, direction, reach)
+        _LOGGER.info("Searching %s shortest chains (%s)..." % (k, name))
+        for chain in find_shortest_chains(graph, from_node, to_nodes, direction, k):
+            chain_id += 1
+            _LOGGER.debug("Found chain %s with length %s" % (chain_id, len(chain) - 1))
+            for link, (u, v) in enumerate(zip(chain[:-1], chain[1:]), start=1):
+                if direction.orientation == 'reverse':
+                    u, v = v, u
+                for row in graph.edge_rows(u, v):
+                    if writer is None:
+                        rows.append(row)
+                        continue
+                    writer.write_arr([chain_id, link, name] + df.iloc[row].tolist())
+            if writer is not None:
+                writer.flush()
+    if writer is not None:
+        writer.close()
+    else:
+        write_calls(df.iloc[rows].drop_duplicates(), out, aggregate, cytoscape_js)
+
+
+def chains_to_df(graph, out_nodes, in_nodes, direction):
+    # Filenames and functions are materialized only for the output rows
+    return pd.DataFrame({
+        direction.from_col_fn: graph.filenames[out_nodes],
+        direction.from_col_func: graph.functions[out_nodes],
+        direction.to_col_fn: graph.filenames[in_nodes],
+        direction.to_col_func: graph.functions[in_nodes],
+    }, columns=[
         direction.from_col_fn, direction.from_col_func,
-        direction.to_col_fn, direction.to_col_func
-    ]
-    chains_df = pd.DataFrame(data=rows, columns=cols)
-    return chains_df
+        direction.to_col_fn, direction.to_col_func])
+
+
+def bfs_distances(indptr, adjacent, sources, cutoff):
+    # Distance from the nearest source node to each node, or -1 if the
+    # node is not reachable within cutoff steps. Expands one whole
+    # level of the search at a time.
+    dist = np.full(len(indptr) - 1, -1, dtype=np.int64)
+    frontier = np.unique(sources)
+    dist[frontier] = 0
+    depth = 0
+    while len(frontier) > 0 and depth < cutoff:
+        depth += 1
+        nodes = callgraph_index.csr_gather(indptr, adjacent, frontier)
+        frontier = np.unique(nodes[dist[nodes] < 0])
+        dist[frontier] = depth
+    return dist
+
+
+def find_chain_slice(graph, from_node, to_nodes, direction):
+    # Find the calls that are on some call chain from from_node to any of
+    # the to_nodes, with the chain length at most direction.cutoff.
+    # The call is on such chain if:
+    #   distance(from_node, caller) + 1 + distance(callee, to_nodes) <= cutoff
+    _LOGGER.info("Computing the call chain slice...")
+    nodes = graph.nodes
+    src, dst = graph.edges(direction.orientation)
+    if direction.hubs is not None:
+        keep = ~direction.hubs[src] | (src == from_node)
+        src, dst = src[keep], dst[keep]
+    source = np.array([from_node], dtype=np.int64)
+    targets = np.asarray(to_nodes, dtype=np.int64)
+
+    cutoff = direction.cutoff
+    fwd_indptr, fwd_order = callgraph_index.csr(src, nodes)
+    rev_indptr, rev_order = callgraph_index.csr(dst, nodes)
+    dist_from = bfs_distances(fwd_indptr, dst[fwd_order], source, cutoff)
+    dist_to = bfs_distances(rev_indptr, src[rev_order], targets, cutoff)
+    keep = (dist_from[src] >= 0) & (dist_to[dst] >= 0) & \
+        (dist_from[src] + 1 + dist_to[dst] <= cutoff)
+    # Recursive calls are not on any simple chain, except the recursive
+    # call of from_node when it's also one of the to_nodes
+    keep &= (src != dst) | ((src == source[0]) & np.isin(src, targets))
+    src, dst = src[keep], dst[keep]
+
+    chains_df = chains_to_df(graph, src, dst, direction)
+
+    # Count the chains ending at each node with dynamic programming over
+    # the slice: count[n] is the number of chains of the current length
+    # from from_node to n. Chains are counted as walks: if the slice has
+    # cycles, chains that visit a function more than once are counted too.
+    chains = np.zeros(nodes)
+    shortest = np.full(nodes, -1, dtype=np.int64)
+    recursive = src == dst
+    if recursive.any():
+        # Recursive call of from_node is a chain of its own
+        chains[source] = 1
+        shortest[source] = 1
+        src, dst = src[~recursive], dst[~recursive]
+    count = np.zeros(nodes)
+    count[source] = 1
+    for length in range(1, cutoff + 1):
+        count = np.bincount(dst, weights=count[src], minlength=nodes)
+        if not count.any():
+            break
+        chains += count
+        shortest[(shortest < 0) & (count > 0)] = length
+
+    targets = targets[chains[targets] > 0]
+    targets_df = pd.DataFrame({
+        "direction": "left" if direction.orientation == 'reverse' else "right",
+        "filename": graph.filenames[targets],
+        "function": graph.functions[targets],
+        "shortest_chain": shortest[targets],
+        "chains": [int(x) for x in chains[targets]],
+    })
+    targets_df.sort_values(
+        by=["shortest_chain", "filename", "function"], inplace=True)
+    return chains_df, targets_df
+
+
+def name_index(names):
+    # Name index of the distinct names in the column, for the suggestions
+    return callgraph_names.NameIndex.from_names(names[names != ""].unique())
+
+
+def suggest_from(df, from_fun, function_col, filename_col):
+    # Hint listing the closest function names on the searched side of the
+    # calls, or the files of the function if only the filename is wrong
+    df_function = df[df[function_col] == from_fun[1]]
+    if from_fun[0] and not df_function.empty:
+        return callgraph_names.suggest(name_index(df_function[filename_col]), from_fun[0])
+    return callgraph_names.suggest(name_index(df[function_col]), from_fun[1])
 
 
 def get_df_from(df, from_fun, function_col, filename_col):
@@ -181,7 +350,8 @@ def get_df_from(df, from_fun, function_col, filename_col):
     if df_from.shape[0] <= 0:
         _LOGGER.warn(
             "Function '%s' does not exist in call graph database for selected search"
-            " direction" % ":".join(from_fun)
+            " direction%s" % (
+                ":".join(from_fun), suggest_from(df, from_fun, function_col, filename_col))
         )
         sys.exit(1)
     # If multiple from functions with the same name, notify the user to specify a filename too
@@ -204,43 +374,61 @@ def get_df_to(df, to_fun, function_col, filename_col):
     if df_to.shape[0] <= 0:
         _LOGGER.warn(
             "Function regex '%s' does not match any entries in call graph database"
-            " for selected search direction" % to_fun
+            " for selected search direction%s" % (
+                to_fun, callgraph_names.suggest(name_index(df[function_col]), to_fun))
         )
         sys.exit(1)
 
     return df_to
 
 
-def graph_from_df(df):
-    g = nx.DiGraph()
-    for row in df.itertuples():
-        n1 = Node(
-                function=row.caller_function,
-                filename=row.caller_filename)
-        n2 = Node(
-                function=row.callee_function,
-                filename=row.callee_filename)
-        g.add_edge(n1, n2)
-
-    return g
-
-
-def find_chains_directed_df(df, from_fun, to_fun, dir):
+def prune_unreachable(graph, reach, from_node, to_nodes, dir):
+    # Drop the to_nodes that the reachability index tells can't be reached
+    # from from_node at any distance: the index knows the nodes reachable
+    # from the entry points, so the nodes are pruned when the caller end
+    # of the chain is an entry point
+    from_id = reach.node_ids(
+        [(graph.filenames[from_node], graph.functions[from_node])])[0]
+    to_ids = reach.node_ids(zip(graph.filenames[to_nodes], graph.functions[to_nodes]))
+    if from_id < 0 or (to_ids < 0).any():
+        _LOGGER.warning("Reachability index does not match the callgraph, not used")
+        return to_nodes
+    if dir.orientation == 'original':
+        if reach.entry_position[from_id] < 0:
+            return to_nodes
+        keep = np.unpackbits(
+            reach.entry_bits[reach.entry_position[from_id]], count=reach.nodes)[to_ids]
+    else:
+        position = reach.entry_position[to_ids]
+        bits = np.unpackbits(reach.node_bits[from_id], count=len(reach.entries))
+        # Functions that are not entry points are kept
+        keep = position < 0
+        entries = ~keep
+        keep[entries] = bits[position[entries]] == 1
+    keep = keep.astype(bool)
+    _LOGGER.info(
+        "Reachability index pruned %s of %s target functions" % (
+            len(to_nodes) - keep.sum(), len(to_nodes)))
+    return to_nodes[keep]
+
+
+def find_nodes_directed(graph, df, from_fun, to_fun, dir, reach=None):
     df_from = get_df_from(df, from_fun, dir.from_col_func, dir.from_col_fn)
     df_to = get_df_to(df, to_fun, dir.to_col_func, dir.to_col_fn)
-    from_node = Node(
-        function=df_from[dir.from_col_func].iloc[0],
-        filename=df_from[dir.from_col_fn].iloc[0]
-    )
-    to_nodes = []
-    for _, row in df_to.iterrows():
-        to_nodes.append(
-            Node(
-                function=row[dir.to_col_func], filename=row[dir.to_col_fn]
-            )
-        )
-    chains_df = find_all_chains(df, from_node, to_nodes, dir)
-    return chains_df
+    from_node = graph.node_id(
+        df_from[dir.from_col_fn].iloc[0], df_from[dir.from_col_func].iloc[0])
+    to_nodes = graph.node_ids(zip(df_to[dir.to_col_fn], df_to[dir.to_col_func]))
+    if reach is not None:
+        to_nodes = prune_unreachable(graph, reach, from_node, to_nodes, dir)
+    return from_node, to_nodes
+
+
+def find_chains_directed_df(graph, df, from_fun, to_fun, dir, mode="paths", reach=None):
+    from_node, to_nodes = find_nodes_directed(graph, df, from_fun, to_fun, dir, reach)
+    if mode == "slice":
+        return find_chain_slice(graph, from_node, to_nodes, dir)
+    chains_df = find_all_chains(graph, from_node, to_nodes, dir)
+    return chains_df, None
 
 
 ################################################################################
@@ -258,24 +446,85 @@ def getargs():
     parser = argparse.ArgumentParser(description=desc, epilog=epil)
 
     required_named = parser.add_argument_group('required named arguments')
-    help = "function call database csv file"
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
     required_named.add_argument("--calls", help=help, required=True)
     help = "function name from where the search begins (literal match)"
     required_named.add_argument("--from_function", help=help, required=True)
     help = "function name where call chain ends (regex match)"
     required_named.add_argument("--to_function", help=help, required=True)
 
-    help = "name of the output file containing detected chains"
+    help = "name of the output file containing detected chains. The "\
+        "extension determines the format: csv, a graphviz output format "\
+        "such as png, or html for an interactive graph laid out in the "\
+        "browser with Cytoscape.js, or json for the Cytoscape.js graph "\
+        "elements"
     parser.add_argument("--out", help=help, default="chains.csv")
+    help = "Cytoscape.js file inlined into the html output, so that the page "\
+        "works offline, e.g. cytoscape.min.js %s downloaded from %s. Defaults "\
+        "to '%s': the page loads Cytoscape.js from that url" % (
+            callgraph_dot.CYTOSCAPE_VERSION, callgraph_dot.CYTOSCAPE_URL,
+            callgraph_dot.CYTOSCAPE_CDN)
+    parser.add_argument(
+        "--cytoscape_js", help=help, metavar="FILE",
+        default=callgraph_dot.DEFAULT_CYTOSCAPE_JS)
     choices = ["left", "right", "both"]
     help = "selects search direction."
     parser.add_argument("--direction", help=help, choices=choices, default="right")
     help = "select cutoff length for path search"
     parser.add_argument("--cutoff", help=help, type=int, default=10)
+    choices = ["paths", "slice"]
+    help = "Select the search mode. 'paths' (default) enumerates all the "\
+        "simple paths to each matching function, which might take very "\
+        "long on big callgraphs. 'slice' outputs the calls that are on "\
+        "some call chain within the cutoff length in linear time, "\
+        "and writes a summary of the number of chains and the shortest "\
+        "chain length to each matching function (see --summary). In the "\
+        "slice mode, chains are counted as walks: if there are cycles in "\
+        "the calls, chains that visit a function more than once are "\
+        "included."
+    parser.add_argument("--mode", help=help, choices=choices, default="paths")
+    help = "name of the output file for the per-function summary in the "\
+        "slice mode. Defaults to the --out file name with suffix '_targets.csv'"
+    parser.add_argument("--summary", help=help, default="")
+    help = "Output only the K shortest call chains (at most --cutoff long) "\
+        "in each search direction, instead of all the call chains. Chains "\
+        "are written as they are found, shortest first. The csv output "\
+        "has the columns 'chain', 'link' and 'direction' identifying the "\
+        "chain and the position of each call on the chain."
+    parser.add_argument("--top_k", help=help, type=int, metavar="K")
+    help = "reachability index built with build_reachability.py from the "\
+        "--calls file. Functions matching --to_function that the index "\
+        "tells can't be reached are dropped before searching the chains: "\
+        "with --direction right when --from_function is an entry point of "\
+        "the index, and with --direction left for the --to_function matches "\
+        "that are entry points."
+    parser.add_argument("--reachability", help=help, metavar="FILE")
+    help = "Don't follow the calls made by hub functions: chains can end at "\
+        "a hub but don't go through it. Hubs are either the functions with "\
+        "at least N distinct callers, or the functions listed in the csv "\
+        "file FILE with the column 'function', and optionally 'filename', "\
+        "for instance the output of find_hubs.py. --from_function is never "\
+        "pruned."
+    parser.add_argument("--prune_hubs", help=help, metavar="N|FILE")
+    help = "Collapse the functions of the output by file ('file'), or by "\
+        "directory ('dir'), or by the first N components of the directory "\
+        "('dir:N'). The edges between the files or directories are "\
+        "labelled with the number of calls and drawn with proportional "\
+        "width. With the csv output, the columns are 'caller_group', "\
+        "'callee_group' and 'calls'."
+    parser.add_argument(
+        "--aggregate", help=help, type=callgraph_aggregate.check_aggregate,
+        metavar="file|dir[:N]")
     help = "set the verbosity level (e.g. -vv for debug level)"
     parser.add_argument(
         "-v", "--verbose", help=help, action="count", default=1)
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.top_k is not None and args.mode == "slice":
+        parser.error("--top_k can't be used in the slice mode")
+    if args.top_k is not None and args.top_k <= 0:
+        parser.error("--top_k must be positive")
+    return args
 
 
 if __name__ == "__main__":
@@ -289,25 +538,50 @@ if __name__ == "__main__":
     df = df_all.drop_duplicates()
 
     from_fun, to_fun = args.from_function, args.to_function
-    left, right = search_settings(args.direction, args.cutoff)
 
     merge_on = ["caller_filename", "caller_function", "callee_filename", "callee_function"]
+    # Graph is built once, and shared by both search directions
+    _LOGGER.info("Converting the database into a graph...")
+    graph = callgraph_graph.CallGraph(df)
+    hubs = None
+    if args.prune_hubs is not None:
+        hubs = callgraph_hubs.Hubs(args.prune_hubs).mask(
+            graph.caller, graph.callee, graph.functions, graph.filenames)
+    left, right = search_settings(args.direction, args.cutoff, hubs)
+    reach = None
+    if args.reachability:
+        reach = callgraph_reachability.load_for(args.reachability, args.calls)
+
+    if args.top_k:
+        directions = [d for d in [right, left] if d]
+        write_shortest_chains(
+            graph, df, from_fun, to_fun, directions, args.top_k, args.out, reach,
+            args.aggregate, args.cytoscape_js)
+        _LOGGER.info("Done")
+        sys.exit(0)
+
+    targets = []
     chains_df_right = pd.DataFrame(columns=merge_on)
     if right:
-        chains_df_right = find_chains_directed_df(df, from_fun, to_fun, right)
+        chains_df_right, targets_df = find_chains_directed_df(
+            graph, df, from_fun, to_fun, right, args.mode, reach)
+        targets.append(targets_df)
 
     chains_df_left = pd.DataFrame(columns=merge_on)
     if left:
-        chains_df_left = find_chains_directed_df(df, from_fun, to_fun, left)
+        chains_df_left, targets_df = find_chains_directed_df(
+            graph, df, from_fun, to_fun, left, args.mode, reach)
+        targets.append(targets_df)
 
     _LOGGER.info("Generating the results...")
     df_chains = pd.concat([chains_df_left, chains_df_right]).drop_duplicates()
     df_chains = pd.merge(df_all, df_chains, on=merge_on, how='inner')
-    if args.out.endswith(".csv"):
-        df_to_csv_file(df_chains, args.out)
-    else:
-        grapher = Grapher(args.out)
-        grapher.graph(df_chains)
-        grapher.render(args.out)
+    write_calls(df_chains, args.out, args.aggregate, args.cytoscape_js)
+
+    if args.mode == "slice":
+        summary = args.summary
+        if not summary:
+            summary = "%s_targets.csv" % os.path.splitext(args.out)[0]
+        df_to_csv_file(pd.concat(targets), summary)
 
     _LOGGER.info("Done")
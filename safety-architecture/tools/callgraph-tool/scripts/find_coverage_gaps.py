@@ -6,12 +6,21 @@
 
 import argparse
 import csv
+import json
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
 import logging
+import networkx as nx
+import numpy as np
 import pandas as pd
 
 import utils
+import callgraph_db
+import callgraph_hubs
+import callgraph_index
 
 _LOGGER = logging.getLogger(utils.LOGGER_NAME)
 
@@ -19,8 +28,12 @@ _LOGGER = logging.getLogger(utils.LOGGER_NAME)
 
 
 class CoverageGapFinder():
-    def __init__(self, csv_calls, csv_coverage, maxdepth, outfile):
-        self.df_calls = df_from_csv_file(csv_calls)
+    def __init__(self, csv_calls, csv_coverage, maxdepth, outfile, prune_hubs=None):
+        self.csv_calls = csv_calls
+        self.prune_hubs = prune_hubs
+        # Functions whose calls are not followed
+        self.hub_functions = set()
+        self.df_calls = None
         self.df_cov = df_from_csv_file(csv_coverage)
         self.maxdepth = maxdepth
         self.outfilename = outfile
@@ -34,90 +47,314 @@ class CoverageGapFinder():
                     csv_coverage, require_cols))
             exit(1)
 
+        # Number of coverage entries and the first percent per
+        # (function, filename)
+        self.cov_index = {}
+        for function, filename, percent in zip(
+                self.df_cov['function'], self.df_cov['filename'], self.df_cov['percent']):
+            if pd.isna(function) or pd.isna(filename):
+                continue
+            count, first = self.cov_index.get((function, filename), (0, percent))
+            self.cov_index[(function, filename)] = (count + 1, first)
+        self._coverage = {}
+        self._subtree_size = {}
+        self._subtree_output = {}
+        self._warned = set()
+
+    def _read_calls(self):
+        # The calls are read on first use: the unbounded mode does not need
+        # them if the state from the previous run is up-to-date
+        if self.df_calls is not None:
+            return
+        self.df_calls = df_from_csv_file(self.csv_calls)
         require_cols = [
             'caller_function', 'callee_function', 'caller_filename', 'callee_filename']
         self.df_calls.columns = self.df_calls.columns.str.lower()
         if not all(x in list(self.df_calls.columns.values) for x in require_cols):
             _LOGGER.error(
                 "Function call database file '%s' missing required headers: %s" % (
-                    csv_calls, require_cols))
+                    self.csv_calls, require_cols))
             exit(1)
 
+        # Columns of the calls as lists: rows are referred to by position
+        self.caller_filename = self.df_calls['caller_filename'].tolist()
+        self.caller_function = self.df_calls['caller_function'].tolist()
+        self.callee_filename = self.df_calls['callee_filename'].tolist()
+        self.callee_function = self.df_calls['callee_function'].tolist()
+        # Rows where the given function is the caller, in callgraph order
+        self.children = {}
+        for row, function in enumerate(self.caller_function):
+            if not pd.isna(function):
+                self.children.setdefault(function, []).append(row)
+
+    def _find_hubs(self, regex):
+        # Hub functions, linked by name as in the walk. The functions
+        # matching regex are the roots of the walk and are never pruned.
+        if self.prune_hubs is None:
+            return
+        rows = len(self.caller_function)
+        codes, functions = pd.factorize(
+            pd.Series(self.caller_function + self.callee_function, dtype=object))
+        hubs = callgraph_hubs.Hubs(self.prune_hubs).mask(
+            codes[:rows], codes[rows:], np.asarray(functions, dtype=object))
+        roots = pd.Series(functions, dtype=object).str.contains(regex, regex=True, na=False)
+        self.hub_functions = set(functions[hubs & ~roots.values])
+        for function in self.hub_functions:
+            self.children.pop(function, None)
+
+    def find_coverage_gaps(self, regex, jobs=1):
+        self._read_calls()
+        self._find_hubs(regex)
         self._write_header()
-
-    def find_coverage_gaps(self, regex):
         # Find nodes where 'caller_function' matches regex
         df = df_regex_filter(self.df_calls, 'caller_function', regex)
+        roots = df.index.tolist()
 
-        for row in df.itertuples():
-            self._find_coverage_gap_from_caller(
-                caller=row,
-                depth=0,
-                call_stack="'%s'" % row.caller_function)
+        jobs = min(jobs, len(roots))
+        if jobs > 1:
+            self._find_coverage_gaps_parallel(roots, jobs)
+        else:
+            self._find_coverage_gaps_from_roots(roots)
         _LOGGER.info("wrote: %s" % self.outfilename)
 
-    def _find_coverage_gap_from_caller(self, caller, depth, call_stack):
-        if depth >= self.maxdepth:
-            _LOGGER.log(utils.LOG_SPAM, "maxdepth reached, returning")
-            return 0
-        if not caller.caller_function:
-            _LOGGER.warn("Missing caller_function: %s" % caller)
-            return 0
-        if not caller.callee_function:
-            _LOGGER.warn("Missing callee_function: %s" % caller)
-            return 0
-
-        # Find the caller coverage
-        caller_cov = self._get_coverage(caller.caller_function, caller.caller_filename)
-
-        # Find the callee coverage
-        callee_cov = self._get_coverage(caller.callee_function, caller.callee_filename)
-
-        # Update depth and call_stack
-        depth += 1
-        call_stack = "%s ==> '%s'" % (call_stack, caller.callee_function)
+    def _find_coverage_gaps_from_roots(self, roots):
+        for row in roots:
+            self._find_coverage_gap_from_caller(row, depth=0, parent=None)
+
+    def _find_coverage_gaps_parallel(self, roots, jobs):
+        # The roots are split into consecutive chunks and each worker writes
+        # the rows of a chunk to a shard file. The shards are appended to
+        # the output in the chunk order, so the output is the same as when
+        # walking the roots in one process.
+        global _FINDER
+        _FINDER = self
+        _LOGGER.info("Walking %s roots (processes=%s)" % (len(roots), jobs))
+        tmpdir = tempfile.mkdtemp(
+            dir=os.path.dirname(os.path.abspath(self.outfilename)), prefix=".gaps-")
+        tasks = [
+            (os.path.join(tmpdir, "shard%d.csv" % i), chunk.tolist())
+            for i, chunk in enumerate(np.array_split(roots, 4 * jobs))]
+        self.csvwriter.flush()
+        try:
+            with multiprocessing.get_context('fork').Pool(processes=jobs) as pool:
+                for shard in pool.imap(_find_coverage_gaps_shard, tasks):
+                    with open(shard, 'r', newline='') as fp:
+                        shutil.copyfileobj(fp, self.csvwriter.fp)
+                    os.remove(shard)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def find_coverage_gaps_unbounded(self, regex, statefile=None):
+        # Score the whole callee subtree of the functions matching regex.
+        # The callgraph is condensed into strongly connected components,
+        # so that the calls within a recursive cycle are counted once, and
+        # the subtrees are summed up in one pass in reverse topological
+        # order of the components.
+        # If 'statefile' is given, the condensed callgraph and the scores
+        # are stored in it. On the next run, if the calls have not changed,
+        # only the components calling the functions whose coverage changed
+        # are scored again.
+        self._write_header_unbounded()
+        state = None
+        if statefile:
+            state = load_state(statefile, self.csv_calls, regex, self.prune_hubs)
+        if state is None:
+            state = self._condense(regex)
+
+        # Uncovered share of each call in the subtrees
+        key_cov = np.array([
+            float(self._get_coverage(function, filename))
+            for function, filename in zip(state['key_function'], state['key_filename'])],
+            dtype=np.float64)
+        weight = (100 - key_cov[state['row_key']]) / 100
+
+        if 'gap' in state:
+            changed = np.flatnonzero((key_cov != state['key_cov'])[state['row_key']])
+            dirty = _ancestors(state, state['row_caller'][changed])
+            components = [c for c in state['order'] if dirty[c]]
+            _LOGGER.info(
+                "Coverage changed in %s calls, scoring %s of %s components" % (
+                    len(changed), len(components), len(state['order'])))
+            gap = state['gap'].copy()
+        else:
+            components = state['order']
+            gap = np.zeros(state['components'])
+        _subtree_sums(state, weight, gap, components)
+
+        table = []
+        for filename, function, component in zip(
+                state['root_filename'], state['root_function'], state['root_scc']):
+            table.append([
+                filename,
+                function,
+                self._get_coverage(function, filename),
+                state['scc_size'][component],
+                int(state['size'][component]),
+                gap[component],
+            ])
+        saturated = sum(
+            1 for row in table if max(row[-2], row[-1]) >= SUBTREE_SUM_MAX)
+        if saturated:
+            _LOGGER.warning(
+                "Subtree sums of %s functions saturated at %s" % (
+                    saturated, SUBTREE_SUM_MAX))
+        table.sort(key=lambda x: x[-1], reverse=True)
+        for csv_row in table:
+            self.csvwriter.write_arr(csv_row)
+        _LOGGER.info("wrote: %s" % self.outfilename)
 
-        # Recursively find the functions called by the callee_function
-        df = df_regex_filter(
-            self.df_calls, 'caller_function', "^%s$" % caller.callee_function)
-        callees = df.shape[0]
-        for row in df.itertuples():
-            ret = self._find_coverage_gap_from_caller(
-                caller=row,
-                depth=depth,
-                call_stack=call_stack)
-            callees += ret
+        if statefile:
+            state['key_cov'] = key_cov
+            state['gap'] = gap
+            save_state(statefile, state, self.csv_calls, regex, self.prune_hubs)
 
-        # Output csv row
+    def _condense(self, regex):
+        # Condensed callgraph restricted to the subtrees of the functions
+        # matching regex. The result does not depend on the coverage.
+        self._read_calls()
+        self._find_hubs(regex)
+        df = df_regex_filter(self.df_calls, 'caller_function', regex)
+        roots = df.drop_duplicates(['caller_filename', 'caller_function']).index.to_numpy()
+
+        # Functions are linked by name, as in find_coverage_gaps
+        rows = len(self.caller_function)
+        codes, functions = pd.factorize(
+            pd.Series(self.caller_function + self.callee_function, dtype=object))
+        caller, callee = codes[:rows], codes[rows:]
+        graph = nx.DiGraph()
+        graph.add_nodes_from(range(len(functions)))
+        # The calls made by the hubs are left out
+        pruned = np.asarray(functions.isin(self.hub_functions), dtype=bool)[caller] & \
+            (caller >= 0)
+        valid = (caller >= 0) & (callee >= 0) & ~pruned
+        graph.add_edges_from(zip(caller[valid].tolist(), callee[valid].tolist()))
+        dag = nx.condensation(graph)
+        components = dag.number_of_nodes()
+        mapping = dag.graph['mapping']
+        # Missing functions have code -1, which picks the appended -1
+        scc = np.array(
+            [mapping[node] for node in range(len(functions))] + [-1], dtype=np.int64)
+        caller_scc, callee_scc = scc[caller], scc[callee]
+
+        # Components reachable from the roots
+        reachable = np.zeros(components, dtype=bool)
+        stack = caller_scc[roots].tolist()
+        while stack:
+            component = stack.pop()
+            if not reachable[component]:
+                reachable[component] = True
+                stack.extend(dag.successors(component))
+
+        # Calls in the subtrees grouped by the caller component, and the
+        # callee (function, filename) of each call for the coverage lookup
+        subtree = np.flatnonzero((caller_scc >= 0) & reachable[caller_scc] & ~pruned)
+        indptr, order = callgraph_index.csr(caller_scc[subtree], components)
+        subtree = subtree[order]
+        keys = {}
+        row_key = np.array([
+            keys.setdefault((self.callee_function[row], self.callee_filename[row]), len(keys))
+            for row in subtree], dtype=np.int64)
+
+        state = {
+            'components': components,
+            'order': np.array([
+                c for c in reversed(list(nx.topological_sort(dag))) if reachable[c]],
+                dtype=np.int64),
+            'indptr': indptr,
+            'row_caller': caller_scc[subtree],
+            'row_callee': callee_scc[subtree],
+            'row_key': row_key,
+            'key_function': [key[0] for key in keys],
+            'key_filename': [key[1] for key in keys],
+            'root_filename': [self.caller_filename[row] for row in roots],
+            'root_function': [self.caller_function[row] for row in roots],
+            'root_scc': caller_scc[roots],
+            'scc_size': np.bincount(scc[:-1], minlength=components),
+        }
+        state['size'] = _subtree_sums(
+            state, np.ones(len(subtree)), np.zeros(components),
+            state['order']).astype(np.int64)
+        return state
+
+    def _find_coverage_gap_from_caller(self, row, depth, parent):
+        # Rows are written in post-order: the calls made by the callee
+        # before the call itself. 'parent' points to the caller frame,
+        # the call stack is built from the frames only for written rows.
+        if not self._has_output(row, depth):
+            return
+        frame = (row, parent)
+        for child in self.children.get(self.callee_function[row], []):
+            self._find_coverage_gap_from_caller(child, depth + 1, frame)
+
+        callee_cov = self._get_coverage(
+            self.callee_function[row], self.callee_filename[row])
         if callee_cov < 100:
-            self._to_csv_row(
-                caller, caller_cov, callee_cov, call_stack, callees)
+            caller_cov = self._get_coverage(
+                self.caller_function[row], self.caller_filename[row])
+            callees = self._get_subtree_size(self.callee_function[row], depth + 1)
+            self._to_csv_row(row, caller_cov, callee_cov, frame, callees)
 
-        # Return the number of function calls in this subtree
-        # (including duplicate pairs of caller-callee)
-        return callees
+    def _is_valid(self, row, depth):
+        if depth >= self.maxdepth:
+            return False
+        for col in ['caller_function', 'callee_function']:
+            if not getattr(self, col)[row]:
+                self._warn_once("Missing %s: %s" % (col, self.df_calls.iloc[row].to_dict()))
+                return False
+        return True
+
+    def _has_output(self, row, depth):
+        # True if the walk from 'row' at 'depth' writes any rows
+        if not self._is_valid(row, depth):
+            return False
+        callee = self.callee_function[row]
+        if self._get_coverage(callee, self.callee_filename[row]) < 100:
+            return True
+        key = (callee, depth + 1)
+        if key not in self._subtree_output:
+            self._subtree_output[key] = any(
+                self._has_output(child, depth + 1)
+                for child in self.children.get(callee, []))
+        return self._subtree_output[key]
+
+    def _get_subtree_size(self, function, depth):
+        # Number of function calls in the subtree of 'function' when
+        # reached at 'depth' (including duplicate pairs of caller-callee)
+        key = (function, depth)
+        if key not in self._subtree_size:
+            children = self.children.get(function, [])
+            size = len(children)
+            for child in children:
+                if self._is_valid(child, depth):
+                    size += self._get_subtree_size(self.callee_function[child], depth + 1)
+            self._subtree_size[key] = size
+        return self._subtree_size[key]
 
     def _get_coverage(self, funcname, filename):
+        key = (funcname, filename)
+        if key not in self._coverage:
+            self._coverage[key] = self._lookup_coverage(funcname, filename)
+        return self._coverage[key]
+
+    def _lookup_coverage(self, funcname, filename):
         if not funcname or pd.isna(funcname):
-            _LOGGER.warn(
+            self._warn_once(
                 "Invalid function name: %s" % funcname)
             return 0
-        df_cov = self.df_cov[(
-            self.df_cov['function'] == funcname) & (
-            self.df_cov['filename'] == filename)]
-        if df_cov.shape[0] <= 0:
-            _LOGGER.warn(
+        count, percent = self.cov_index.get((funcname, filename), (0, None))
+        if count <= 0:
+            self._warn_once(
                 "Missing coverage info for function: %s:%s" % (filename, funcname))
             return 0
-        elif df_cov.shape[0] > 1:
-            _LOGGER.warn(
+        elif count > 1:
+            self._warn_once(
                 "Multiple coverage values for function: %s:%s" % (filename, funcname))
-        df_head = df_cov.head(1)
-        if df_head is None:
-            _LOGGER.warn(
-                "Dataframe head(1) returned None for function: %s:%s" % (filename, funcname))
-            return 0
-        return cov_to_number(df_head['percent'].iloc[0])
+        return cov_to_number(percent)
+
+    def _warn_once(self, msg):
+        if msg not in self._warned:
+            self._warned.add(msg)
+            _LOGGER.warn(msg)
 
     def _write_header(self):
         header = \
@@ -137,25 +374,184 @@ class CoverageGapFinder():
             ]
         self.csvwriter.write_arr(header)
 
-    def _to_csv_row(self, caller, caller_cov, callee_cov, call_stack, callees):
-        row = \
+    def _write_header_unbounded(self):
+        header = \
+            [
+                "caller_filename",
+                "caller_function",
+                "caller_coverage",
+                # Number of functions in the strongly connected component
+                # of caller_function, i.e. functions in the same recursive
+                # cycle, including the caller_function itself
+                "scc_size",
+                # Number of function calls in the whole subtree of
+                # caller_function, counted along every call path. The
+                # calls within each component are counted once.
+                # Saturates at SUBTREE_SUM_MAX.
+                "subtree_size",
+                # Sum of the uncovered share of the callee of each function
+                # call in the subtree: the number of function calls
+                # potentially *not* covered in the subtree
+                "coverage_gap"
+            ]
+        self.csvwriter.write_arr(header)
+
+    def _call_stack(self, frame):
+        functions = []
+        while frame is not None:
+            row, frame = frame
+            functions.append(self.callee_function[row])
+        functions.append(self.caller_function[row])
+        return " ==> ".join("'%s'" % f for f in reversed(functions))
+
+    def _to_csv_row(self, row, caller_cov, callee_cov, frame, callees):
+        csv_row = \
             [
-                caller.caller_filename,
-                caller.caller_function,
+                self.caller_filename[row],
+                self.caller_function[row],
                 caller_cov,
-                caller.callee_filename,
-                caller.callee_function,
+                self.callee_filename[row],
+                self.callee_function[row],
                 callee_cov,
                 callees,
-                call_stack,
+                self._call_stack(frame),
                 ((100 - float(callee_cov)) / 100) * callees  # (1)
             ]
-        self.csvwriter.write_arr(row)
+        self.csvwriter.write_arr(csv_row)
+
+
+################################################################################
+
+# Finder shared with the worker processes. Workers are forked after reading
+# the input and building the indexes, so those are shared instead of being
+# built again in each worker.
+_FINDER = None
+
+# Saturation value of the unbounded subtree sums: the largest integer
+# float64 represents exactly
+SUBTREE_SUM_MAX = 2**53
+
+
+def _find_coverage_gaps_shard(task):
+    shard, roots = task
+    _FINDER.csvwriter = utils.CsvWriter(shard)
+    _FINDER._find_coverage_gaps_from_roots(roots)
+    _FINDER.csvwriter.fp.close()
+    return shard
+
+
+def _subtree_sums(state, values, sums, components):
+    # Sum of 'values' over the calls in the subtree of each of 'components',
+    # given in reverse topological order. 'sums' holds the sums of the other
+    # components and is updated in place. The calls are summed along every
+    # call path, so the sums grow exponentially with the depth of a DAG
+    # with many diamonds: they saturate at SUBTREE_SUM_MAX.
+    indptr, row_callee = state['indptr'], state['row_callee']
+    for component in components:
+        begin, end = indptr[component], indptr[component + 1]
+        called = row_callee[begin:end]
+        called = called[(called >= 0) & (called != component)]
+        # Float sums of the saturated values can't overflow
+        sums[component] = min(
+            values[begin:end].sum() + sums[called].sum(), SUBTREE_SUM_MAX)
+    return sums
+
+
+def _ancestors(state, components):
+    # Mask of the given components and the components calling them,
+    # directly or indirectly
+    row_caller, row_callee = state['row_caller'], state['row_callee']
+    external = (row_callee >= 0) & (row_callee != row_caller)
+    indptr, order = callgraph_index.csr(row_callee[external], state['components'])
+    callers = row_caller[external][order]
+    mask = np.zeros(state['components'], dtype=bool)
+    stack = list(components)
+    while stack:
+        component = stack.pop()
+        if not mask[component]:
+            mask[component] = True
+            stack.extend(callers[indptr[component]:indptr[component + 1]].tolist())
+    return mask
+
+
+################################################################################
+
+# Version of the state file format, bump on incompatible changes
+STATE_VERSION = 1
+
+# State arrays stored as .npy members of the state file, the rest of the
+# state is stored as JSON in STATE_HEADER
+STATE_ARRAYS = [
+    "order", "indptr", "row_caller", "row_callee", "row_key", "root_scc",
+    "scc_size", "size", "key_cov", "gap"]
+STATE_HEADER = "header"
+
+
+def load_state(filename, calls, regex, prune_hubs=None):
+    # State stored by save_state(), or None if the state is missing or
+    # does not match the calls, regex and hubs
+    if not os.path.exists(filename):
+        return None
+    try:
+        with np.load(filename, allow_pickle=False) as npz:
+            header = json.loads(npz[STATE_HEADER].tobytes().decode('utf-8'))
+            state = {name: npz[name] for name in STATE_ARRAYS}
+    except (OSError, ValueError, KeyError) as e:
+        _LOGGER.warning("Failed reading state '%s': %s" % (filename, e))
+        return None
+    if header.get("version") != STATE_VERSION or header.get("regex") != regex:
+        _LOGGER.info("State '%s' is from another query, ignoring" % filename)
+        return None
+    if header.get("prune_hubs") != _hubs_key(prune_hubs, header.get("prune_hubs")):
+        _LOGGER.info("State '%s' is from another query, ignoring" % filename)
+        return None
+    if not utils.signature_matches(calls, header.get("calls")):
+        _LOGGER.info("Calls have changed since '%s' was written, ignoring" % filename)
+        return None
+    _LOGGER.debug("Using state: %s" % filename)
+    for name in ["components", "key_function", "key_filename",
+                 "root_filename", "root_function"]:
+        state[name] = header[name]
+    return state
+
+
+def save_state(filename, state, calls, regex, prune_hubs=None):
+    header = {
+        "version": STATE_VERSION,
+        "regex": regex,
+        "calls": utils.file_signature(calls),
+        "prune_hubs": _hubs_key(prune_hubs),
+    }
+    for name in ["components", "key_function", "key_filename",
+                 "root_filename", "root_function"]:
+        header[name] = state[name]
+    arrays = {name: state[name] for name in STATE_ARRAYS}
+    arrays[STATE_HEADER] = np.frombuffer(
+        json.dumps(header).encode('utf-8'), dtype=np.uint8)
+    tmpfile = "%s.tmp" % filename
+    with open(tmpfile, 'wb') as fp:
+        np.savez(fp, **arrays)
+    os.replace(tmpfile, filename)
+    _LOGGER.info("wrote: %s" % filename)
+
+
+def _hubs_key(prune_hubs, stored=None):
+    # Identifies the hubs in the state: the threshold, or the prune list
+    # file and its signature. The stored key is returned if the prune list
+    # content is unchanged.
+    if prune_hubs is None or not os.path.isfile(prune_hubs):
+        return prune_hubs
+    if stored and stored[0] == prune_hubs and utils.signature_matches(prune_hubs, stored[1]):
+        return stored
+    return [prune_hubs, utils.file_signature(prune_hubs)]
+
 
 ################################################################################
 
 
 def df_from_csv_file(name):
+    if callgraph_db.is_callgraph_db(name):
+        return callgraph_db.read_callgraph_db(name)
     df = pd.read_csv(name, na_values=[''], keep_default_na=False)
     df.reset_index(drop=True, inplace=True)
     return df
@@ -205,7 +601,8 @@ def getargs():
     parser = argparse.ArgumentParser(description=desc, epilog=epil)
 
     required_named = parser.add_argument_group('required named arguments')
-    help = "function call database csv file"
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
     required_named.add_argument('--calls', help=help, required=True)
     help = "function coverage file"
     required_named.add_argument('--coverage', help=help, required=True)
@@ -216,13 +613,37 @@ def getargs():
     help = "set the maxdepth, defaults to 3"
     parser.add_argument(
         '--maxdepth', nargs='?', help=help, type=check_positive, default=3)
+    help = "score the whole callee subtree of the functions that match "\
+        "CALLER_FUNCTION_REGEX ignoring --maxdepth, and output the functions "\
+        "ranked by the coverage gap. The callgraph is condensed into strongly "\
+        "connected components, so that the function calls within recursive "\
+        "cycles are counted once"
+    parser.add_argument('--unbounded', help=help, action='store_true')
+    help = "state file of --unbounded: the condensed callgraph and the scores "\
+        "are stored in STATE. When run again with the same CALLS and "\
+        "CALLER_FUNCTION_REGEX, the stored state is used and only the functions "\
+        "whose subtree coverage changed are scored again. The state is "\
+        "stored in numpy .npz format, e.g. 'gaps_state.npz'"
+    parser.add_argument('--state', help=help)
+    help = "number of parallel processes walking the functions that match "\
+        "CALLER_FUNCTION_REGEX, defaults to 1. Not used with --unbounded"
+    parser.add_argument('--jobs', help=help, type=check_positive, default=1)
+    help = "Don't follow the calls made by hub functions, which are counted "\
+        "as leaves. Hubs are either the functions with at least N distinct "\
+        "calling functions, or the functions listed in the csv file FILE with "\
+        "the column 'function', for instance the output of find_hubs.py. "\
+        "Functions that match CALLER_FUNCTION_REGEX are never pruned."
+    parser.add_argument('--prune_hubs', help=help, metavar='N|FILE')
     help = "Set the verbosity level (e.g. -vv for debug level)"
     parser.add_argument(
         '-v', '--verbose', help=help, action='count', default=1)
     help = "Set the output file name, default is 'coverage_gaps.csv'"
     parser.add_argument(
         '--out', nargs='?', help=help, default='coverage_gaps.csv')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.state and not args.unbounded:
+        parser.error("--state requires --unbounded")
+    return args
 
 
 ################################################################################
@@ -240,8 +661,12 @@ if __name__ == "__main__":
         csv_calls=args.calls,
         csv_coverage=args.coverage,
         maxdepth=args.maxdepth,
-        outfile=args.out)
-    cov.find_coverage_gaps(args.caller_function_regex)
+        outfile=args.out,
+        prune_hubs=args.prune_hubs)
+    if args.unbounded:
+        cov.find_coverage_gaps_unbounded(args.caller_function_regex, args.state)
+    else:
+        cov.find_coverage_gaps(args.caller_function_regex, args.jobs)
 
 
 ################################################################################
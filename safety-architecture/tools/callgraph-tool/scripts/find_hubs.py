@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import csv
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+import utils
+import callgraph_db
+import callgraph_graph
+import callgraph_hubs
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+
+def degree_stats(df):
+    # Fan-in (distinct callers), fan-out (distinct callees) and the number
+    # of calls to each function
+    graph = callgraph_graph.CallGraph(df)
+    return pd.DataFrame({
+        "filename": graph.filenames,
+        "function": graph.functions,
+        "fan_in": callgraph_hubs.fan_in(graph.caller, graph.callee, graph.nodes),
+        "fan_out": callgraph_hubs.fan_out(graph.caller, graph.callee, graph.nodes),
+        "calls": np.bincount(graph.callee, minlength=graph.nodes),
+    })
+
+
+def log_stats(df_stats):
+    _LOGGER.info("Functions: %s" % len(df_stats))
+    for column in ["fan_in", "fan_out"]:
+        values = df_stats[column]
+        _LOGGER.info(
+            "%s: median %s, 99th percentile %s, max %s" % (
+                column, values.median(), values.quantile(0.99), values.max()))
+
+
+def df_from_csv_file(name):
+    if callgraph_db.is_callgraph_db(name):
+        return callgraph_db.read_callgraph_db(name, na_strings='')
+    df = pd.read_csv(name, keep_default_na=False)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def df_to_csv_file(df, name):
+    df.to_csv(
+        path_or_buf=name,
+        quoting=csv.QUOTE_ALL,
+        sep=",", index=False, encoding='utf-8')
+    _LOGGER.info("wrote: %s" % name)
+
+
+def check_positive(val):
+    intval = int(val)
+    if intval <= 0:
+        raise argparse.ArgumentTypeError(
+            "%s is not positive integer" % val)
+    return intval
+
+
+def getargs():
+    desc = "Find the hub functions of the callgraph: functions called from "\
+        "a large number of distinct functions, such as printk or kfree. "\
+        "Writes the hubs with their fan-in (distinct callers), fan-out "\
+        "(distinct callees) and number of calls. The output can be given "\
+        "as the prune list with --prune_hubs to query_callgraph.py, "\
+        "find_callchains.py and find_coverage_gaps.py, which then don't "\
+        "follow the calls made by the hubs."
+
+    epil = "Example: ./%s --calls callgraph.csv --threshold 200 --out hubs.csv" % \
+        os.path.basename(__file__)
+    parser = argparse.ArgumentParser(description=desc, epilog=epil)
+
+    required_named = parser.add_argument_group('required named arguments')
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
+    required_named.add_argument('--calls', help=help, required=True)
+
+    help = "Functions with at least this many distinct callers are hubs, "\
+        "defaults to 100"
+    parser.add_argument('--threshold', help=help, type=check_positive, default=100)
+    help = "Output only the K functions with the highest fan-in, instead of "\
+        "the functions above --threshold"
+    parser.add_argument('--top', help=help, type=check_positive, metavar='K')
+    help = "Set the output file name, defaults to 'hubs.csv'"
+    parser.add_argument('--out', help=help, default="hubs.csv")
+    help = "Set the verbosity level (e.g. -vv for debug level)"
+    parser.add_argument(
+        '-v', '--verbose', help=help, action='count', default=1)
+    return parser.parse_args()
+
+
+################################################################################
+
+
+if __name__ == "__main__":
+    args = getargs()
+
+    utils.exit_unless_accessible(args.calls)
+    utils.setup_logging(verbosity=args.verbose)
+
+    df_stats = degree_stats(df_from_csv_file(args.calls))
+    log_stats(df_stats)
+    df_stats.sort_values(
+        by=["fan_in", "filename", "function"], ascending=[False, True, True],
+        inplace=True)
+    if args.top:
+        df_stats = df_stats.head(args.top)
+    else:
+        df_stats = df_stats[df_stats["fan_in"] >= args.threshold]
+    _LOGGER.info("Hubs: %s" % len(df_stats))
+    df_to_csv_file(df_stats, args.out)
+
+################################################################################
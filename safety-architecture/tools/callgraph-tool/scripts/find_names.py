@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import logging
+import os
+import re
+
+import utils
+import callgraph_names
+
+################################################################################
+
+_LOGGER = logging.getLogger(utils.LOGGER_NAME)
+
+################################################################################
+
+
+def check_positive(val):
+    intval = int(val)
+    if intval <= 0:
+        raise argparse.ArgumentTypeError(
+            "%s is not positive integer" % val)
+    return intval
+
+
+def check_regex(val):
+    try:
+        re.compile(val)
+    except re.error as e:
+        raise argparse.ArgumentTypeError("invalid regex '%s': %s" % (val, e))
+    return val
+
+
+def find_names(index, args):
+    if args.closest is not None:
+        return index.closest(args.closest, limit=args.limit)
+    if args.prefix is not None:
+        names = index.prefix(args.prefix)
+    else:
+        names = index.regex(args.regex)
+    return names[:args.limit] if args.limit else names
+
+
+def getargs():
+    desc = "List the function or file names of the callgraph that are closest "\
+        "to the given name, start with the given prefix, or match the given "\
+        "regular expression, one name per line. The names are looked up in "\
+        "a trigram index of the distinct names, which is built on first use "\
+        "and saved next to the callgraph file with the '%s' suffix. The other "\
+        "scripts use the same index to suggest the closest names when the "\
+        "given function is not found." % callgraph_names.NAMES_SUFFIX
+
+    epil = "Example: ./%s --calls callgraph.csv --closest kmaloc" % \
+        os.path.basename(__file__)
+    parser = argparse.ArgumentParser(description=desc, epilog=epil)
+
+    required_named = parser.add_argument_group('required named arguments')
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
+    required_named.add_argument('--calls', help=help, required=True)
+
+    lookup = parser.add_mutually_exclusive_group(required=True)
+    help = "List the names most similar to NAME, the most similar first"
+    lookup.add_argument('--closest', help=help, metavar='NAME')
+    help = "List the names starting with PREFIX, sorted"
+    lookup.add_argument('--prefix', help=help)
+    help = "List the names where REGEX matches, sorted"
+    lookup.add_argument('--regex', help=help, type=check_regex)
+
+    help = "Look up function names or file names, defaults to 'function'"
+    parser.add_argument(
+        '--kind', help=help, choices=['function', 'filename'], default='function')
+    help = "Output at most N names, defaults to 5 with --closest, and all "\
+        "names otherwise"
+    parser.add_argument('--limit', help=help, type=check_positive, metavar='N')
+    help = "Set the verbosity level (e.g. -vv for debug level)"
+    parser.add_argument(
+        '-v', '--verbose', help=help, action='count', default=1)
+    args = parser.parse_args()
+    if args.closest is not None and args.limit is None:
+        args.limit = 5
+    return args
+
+
+################################################################################
+
+
+if __name__ == "__main__":
+    args = getargs()
+
+    utils.exit_unless_accessible(args.calls)
+    utils.setup_logging(verbosity=args.verbose)
+
+    names = callgraph_names.load_or_build(args.calls)
+    index = names.functions if args.kind == 'function' else names.filenames
+    for name in find_names(index, args):
+        print(name)
+
+################################################################################
@@ -9,12 +9,14 @@ import argparse
 import csv
 import json
 import logging
-import networkx as nx
+import numpy as np
 import os
 import pandas as pd
-import re
 import sys
 import utils
+import callgraph_db
+import callgraph_graph
+import callgraph_reachability
 
 ################################################################################
 
@@ -22,122 +24,232 @@ _LOGGER = logging.getLogger(utils.LOGGER_NAME)
 
 ################################################################################
 
+# Columns identifying a call when comparing the callgraphs in the offspring
+# mode
+OFFSPRING_KEYS = [
+    "caller_filename", "caller_function", "caller_def_line", "caller_line",
+    "callee_filename", "callee_function", "callee_line", "callee_calltype"]
 
-class Node():
-    def __init__(self, function=None, filename=None, row_id=None):
-        if not isinstance(filename, str):
-            print("Something odd happened")
-        self.function = function
-        self.filename = filename
-        self.row_id = row_id
-
-    def __eq__(self, other):
-        if isinstance(other, Node):
-            return (
-                self.function == other.function and
-                self.filename == other.filename)
-        return False
-
-    def __str__(self):
-        return ":".join([self.filename, self.function])
-
-    def __hash__(self):
-        return hash(self.__str__())
+################################################################################
 
 
-class Edge():
-    def __init__(
-        self,
-        in_node,
-        out_node
-    ):
-        self.in_node = in_node
-        self.out_node = out_node
+class AncestorSets():
+    # Ancestors of a set of nodes up to 'cutoff' calls away, computed in one
+    # breadth-first pass over the reversed callgraph. Bit k of the bitset
+    # of a node is set if the node is an ancestor of nodes[k].
+    def __init__(self, graph, nodes, cutoff):
+        self.reached = np.zeros(
+            (graph.nodes, max(1, (len(nodes) + 63) // 64)), dtype=np.uint64)
+        # Nodes first reached on each level and the bits set on that level,
+        # with the position of each node in the level, -1 if not in it
+        self.levels = []
+        for nodes, bits in graph.search_bits(nodes, cutoff, orientation='reverse'):
+            self.reached[nodes] |= bits
+            position = np.full(graph.nodes, -1, dtype=np.int64)
+            position[nodes] = np.arange(len(nodes))
+            self.levels.append((position, bits))
+        # Column-wise copy for selecting the ancestors of one node
+        self.reached_words = np.ascontiguousarray(self.reached.T)
+
+    def _has_bit(self, bits, k):
+        return ((bits >> np.uint64(k % 64)) & np.uint64(1)).astype(bool)
+
+    def common(self, k1, k2, mask):
+        # Common ancestors of nodes[k1] and nodes[k2] among the nodes in
+        # 'mask', and their distances to the two nodes
+        common = np.flatnonzero(
+            self._has_bit(self.reached_words[k1 // 64], k1) &
+            self._has_bit(self.reached_words[k2 // 64], k2) & mask)
+        dist1 = np.zeros(len(common), dtype=np.int64)
+        dist2 = np.zeros(len(common), dtype=np.int64)
+        for level, (position, bits) in enumerate(self.levels):
+            pos = position[common]
+            found = np.flatnonzero(pos >= 0)
+            for k, dist in [(k1, dist1), (k2, dist2)]:
+                hit = found[self._has_bit(bits[pos[found], k // 64], k)]
+                dist[hit] = level + 1
+        return common, dist1, dist2
+
+
+class LcaFinder():
+    # Nearest common callers of function pairs, considering the callers
+    # whose function name matches 'regex'
+    def __init__(self, df, cutoff, regex):
+        self.graph = callgraph_graph.CallGraph(df)
+        self.cutoff = cutoff
+        functions = pd.Series(self.graph.functions, dtype=object)
+        self.candidate = functions.str.contains(regex, regex=True, na=False).values
+        # Definition line of each node from its first row as a caller
+        nodes, rows = np.unique(self.graph.caller, return_index=True)
+        self.def_lines = np.full(self.graph.nodes, "", dtype=object)
+        self.def_lines[nodes] = df['caller_def_line'].values[rows]
+        self.names = callgraph_graph.NodeNames(self.graph.filenames, self.graph.functions)
+
+    def node(self, name):
+        # Node of 'name', given as 'function' or 'filename:function'.
+        # Raises ValueError if there is no single such function.
+        return self.names.node(name)
+
+    def find_lca(self, pairs):
+        # Common callers of each pair of nodes, nearest first. All the
+        # pairs are answered from one pass over the callgraph.
+        nodes = sorted(set(node for pair in pairs for node in pair))
+        index = {node: k for k, node in enumerate(nodes)}
+        ancestors = AncestorSets(self.graph, nodes, self.cutoff)
+        return [
+            self._common(ancestors, index[n1], index[n2]) for n1, n2 in pairs]
+
+    def _common(self, ancestors, k1, k2):
+        common, dist1, dist2 = ancestors.common(k1, k2, self.candidate)
+        lca = [
+            {
+                'function': self.graph.functions[node],
+                'filename': self.graph.filenames[node],
+                'def_line': self.def_lines[node],
+                'distance1': d1,
+                'distance2': d2,
+            }
+            for node, d1, d2 in zip(common.tolist(), dist1.tolist(), dist2.tolist())]
+        lca.sort(key=lambda x: (
+            x['distance1'] + x['distance2'], max(x['distance1'], x['distance2']),
+            x['function'], x['filename']))
+        return lca
+
+
+class EntryFinder():
+    # Common callers of function pairs among the entry points of the
+    # reachability index, at any distance: answered from the index
+    # without traversing the callgraph
+    def __init__(self, index):
+        self.index = index
+        # Entry points in output order
+        entries = index.entries
+        self.order = entries[np.lexsort(
+            (index.filenames[entries].astype(str), index.functions[entries].astype(str)))]
+
+    def node(self, name):
+        return self.index.node(name)
+
+    def find_lca(self, pairs):
+        index = self.index
+        is_common = np.zeros(index.nodes, dtype=bool)
+        results = []
+        for n1, n2 in pairs:
+            is_common[index.common_entries(n1, n2)] = True
+            common = self.order[is_common[self.order]]
+            is_common[common] = False
+            results.append([
+                {'function': function, 'filename': filename, 'def_line': def_line}
+                for function, filename, def_line in zip(
+                    index.functions[common], index.filenames[common],
+                    index.def_lines[common])])
+        return results
 
 
 ################################################################################
 
 
 def df_from_csv_file(name):
+    if callgraph_db.is_callgraph_db(name):
+        return callgraph_db.read_callgraph_db(name, na_strings='', str_ints=True)
     dtype = {"caller_def_line": str, "caller_line": str}
     df = pd.read_csv(name, keep_default_na=False, dtype=dtype)
     df.reset_index(drop=True, inplace=True)
     return df
 
 
-def df_to_csv_file(df, name):
-    df.to_csv(
-        path_or_buf=name,
-        quoting=csv.QUOTE_ALL,
-        sep=",", index=False, encoding='utf-8')
-    _LOGGER.info("wrote: %s" % name)
-
-
-def def_regex_filter(df, column, regex):
-    return df[df[column].str.contains(regex, regex=True, na=False)]
-
-
-def get_df_from(df, from_fun, function_col, filename_col, drop_duplicates=True):
-    from_fun = from_fun.split(":")
-    if len(from_fun) == 1:
-        from_fun = ["", from_fun[0]]
-        df_from = df[df[function_col] == from_fun[1]]
-    else:
-        df_from = df[(df[function_col] == from_fun[1]) & (df[filename_col] == from_fun[0])]
-    # If from function not in database return immediately (with info message)
-    if df_from.shape[0] <= 0:
-        _LOGGER.warn(
-            "Function '%s' does not exist in call graph database for selected search"
-            " direction" % ":".join(from_fun)
-        )
-        sys.exit(1)
-    # If multiple from functions with the same name, notify the user to specify a filename too
-    if drop_duplicates:
-        df_from = df_from[[function_col, filename_col]].drop_duplicates()
-        if df_from.shape[0] > 1:
-            _LOGGER.warn(
-                "Multiple functions with the name '%s' exist in call graph database. Please,"
-                " specify the correct function using filepath:filename format" % from_fun[1]
-            )
+def function_mask(df, name):
+    # Rows called by 'name', given as 'function' or 'filename:function'
+    name = name.split(":")
+    if len(name) == 1:
+        return (df['caller_function'] == name[0]).values
+    return ((df['caller_function'] == name[1]) &
+            (df['caller_filename'] == name[0])).values
+
+
+def find_offspring(calls, functions, out, chunksize):
+    # Write the calls common to all the callgraphs in 'calls' to 'out',
+    # with a dummy root function '___' calling each of 'functions', and
+    # the calls made by each of 'functions' in its callgraph. The calls
+    # are compared by the fingerprints of their key columns, reading one
+    # callgraph at a time.
+    common = None
+    roots = []
+    for name, function in zip(calls, functions):
+        _LOGGER.info("Reading: %s" % name)
+        found = [] if common is None else np.zeros(len(common), dtype=bool)
+        root_rows = []
+        for df in callgraph_db.read_chunks(name, OFFSPRING_KEYS, chunksize):
+            fps = callgraph_graph.fingerprints(df, OFFSPRING_KEYS)
+            if common is None:
+                found.append(np.unique(fps))
+            else:
+                member = callgraph_graph.is_member(fps, common)
+                found[np.searchsorted(common, fps[member])] = True
+            root_rows.append(df[function_mask(df, function)])
+        common = np.unique(np.concatenate(found)) if common is None else common[found]
+        root_rows = pd.concat(root_rows)
+        if root_rows.empty:
+            _LOGGER.warning(
+                "Function '%s' does not exist in call graph database for selected "
+                "search direction" % function)
             sys.exit(1)
-    return df_from
-
-
-def graph_from_df(df):
-    g = nx.DiGraph()
-    for row in df.itertuples():
-        n1 = Node(
-                function=row.caller_function,
-                filename=row.caller_filename)
-        n2 = Node(
-                function=row.callee_function,
-                filename=row.callee_filename)
-        g.add_edge(n1, n2)
-
-    return g
-
-
-def find_lca(df, f1, f2):
-    df_f1 = get_df_from(df, f1, 'caller_function', 'caller_filename')
-    df_f2 = get_df_from(df, f2, 'caller_function', 'caller_filename')
-    G = graph_from_df(df)
-    G.remove_edges_from(list(nx.selfloop_edges(G)))
-    f1_node = Node(
-        function=df_f1['caller_function'].iloc[0],
-        filename=df_f1['caller_filename'].iloc[0]
-    )
-    f2_node = Node(
-        function=df_f1['caller_function'].iloc[0],
-        filename=df_f1['caller_filename'].iloc[0]
-    )
-    f1_pred = list(G.predecessors(f1_node))
-    f2_pred = list(G.predecessors(f2_node))
-    common_pred = set(f1_pred).intersection(set(f2_pred))
-    lca = []
-    for node in common_pred:
-        if node.function.startswith('__sys'):
-            lca.append(node)
-    return lca
+        roots.append(root_rows)
+    _LOGGER.info("Found %s common calls" % len(common))
+
+    # Common calls in the order of the first callgraph
+    pd.DataFrame(columns=OFFSPRING_KEYS).to_csv(
+        out, quoting=csv.QUOTE_ALL, index=False, encoding='utf-8')
+    for df in callgraph_db.read_chunks(calls[0], OFFSPRING_KEYS, chunksize):
+        fps = callgraph_graph.fingerprints(df, OFFSPRING_KEYS)
+        df[callgraph_graph.is_member(fps, common)].to_csv(
+            out, mode='a', header=False, quoting=csv.QUOTE_ALL, index=False,
+            encoding='utf-8')
+    dummy = pd.DataFrame([
+        ["___", "___", "", "0", df['caller_filename'].iloc[0],
+         df['caller_function'].iloc[0], df['caller_def_line'].iloc[0], ""]
+        for df in roots], columns=OFFSPRING_KEYS)
+    pd.concat([dummy] + roots).to_csv(
+        out, mode='a', header=False, quoting=csv.QUOTE_ALL, index=False,
+        encoding='utf-8')
+    _LOGGER.info("wrote: %s" % out)
+
+
+def read_pairs(filename):
+    # Function pairs from csv file with columns function1 and function2
+    df = pd.read_csv(filename, keep_default_na=False, dtype=str)
+    if not all(x in df.columns for x in ['function1', 'function2']):
+        _LOGGER.error(
+            "Pairs file '%s' missing required headers: %s" % (
+                filename, ['function1', 'function2']))
+        sys.exit(1)
+    return list(zip(df['function1'], df['function2']))
+
+
+def find_lca_pairs(finder, pairs):
+    # Common callers of each pair, the pairs with unknown or ambiguous
+    # functions get an error entry
+    results = [{'function1': f1, 'function2': f2} for f1, f2 in pairs]
+    queries = []
+    for result in results:
+        try:
+            queries.append(
+                (finder.node(result['function1']), finder.node(result['function2'])))
+        except ValueError as e:
+            _LOGGER.warning(e)
+            result['error'] = str(e)
+    valid = [result for result in results if 'error' not in result]
+    for result, lca in zip(valid, finder.find_lca(queries)):
+        result['ancestors'] = lca
+    return results
+
+
+def check_positive(val):
+    intval = int(val)
+    if intval <= 0:
+        raise argparse.ArgumentTypeError(
+            "%s is not positive integer" % val)
+    return intval
 
 
 def output_to_json(d, filename):
@@ -160,24 +272,60 @@ def getargs():
     parser = argparse.ArgumentParser(description=desc, epilog=epil)
 
     required_named = parser.add_argument_group('required named arguments')
-    help = "function call database csv file"
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
     required_named.add_argument("--calls", help=help, required=True, nargs='+')
-    help = "first input argument"
-    required_named.add_argument("--function1", help=help, required=True)
-    help = "second input argument"
-    required_named.add_argument("--function2", help=help, required=True)
+    help = "first input argument, required unless --pairs is given"
+    parser.add_argument("--function1", help=help)
+    help = "second input argument, required unless --pairs is given"
+    parser.add_argument("--function2", help=help)
+    help = "root function of each --calls file, in the same order: find the "\
+        "calls common to more than two callgraphs (offspring)"
+    parser.add_argument("--functions", help=help, nargs='+')
+    help = "csv file with columns 'function1' and 'function2': find the common "\
+        "ancestors of each pair, loading the callgraph only once (ancestor)"
+    parser.add_argument("--pairs", help=help)
 
     help = "name of the output file"
     parser.add_argument("--out", help=help, default="related.json")
     choices = ["ancestor", "offspring"]
     help = "selects search direction."
     parser.add_argument("--algorithm", help=help, choices=choices, default="ancestor")
-    help = "select cutoff length for path search"
+    help = "select cutoff length for path search: the maximum number of calls "\
+        "from an ancestor to the function (ancestor)"
     parser.add_argument("--cutoff", help=help, type=int, default=10)
+    help = "consider only the ancestors whose function name matches the regular "\
+        "expression, defaults to system call functions '^__sys' (ancestor)"
+    parser.add_argument("--ancestor_regex", help=help, default="^__sys")
+    help = "reachability index built with build_reachability.py: find the "\
+        "entry points of the index that call both functions at any "\
+        "distance, instead of the ancestors within --cutoff matching "\
+        "--ancestor_regex. The callgraph is not loaded (ancestor)"
+    parser.add_argument("--reachability", help=help, metavar="FILE")
+    help = "number of rows read at a time from each csv file (offspring)"
+    parser.add_argument(
+        "--chunksize", help=help, type=check_positive, default=1000000)
     help = "set the verbosity level (e.g. -vv for debug level)"
     parser.add_argument(
         "-v", "--verbose", help=help, action="count", default=1)
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.pairs and args.algorithm != 'ancestor':
+        parser.error("--pairs requires --algorithm=ancestor")
+    if args.reachability and args.algorithm != 'ancestor':
+        parser.error("--reachability requires --algorithm=ancestor")
+    if args.functions and args.algorithm != 'offspring':
+        parser.error("--functions requires --algorithm=offspring")
+    if args.functions:
+        if len(args.functions) != len(args.calls) or len(args.calls) < 2:
+            parser.error("--functions requires one function per --calls file, "
+                         "and at least two --calls files")
+    elif not args.pairs and not (args.function1 and args.function2):
+        parser.error("--function1 and --function2 are required unless --pairs "
+                     "or --functions is given")
+    elif args.algorithm == 'offspring' and len(args.calls) != 2:
+        parser.error("--function1 and --function2 require two --calls files, "
+                     "use --functions with more")
+    return args
 
 
 if __name__ == "__main__":
@@ -190,58 +338,26 @@ if __name__ == "__main__":
     # Load graph database (remove duplicates)
 
     if args.algorithm == 'ancestor':
-        df_all = df_from_csv_file(args.calls[0])
-        df = df_all.drop_duplicates()
-        f1, f2 = args.function1, args.function2
-        lca = find_lca(df, f1, f2)
-
-        lca_l = []
-        for node in lca:
-            df_row = df_all[(df_all['caller_function'] == node.function) &
-                            (df_all['caller_filename'] == node.filename)]
-            lca_entry = {
-                    'function': df_row['caller_function'].iloc[0],
-                    'filename': df_row['caller_filename'].iloc[0],
-                    'def_line': df_row['caller_def_line'].iloc[0]
-            }
-            lca_l.append(lca_entry)
-
-        output_to_json(lca_l, args.out)
+        if args.reachability:
+            finder = EntryFinder(
+                callgraph_reachability.load_for(args.reachability, args.calls[0]))
+        else:
+            df = df_from_csv_file(args.calls[0])
+            finder = LcaFinder(df, args.cutoff, args.ancestor_regex)
+        if args.pairs:
+            utils.exit_unless_accessible(args.pairs)
+            output_to_json(find_lca_pairs(finder, read_pairs(args.pairs)), args.out)
+        else:
+            try:
+                pair = (finder.node(args.function1), finder.node(args.function2))
+            except ValueError as e:
+                _LOGGER.warning(e)
+                sys.exit(1)
+            output_to_json(finder.find_lca([pair])[0], args.out)
 
     if args.algorithm == 'offspring':
-        df1 = df_from_csv_file(args.calls[0])
-        df2 = df_from_csv_file(args.calls[1])
-        dropcols = ['call_depth', 'callee_inlined_from_file',
-                    'callee_inlined_from_line', 'indirect_found_with']
-        df1 = df1.drop(columns=dropcols)
-        df2 = df2.drop(columns=dropcols)
-        df = pd.merge(
-            left=df1,
-            right=df2,
-            how="outer",
-            on=["caller_filename", "caller_function", "callee_filename", "callee_function",
-                "caller_def_line", "caller_line", "callee_calltype", "callee_line"],
-            indicator=True)
-
-        # insert dummy rows with caller "___" and callee being arg1 and arg2
-        node1 = get_df_from(
-            df1, args.function1, 'caller_function', 'caller_filename', drop_duplicates=False)
-        node2 = get_df_from(
-            df2, args.function2, 'caller_function', 'caller_filename', drop_duplicates=False)
-        n1_function = node1['caller_function'].iloc[0]
-        n1_filename = node1['caller_filename'].iloc[0]
-        n1_def_line = node1['caller_def_line'].iloc[0]
-        n2_function = node2['caller_function'].iloc[0]
-        n2_filename = node2['caller_filename'].iloc[0]
-        n2_def_line = node2['caller_def_line'].iloc[0]
-
-        data = [
-            ['___', "___", "", "0", n1_filename, n1_function, n1_def_line, ""],
-            ['___', "___", "", "0", n2_filename, n2_function, n2_def_line, ""]]
-        df = def_regex_filter(df, '_merge', 'both')
-        df = df.drop(columns=['_merge'])
-        df = df.append(pd.DataFrame(data, columns=df.columns), ignore_index=True)
-        df = pd.concat([df, node1, node2])
-        df_to_csv_file(df, args.out)
+        find_offspring(
+            args.calls, args.functions or [args.function1, args.function2],
+            args.out, args.chunksize)
 
     _LOGGER.info("Done")
@@ -4,51 +4,37 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-import graphviz as gv
-import os
-from collections import OrderedDict
+import callgraph_dot
 
 
 class Grapher():
 
-    def __init__(self, out):
+    def __init__(
+            self, out, layout='auto', layout_timeout=callgraph_dot.DEFAULT_LAYOUT_TIMEOUT,
+            cytoscape_js=callgraph_dot.DEFAULT_CYTOSCAPE_JS):
         self.out = out
         self.maxdepth = 30
+        self.layout = layout
+        self.layout_timeout = layout_timeout
+        self.cytoscape_js = cytoscape_js
 
-        self.digraph = gv.Digraph(filename=out)
-        self.digraph.attr('graph', rankdir='LR')
-        self.digraph.attr('node', shape='box')
-        self.digraph.attr('node', style='rounded')
-        self.digraph.attr('node', margin='0.3,0.1')
-        self.digraph.attr('graph', concentrate='true')
-        # Key: node name, Value: list of labels associated to node name
-        self.nodelabels = {}
-
-        # Initial number of entries in the graph
-        self.initlen = len(self.digraph.body)
+        self.digraph = callgraph_dot.DotGraph(
+            graph_attr={'rankdir': 'LR', 'concentrate': 'true'},
+            node_attr={'shape': 'box', 'style': 'rounded', 'margin': '0.3,0.1'})
 
     def _add_node(self, function, filename, line):
         function = str(function)
         filename = str(filename)
         line = str(line).split('.')[0]
         node_name = "%s_%s" % (filename, function)
-        # Node name = function, Default label = []
-        labels = self.nodelabels.setdefault(node_name, [])
-        # Add filename as new label
+        # Add filename as label, merged with the labels of the node
         filename = filename if filename else "NaN"
         line = line if line else "NaN"
-        labels.append("%s:%s" % (filename, line))
-        # Remove possible duplicate labels, preserving order
-        labels = list(OrderedDict.fromkeys(labels))
-        # Build the html label: function name on the first line followed by
-        # associated filenames framed with html font-tags
-        beg = "<FONT POINT-SIZE=\"10\">"
-        end = "</FONT>"
-        label = "<%s<BR/>%s%s%s>" % (function, beg, "<BR/>".join(labels), end)
         fillcolor = '#EEEEEE'
         # Add node to the graph
         self.digraph.node(
-            node_name, label, style='rounded,filled', fillcolor=fillcolor)
+            node_name, function, ["%s:%s" % (filename, line)],
+            style='rounded,filled', fillcolor=fillcolor)
 
     def _add_edge(self, row):
         edge_style = None
@@ -76,8 +62,6 @@ class Grapher():
 
     def render(self, filename):
         # Render the graph
-        if len(self.digraph.body) <= self.initlen:
+        if len(self.digraph) == 0:
             return
-        fname, extension = os.path.splitext(filename)
-        ext = extension[1:]
-        self.digraph.render(filename=fname, format=ext, cleanup=True)
+        self.digraph.render(filename, self.layout, self.layout_timeout, self.cytoscape_js)
@@ -5,16 +5,28 @@
 # SPDX-License-Identifier: Apache-2.0
 import argparse
 import csv
+import functools
+import io
+import json
 import os
 import sys
 import logging
-import graphviz as gv
+import multiprocessing
+import numpy as np
 import pandas as pd
 import re
+import signal
+import socketserver
+import time
 import utils
+import callgraph_aggregate
+import callgraph_db
+import callgraph_dot
+import callgraph_hubs
+import callgraph_index
+import callgraph_names
+import callgraph_reachability
 import html
-from collections import OrderedDict
-from difflib import SequenceMatcher
 
 ################################################################################
 
@@ -61,17 +73,21 @@ class CallGraphFilter():
 DBG_INDENT = "    "
 
 
+class BudgetExceeded(Exception):
+    # Raised when a traversal exceeds the node or time budget
+    pass
+
+
 class Grapher():
 
     def __init__(self, csvfile):
+        self.csvfile = csvfile
         self._load_callgraph_data(csvfile)
-        self.digraph = None
-        # Key: node name, Value: list of labels associated to node name
-        self.nodelabels = {}
-        # Rows that match the query when output format is csv
-        self.df_out_csv = None
-        # Keep track of paths drawn to not re-draw them
-        self.paths_drawn = set()
+        # Index for following the call chains without scanning the data
+        self.index = callgraph_index.load_or_build(csvfile, self.df)
+        # Name index for the suggestions, loaded on the first failed query
+        self.names = None
+        self._reset()
         # Default parameters
         self.maxdepth = 1
         self.edge_labels = False
@@ -80,14 +96,76 @@ class Grapher():
         self.inverse = False
         self.until_func_regex = None
         self.colorize_regex = None
+        self.aggregate = None
         self.df_cov = None
+        # Hub mask of the index nodes: calls made by hubs are not followed
+        self.hubs = None
+        # Traversal budgets: maximum number of nodes, and the deadline of
+        # the query in time.monotonic() seconds
+        self.max_nodes = None
+        self.deadline = None
+        # Graphviz layout engine and the seconds it's given
+        self.layout = 'auto'
+        self.layout_timeout = callgraph_dot.DEFAULT_LAYOUT_TIMEOUT
+        # Cytoscape.js file inlined into the html output, or CYTOSCAPE_CDN
+        self.cytoscape_js = callgraph_dot.DEFAULT_CYTOSCAPE_JS
+
+    def _reset(self):
+        # Reset the state of the previous query
+        self.digraph = None
+        # Key: node name, Value: index node drawn with the name
+        self.node_names = {}
+        # Rows that match the query when output format is csv
+        self.df_out_csv = None
+        # Keep track of paths drawn to not re-draw them: keys of the calls
+        self.paths_drawn = set()
+        # Rows in the order they are drawn
+        self.rows_drawn = []
+        # Rows found on each step of the call chains, with their call depth
+        self.blocks = []
+        # Key: function code, Value: function matches until_function
+        self.until_function = {}
+        # Hub nodes whose calls were not followed
+        self.pruned = set()
+        # Function code of the queried function, never pruned
+        self.root_function = -1
+        # Nodes drawn, counted only when the traversal has a budget
+        self.nodes_drawn = set()
+        # Nodes at maxdepth whose calls were not followed
+        self.frontier = set()
+
+    def load_coverage(self, filename):
+        self._load_coverage_data(filename)
+
+    def prune_hubs(self, spec):
+        # Hubs are (filename, function) pairs: the index nodes also
+        # differ by the line, so the fan-in is counted over the pairs
+        # Missing filenames and functions have code -1: shift the codes
+        index = self.index
+        keys = (np.asarray(index.node_filename, dtype=np.int64) + 1) * \
+            (len(index.functions) + 1) + index.node_function + 1
+        pair = pd.factorize(keys)[0]
+        first = np.unique(pair, return_index=True)[1]
+        filenames = np.append(np.array(index.filenames, dtype=object), np.nan)
+        functions = np.append(np.array(index.functions, dtype=object), np.nan)
+        hubs = callgraph_hubs.Hubs(spec).mask(
+            pair[index.caller_node], pair[index.callee_node],
+            functions[index.node_function[first]], filenames[index.node_filename[first]])
+        self.hubs = hubs[pair] & (np.asarray(index.node_function) >= 0)
 
     def graph(self, args):
+        # Returns True if the query output was written
+        self._reset()
         self._is_csv_out(args.out)
         self.maxdepth = args.depth
+        self.max_nodes = args.max_nodes
+        self.deadline = None
+        if args.time_budget is not None:
+            self.deadline = time.monotonic() + args.time_budget
         self.inverse = args.inverse
         self.edge_labels = args.edge_labels
         self.skip_indirect = args.skip_indirect
+        self.aggregate = args.aggregate
         self.merge_edges = args.merge_edges
         self.until_func_regex = r'%s' % args.until_function
         self.colorize_regex = r'%s' % args.colorize
@@ -99,17 +177,7 @@ class Grapher():
             )
             self.edge_labels = False
 
-        if args.coverage_file is not None:
-            self._load_coverage_data(args.coverage_file)
-
-        concentrate = 'true' if self.merge_edges else 'false'
-        self.digraph = gv.Digraph(filename=args.out)
-        self.digraph.attr('graph', rankdir='LR')
-        self.digraph.attr('node', shape='box')
-        self.digraph.attr('node', style='rounded')
-        self.digraph.attr('node', margin='0.3,0.1')
-        self.digraph.attr('graph', concentrate=concentrate)
-
+        self.root_function = self.index.function_code(args.function)
         if self.inverse:
             # Filter by callee_function if 'inverse' requested
             filter = CallGraphFilter(
@@ -121,23 +189,81 @@ class Grapher():
                 caller_function=args.function,
                 caller_filename=args.filename)
 
-        # Initial number of entries in the graph
-        initlen = len(self.digraph.body)
-
-        # Draw the graph
-        self._graph(filter=filter)
-
-        # Render the graph
-        if len(self.digraph.body) > initlen:
-            self._render(args.out)
-
-        # Output csv
-        if self.df_out_csv is not None and not self.df_out_csv.empty:
-            df_to_csv_file(self.df_out_csv, args.out)
+        rows = self._query(filter)
+        if len(rows) == 0:
+            # First match failed: print to console and stop
+            _LOGGER.info(
+                "No matching functions found%s" % self._suggest(args.function, args.filename))
+            return False
+        if self.max_nodes is None and self.deadline is None:
+            self._new_digraph(args.out)
+            self._graph(rows)
+            return self._write(args.out)
+        return self._graph_deepening(rows, args.out)
+
+    def _graph_deepening(self, rows, filename):
+        # Iterative deepening within the budgets: the graph of each depth
+        # is drawn from scratch, and written as soon as it is complete.
+        # When the budget runs out, the output of the deepest complete
+        # depth is kept. Returns True if any output was written.
+        if len(rows) == 0:
+            self._graph(rows)
+            return False
+        maxdepth = self.maxdepth
+        written = False
+        frontier = 0
+        for depth in range(1, maxdepth + 1):
+            self._reset()
+            self._is_csv_out(filename)
+            self._new_digraph(filename)
+            self.maxdepth = depth
+            try:
+                self._graph(rows)
+            except BudgetExceeded as e:
+                if depth == 1:
+                    _LOGGER.warning("%s before completing depth 1, no output" % e)
+                else:
+                    _LOGGER.warning(
+                        "%s at depth %s: kept the complete graph of depth %s, "
+                        "cut at %s frontier nodes" % (e, depth, depth - 1, frontier))
+                break
+            written = self._write(filename)
+            frontier = len(self.frontier)
+            _LOGGER.info(
+                "Completed depth %s: %s nodes, %s frontier nodes" % (
+                    depth, len(self.nodes_drawn), frontier))
+            if frontier == 0:
+                # Deeper graphs would be the same
+                break
+        self.maxdepth = maxdepth
+        return written
+
+    def _new_digraph(self, filename):
+        concentrate = 'true' if self.merge_edges else 'false'
+        self.digraph = callgraph_dot.DotGraph(
+            graph_attr={'rankdir': 'LR', 'concentrate': concentrate},
+            node_attr={'shape': 'box', 'style': 'rounded', 'margin': '0.3,0.1'})
+
+    def _write(self, filename):
+        # Render the graph or output csv. Returns True if written.
+        if self.aggregate is not None:
+            return self._write_aggregate(filename)
+        if self.df_out_csv is not None:
+            if self.df_out_csv.empty:
+                return False
+            df_to_csv_file(self.df_out_csv, filename)
+            return True
+        if len(self.digraph) == 0:
+            return False
+        self._render(filename)
+        return True
 
     def _load_callgraph_data(self, filename):
         utils.exit_unless_accessible(filename)
-        self.df = pd.read_csv(filename, na_values=[''], keep_default_na=False)
+        if callgraph_db.is_callgraph_db(filename):
+            self.df = callgraph_db.read_callgraph_db(filename)
+        else:
+            self.df = pd.read_csv(filename, na_values=[''], keep_default_na=False)
         self.df.reset_index(drop=True, inplace=True)
         self.df.columns = self.df.columns.str.lower()
         require_cols = [
@@ -157,7 +283,7 @@ class Grapher():
 
     def _load_coverage_data(self, filename):
         utils.exit_unless_accessible(filename)
-        self.df_cov = pd.read_csv(filename, sep=None, engine='python')
+        self.df_cov = pd.read_csv(filename, sep=sniff_delimiter(filename))
         self.df_cov.reset_index(drop=True, inplace=True)
         self.df_cov.columns = self.df_cov.columns.str.lower()
         require_cols = ['function', 'filename']
@@ -172,23 +298,24 @@ class Grapher():
             exit(1)
 
         # Normalize paths in the callgraph database.
-        # This operation takes some time, so we don't do it in the suspected
-        # usual case - when coverage data is not provided. However, when
-        # coverage data _is_ provided, we need to normalize the filename
-        # paths also in the callgraph database so that they become comparable
-        # to filename paths in the coverage data.
-
-        self.df['caller_filename'] = self.df[
-            'caller_filename'].map(
-                lambda a: a if pd.isnull(a) else os.path.normpath(a))
-        self.df['callee_filename'] = self.df[
-            'callee_filename'].map(
-                lambda a: a if pd.isnull(a) else os.path.normpath(a))
+        # We don't do it in the suspected usual case - when coverage data
+        # is not provided. However, when coverage data _is_ provided, we
+        # need to normalize the filename paths also in the callgraph
+        # database so that they become comparable to filename paths in the
+        # coverage data.
+        self.df['caller_filename'] = normpath_series(self.df['caller_filename'])
+        self.df['callee_filename'] = normpath_series(self.df['callee_filename'])
+        filenames = [os.path.normpath(f) for f in self.index.filenames]
+        if len(set(filenames)) != len(filenames):
+            # Normalization merged some filenames: the index built from
+            # the original filenames does not match the data anymore
+            self.index = callgraph_index.CallGraphIndex.from_df(self.df)
+        else:
+            self.index.rename_filenames(filenames)
 
         # Normalize paths in the coverage data
-        self.df_cov['filename'] = self.df_cov[
-            'filename'].map(
-                lambda a: a if pd.isnull(a) else os.path.normpath(a))
+        self.df_cov['filename'] = normpath_series(self.df_cov['filename'].astype(str))
+        self.df_cov['function'] = self.df_cov['function'].astype(str)
 
         # Adjust filenames in coverage data to make them relative to
         # the kernel tree directory. This needs to be done so that the
@@ -202,14 +329,39 @@ class Grapher():
         # Possible reasons include:
         # - Absolute vs relative filepaths
         # - Coverage data is from different build compared to callgraph data
-        df = self.df[(self.df['caller_filename'] == example_cov_file)]
-        if df.empty:
+        if self.index.filename_code(example_cov_file) < 0:
             _LOGGER.warn(
                 "Filename '%s' from the coverage data is not in the "
                 "callgraph database. File paths in coverage data will "
                 "likely not match the file paths in callgraph database."
                 % example_cov_file)
 
+        self._join_coverage_data()
+
+    def _join_coverage_data(self):
+        # Join the coverage data onto the node table of the index, so that
+        # the coverage of a node is found with the node code. For each
+        # node, store the number of matching coverage rows and the percent.
+        index = self.index
+        filenames = np.append(np.array(index.filenames, dtype=object), np.nan)
+        functions = np.append(np.array(index.functions, dtype=object), np.nan)
+        df_nodes = pd.DataFrame({
+            # Missing values have code -1, which picks the appended nan
+            'filename': filenames[index.node_filename],
+            'function': functions[index.node_function],
+        })
+        df_cov = self.df_cov[['filename', 'function']].copy()
+        if 'percent' in self.df_cov.columns:
+            df_cov['percent'] = pd.to_numeric(self.df_cov['percent'], errors='coerce')
+        else:
+            df_cov['percent'] = np.nan
+        df_cov = df_cov.groupby(['filename', 'function'], sort=False).agg(
+            matches=('percent', 'size'), percent=('percent', 'first'))
+        df_nodes = df_nodes.merge(
+            df_cov, how='left', left_on=['filename', 'function'], right_index=True)
+        self.cov_matches = df_nodes['matches'].fillna(0).values.astype(np.int64)
+        self.cov_percent = df_nodes['percent'].values.astype(np.float64)
+
     def _is_csv_out(self, filename):
         _fname, extension = os.path.splitext(filename)
         fileformat = extension[1:]
@@ -218,108 +370,175 @@ class Grapher():
         else:
             self.df_out_csv = None
 
-    def _graph(self, filter, curr_depth=0):
-        curr_depth += 1
-        if curr_depth > self.maxdepth:
-            return
-
-        df = self._query(filter, curr_depth)
-        if df.empty and curr_depth == 1:
+    def _graph(self, rows):
+        if len(rows) == 0:
             # First match failed: print to console and stop
             _LOGGER.info("No matching functions found")
             return
-        if df.empty:
-            # Reached leaf: no more matches
-            _LOGGER.debug("%sFound nothing" % (DBG_INDENT*(curr_depth-1)))
-            return
+        self.debug = _LOGGER.isEnabledFor(logging.DEBUG)
+        # Walk the call chains depth-first with an explicit stack of row
+        # iterators. The walk order determines which of the repeated calls
+        # are followed, so it needs to be the same as the recursive walk.
+        stack = [self._walk(rows, 1)]
+        while stack:
+            chain = next(stack[-1], None)
+            if chain is None:
+                stack.pop()
+            else:
+                stack.append(self._walk(*chain))
 
+        if self.aggregate is not None:
+            # Drawn in _write_aggregate()
+            return
         if self.df_out_csv is not None:
-            df.insert(0, "call_depth", curr_depth)
-            self.df_out_csv = self.df_out_csv.append(df)
-
+            self.df_out_csv = self._blocks_to_df(self.blocks)
+            return
+        df = self.df.take(self.rows_drawn)
         for row in df.itertuples():
-            self._dbg_print_row(row, curr_depth)
-            if self.skip_indirect and row.callee_calltype == "indirect":
-                _LOGGER.debug(
-                    "%sSkipping indirect" % (DBG_INDENT*(curr_depth-1)))
-                continue
-            if self._path_drawn(row):
-                _LOGGER.debug(
-                    "%sSkipping duplicate path" % (DBG_INDENT*(curr_depth-1)))
-                continue
-            if pd.isna(row.caller_function) or pd.isna(row.callee_function):
-                continue
-
             # Add caller node
             self._add_node(
+                self.index.caller_node[row.Index],
                 row.caller_function,
                 row.caller_filename,
                 row.caller_def_line)
             # Add callee node
             self._add_node(
+                self.index.callee_node[row.Index],
                 row.callee_function,
                 row.callee_filename,
                 row.callee_line)
             # Add edge between the nodes
             self._add_edge(row)
 
-            if regex_match(self.until_func_regex, row.caller_function):
-                _LOGGER.debug(
-                    "%sReached until_function" % (DBG_INDENT*(curr_depth-1)))
-                continue
-
-            # Construct the filter for next query in the call chain
-            if self.inverse:
-                filter = CallGraphFilter(
-                    callee_function=row.caller_function,
-                    callee_filename=row.caller_filename,
-                    callee_line=str(row.caller_def_line).split('.')[0]
-                )
-            else:
-                filter = CallGraphFilter(
-                    caller_function=row.callee_function,
-                    caller_filename=row.callee_filename,
-                    caller_def_line=str(row.callee_line).split('.')[0]
-                )
-
-            # Recursively find the next entries
-            self._graph(filter, curr_depth)
-
-    def _path_drawn(self, row):
-        if row is None:
+    def _write_aggregate(self, filename):
+        # Calls drawn, aggregated by file or directory
+        if not self.rows_drawn:
             return False
-        if (row.caller_filename == row.callee_filename) and \
-                (row.caller_function == row.callee_function) and \
-                (row.caller_def_line == row.callee_line) and \
-                (row.callee_calltype == "indirect"):
-            # Skip drawing recursive indirect calls
-            return True
-        hash_str = "%s:%s:%s:%s:%s:%s" % (
-            row.caller_filename,
-            row.caller_function,
-            row.caller_line,
-            row.callee_filename,
-            row.callee_function,
-            row.callee_line)
-        h = hash(hash_str)
-        if h in self.paths_drawn:
+        df = self.df.take(self.rows_drawn)
+        if self.df_out_csv is not None:
+            df_to_csv_file(callgraph_aggregate.aggregate_edges(df, self.aggregate), filename)
             return True
-        else:
-            self.paths_drawn.add(h)
-            return False
+        digraph = callgraph_aggregate.to_dot(df, self.aggregate)
+        digraph.render(filename, self.layout, self.layout_timeout, self.cytoscape_js)
+        return True
 
-    def _query(self, filter, depth):
-        query_str = filter.get_query_str()
-        _LOGGER.debug("%sFiltering by: %s" % (DBG_INDENT*(depth-1), query_str))
-        return self.df.query(query_str)
+    def _walk(self, rows, curr_depth):
+        # Generator that visits the rows of one step of the call chains,
+        # yielding the next step for each row that continues the chain
+        if curr_depth > self.maxdepth:
+            return
+        if len(rows) == 0:
+            # Reached leaf: no more matches
+            _LOGGER.debug("%sFound nothing" % (DBG_INDENT*(curr_depth-1)))
+            return
+        self.blocks.append((rows, curr_depth))
+
+        index = self.index
+        caller_node = index.caller_node[rows]
+        callee_node = index.callee_node[rows]
+        caller_function = index.node_function[caller_node]
+        indirect = index.indirect[rows]
+        skip = indirect if self.skip_indirect else np.zeros(len(rows), dtype=bool)
+        # Recursive indirect calls are never drawn
+        recursive = indirect & (caller_node == callee_node) & index.node_valid[caller_node]
+        missing = (caller_function < 0) | (index.node_function[callee_node] < 0)
+        budget = self.max_nodes is not None or self.deadline is not None
+        indent = DBG_INDENT*(curr_depth-1)
+        for row, key, func, is_skip, is_recursive, is_missing, caller, callee in zip(
+                rows.tolist(), index.edge_key[rows].tolist(),
+                caller_function.tolist(), skip.tolist(), recursive.tolist(),
+                missing.tolist(), caller_node.tolist(), callee_node.tolist()):
+            if self.debug:
+                self._dbg_print_row(row, curr_depth)
+            if is_skip:
+                _LOGGER.debug("%sSkipping indirect" % indent)
+                continue
+            if is_recursive or key in self.paths_drawn:
+                _LOGGER.debug("%sSkipping duplicate path" % indent)
+                continue
+            self.paths_drawn.add(key)
+            if is_missing:
+                continue
+            self.rows_drawn.append(row)
+            if budget:
+                self._spend(caller, callee)
+            if self._is_until_function(func):
+                _LOGGER.debug("%sReached until_function" % indent)
+                continue
+            if curr_depth < self.maxdepth:
+                if self._is_pruned_hub(row):
+                    _LOGGER.debug("%sReached hub" % indent)
+                    continue
+                yield index.next_rows(row, self.inverse), curr_depth + 1
+            elif budget and len(index.next_rows(row, self.inverse)) > 0:
+                self.frontier.add(caller if self.inverse else callee)
+
+    def _spend(self, caller, callee):
+        # Count the nodes of a drawn call against the budgets
+        self.nodes_drawn.add(caller)
+        self.nodes_drawn.add(callee)
+        if self.max_nodes is not None and len(self.nodes_drawn) > self.max_nodes:
+            raise BudgetExceeded("Node budget of %s exceeded" % self.max_nodes)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded("Time budget exceeded")
+
+    def _is_pruned_hub(self, row):
+        if self.hubs is None:
+            return False
+        index = self.index
+        node = index.caller_node[row] if self.inverse else index.callee_node[row]
+        if not self.hubs[node] or index.node_function[node] == self.root_function:
+            return False
+        if len(index.next_rows(row, self.inverse)) > 0:
+            self.pruned.add(node)
+        return True
+
+    def _is_until_function(self, function_code):
+        match = self.until_function.get(function_code)
+        if match is None:
+            match = regex_match(
+                self.until_func_regex, self.index.functions[function_code])
+            self.until_function[function_code] = match
+        return match
+
+    def _blocks_to_df(self, blocks):
+        # Rows of all the blocks with their call depth, in one go
+        rows = np.concatenate([rows for rows, _depth in blocks])
+        depths = np.concatenate([
+            np.full(len(rows), depth) for rows, depth in blocks])
+        df = self.df.take(rows)
+        df.insert(0, "call_depth", depths)
+        return df
+
+    def _suggest(self, function, filename):
+        # Hint listing the closest names when the queried function, or
+        # the function in the given file, doesn't exist
+        index = self.index
+        if index.function_code(function) < 0:
+            if self.names is None:
+                self.names = callgraph_names.load_or_build(
+                    self.csvfile, index.functions, index.filenames)
+            return callgraph_names.suggest(self.names.functions, function)
+        if filename and index.filename_code(filename) < 0:
+            codes = np.asarray(index.node_filename)[index.function_nodes(function)]
+            filenames = callgraph_names.NameIndex.from_names(
+                [index.filenames[code] for code in codes if code >= 0])
+            return callgraph_names.suggest(filenames, filename)
+        return ""
+
+    def _query(self, filter):
+        _LOGGER.debug("Filtering by: %s" % filter.get_query_str())
+        if self.inverse:
+            return self.index.function_rows(
+                filter.callee_function, filter.callee_filename, inverse=True)
+        return self.index.function_rows(
+            filter.caller_function, filter.caller_filename)
 
     def _render(self, filename):
         if self.df_out_csv is not None:
             return
-        fname, extension = os.path.splitext(filename)
-        format = extension[1:]
-        self.digraph.render(filename=fname, format=format, cleanup=True)
-        _LOGGER.info("wrote: %s" % filename)
+        self.digraph.render(
+            filename, self.layout, self.layout_timeout, self.cytoscape_js)
 
     def _add_edge(self, row):
         if self.df_out_csv is not None:
@@ -330,7 +549,7 @@ class Grapher():
         if self.edge_labels:
             beg = "<FONT POINT-SIZE=\"8\">"
             end = "</FONT>"
-            label = "<%s%s%s>" % (beg, str(row.caller_line).split('.')[0], end)
+            label = "<%s%s%s>" % (beg, line_str(row.caller_line), end)
             self.digraph.edge(
                 node_id(row.caller_filename, row.caller_function,
                         row.caller_def_line),
@@ -346,62 +565,64 @@ class Grapher():
                         row.callee_function, row.callee_line),
                 style=edge_style)
 
-    def _add_node(self, function, filename, line):
+    def _add_node(self, node, function, filename, line):
         if self.df_out_csv is not None:
             return
         filename = str(filename)
-        line = str(line).split('.')[0]
+        line = line_str(line)
         node_name = node_id(filename, function, line)
+        # The labels and attributes of a node are the same each time it's
+        # seen: add it once
+        if self.node_names.get(node_name) == node:
+            return
+        self.node_names[node_name] = node
+        # Coverage data is looked up with the function name before escaping
+        fillcolor, pct = self._get_coverage_data(node, filename, str(function))
         function = html.escape(str(function))
-        # Node name = function, Default label = []
-        labels = self.nodelabels.setdefault(node_name, [])
-        # Add filename as new label
-        labels.append("%s:%s" % (filename, line))
+        # Add filename as label
+        labels = ["%s:%s" % (filename, line)]
         # Add coverage pct as label
-        fillcolor, pct = self._get_coverage_data(filename, function)
         if pct:
             labels.append(pct)
-        # Remove possible duplicate labels, preserving order
-        labels = list(OrderedDict.fromkeys(labels))
-        # Build the html label: function name on the first line followed by
-        # associated filenames framed with html font-tags
-        beg = "<FONT POINT-SIZE=\"10\">"
-        end = "</FONT>"
-        label = "<%s<BR/>%s%s%s>" % (function, beg, "<BR/>".join(labels), end)
+        style = 'rounded,filled'
+        if node in self.pruned:
+            # Collapsed hub: the calls are not drawn
+            labels.append("(hub, calls not shown)")
+            style = 'rounded,filled,dashed'
         if regex_match(self.colorize_regex, function):
             fillcolor = "#FFE6E6"
         elif not fillcolor:
             fillcolor = '#EEEEEE'
-        # Add node to the graph
+        # Add node to the graph: the labels of nodes with the same name
+        # are merged
         self.digraph.node(
-            node_name, label, style='rounded,filled', fillcolor=fillcolor)
+            node_name, function, labels, style=style, fillcolor=fillcolor)
 
-    def _get_coverage_data(self, filename, function):
+    def _get_coverage_data(self, node, filename, function):
         pct = None
         fillcolor = None
         if self.df_cov is None:
             return fillcolor, pct
-        df = self.df_cov[
-            (self.df_cov['function'] == function) &
-            (self.df_cov['filename'] == filename)]
-        if df.empty:
+        matches = self.cov_matches[node]
+        if matches == 0:
             pct = "\ncoverage: (no coverage info)"
-        elif ('percent' not in list(df.columns.values)):
+        elif ('percent' not in list(self.df_cov.columns.values)):
             pct = ""
-        elif df.shape[0] == 1:
-            val = pd.to_numeric(df['percent'], errors='coerce').values[0]
+        elif matches == 1:
+            val = self.cov_percent[node]
             if not pd.isna(val):
                 pct = "\ncoverage: %s%%" % (int(round(val)))
                 fillcolor = gradient(val)
             else:
                 pct = "\ncoverage: NAN"
-        elif df.shape[0] > 1:
+        else:
             pct = "\ncoverage: (unknown)"
             _LOGGER.error("%s:%s matches multiple rows" % (filename, function))
 
         return fillcolor, pct
 
-    def _dbg_print_row(self, row, depth):
+    def _dbg_print_row(self, index, depth):
+        row = self.df.iloc[index]
         _LOGGER.debug(
             "%sFound: %s:%s():%s ==> %s:%s():%s [%s]" % (
                 DBG_INDENT*(depth-1),
@@ -444,6 +665,23 @@ def df_to_csv_file(df, name):
     _LOGGER.info("wrote: %s" % name)
 
 
+def sniff_delimiter(filename):
+    # Detect the delimiter from the first line only, so that the file
+    # itself can be read with the fast C parser
+    with open(filename, 'r', newline='') as f:
+        line = f.readline()
+    try:
+        return csv.Sniffer().sniff(line).delimiter
+    except csv.Error:
+        return ','
+
+
+def normpath_series(series):
+    # Normalize each unique path once, instead of once per row
+    mapping = {x: os.path.normpath(x) for x in series.dropna().unique()}
+    return series.map(mapping)
+
+
 def check_positive(val):
     intval = int(val)
     if intval <= 0:
@@ -452,10 +690,32 @@ def check_positive(val):
     return intval
 
 
+def check_positive_float(val):
+    floatval = float(val)
+    if not floatval > 0:
+        raise argparse.ArgumentTypeError(
+            "%s is not positive number" % val)
+    return floatval
+
+
+@functools.lru_cache(maxsize=None)
+def compile_regex(regex):
+    # Regexes are compiled once and reused across the queries
+    return re.compile(regex)
+
+
 def regex_match(regex, s):
     if (not regex or not s):
         return False
-    return re.match(regex, s) is not None
+    return compile_regex(regex).match(s) is not None
+
+
+def line_str(line):
+    # Line numbers are floats if the column has missing values, or nullable
+    # integers if read from the callgraph database: format them the same
+    if pd.isna(line):
+        return 'nan'
+    return str(line).split('.')[0]
 
 
 def node_id(filename, function, line):
@@ -466,10 +726,164 @@ def node_id(filename, function, line):
     return ("%s_%s_%s" % (
         filename,
         html.escape(str(function)),
-        float(line)
+        float(line_str(line))
     )).replace(":", "")
 
 
+def query_reachability(reach, args):
+    # Answer the query from the reachability index: the entry points that
+    # reach the function with --inverse, otherwise the functions reachable
+    # from the entry point function
+    name = args.function
+    if args.filename:
+        name = "%s:%s" % (args.filename, args.function)
+    try:
+        node = reach.node(name)
+        if args.inverse:
+            nodes = reach.entries_reaching(node)
+        else:
+            nodes = reach.reached_from(node)
+    except ValueError as e:
+        _LOGGER.error(e)
+        return False
+    df = reach.to_df(nodes)
+    df.sort_values(by=['filename', 'function'], inplace=True)
+    df_to_csv_file(df, args.out)
+    return True
+
+
+################################################################################
+
+
+# Query parameters that can be given per request in the serve mode. Values
+# not specified in the request default to the command line arguments.
+QUERY_KEYS = [
+    'function', 'filename', 'depth', 'inverse', 'out', 'edge_labels',
+    'skip_indirect', 'merge_edges', 'until_function', 'colorize', 'max_nodes',
+    'time_budget', 'aggregate']
+
+
+def query_args(defaults, request):
+    if not isinstance(request, dict):
+        raise ValueError("Query must be a JSON object")
+    unknown = sorted(set(request) - set(QUERY_KEYS))
+    if unknown:
+        raise ValueError("Unknown query keys: %s" % unknown)
+    args = argparse.Namespace(
+        **{key: getattr(defaults, key) for key in QUERY_KEYS})
+    for key, value in request.items():
+        setattr(args, key, value)
+    if not args.function:
+        raise ValueError("Query is missing 'function'")
+    args.depth = check_positive(args.depth)
+    if args.max_nodes is not None:
+        args.max_nodes = check_positive(args.max_nodes)
+    if args.time_budget is not None:
+        args.time_budget = check_positive_float(args.time_budget)
+    if args.aggregate is not None:
+        args.aggregate = callgraph_aggregate.check_aggregate(args.aggregate)
+    return args
+
+
+def handle_query(grapher, defaults, line):
+    try:
+        args = query_args(defaults, json.loads(line))
+        _LOGGER.info("query: %s" % line)
+        written = grapher.graph(args)
+    except Exception as e:
+        # Failed query must not stop the server
+        _LOGGER.error("Failed query '%s': %s" % (line, e))
+        return {"status": "error", "error": str(e)}
+    except SystemExit:
+        # Errors that would otherwise terminate the script
+        return {"status": "error", "error": "query failed, see the log"}
+    return {"status": "ok", "out": args.out, "written": written}
+
+
+def serve_stream(grapher, defaults, instream, outstream):
+    # Answer queries given as JSON lines, one reply line per query
+    for line in instream:
+        line = line.strip()
+        if not line:
+            continue
+        reply = handle_query(grapher, defaults, line)
+        outstream.write("%s\n" % json.dumps(reply))
+        outstream.flush()
+
+
+def serve(grapher, defaults, address):
+    if address == '-':
+        _LOGGER.info("serving queries from stdin")
+        serve_stream(grapher, defaults, sys.stdin, sys.stdout)
+        return
+
+    class QueryHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve_stream(
+                grapher, defaults,
+                io.TextIOWrapper(self.rfile, encoding='utf-8'),
+                io.TextIOWrapper(self.wfile, encoding='utf-8'))
+
+    if os.path.exists(address):
+        os.unlink(address)
+    # Remove the socket also when terminated
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+    # Queries are served one connection at a time: the grapher state is
+    # not shared between concurrent queries
+    with socketserver.UnixStreamServer(address, QueryHandler) as server:
+        _LOGGER.info("serving queries at: %s" % address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(address)
+
+
+# Grapher and default arguments shared with the batch worker processes.
+# Workers are forked after loading, so the loaded data is shared instead
+# of being loaded again in each worker.
+_BATCH_GRAPHER = None
+_BATCH_DEFAULTS = None
+
+
+def _batch_query(line):
+    return handle_query(_BATCH_GRAPHER, _BATCH_DEFAULTS, line)
+
+
+def batch(grapher, defaults, manifest, jobs):
+    # Run the queries listed in the manifest file, one JSON query per line.
+    # Returns True if all the queries succeeded.
+    global _BATCH_GRAPHER, _BATCH_DEFAULTS
+    utils.exit_unless_accessible(manifest)
+    with open(manifest, 'r') as f:
+        lines = [line.strip() for line in f]
+    lines = [line for line in lines if line and not line.startswith('#')]
+    _BATCH_GRAPHER = grapher
+    _BATCH_DEFAULTS = defaults
+    jobs = min(jobs, len(lines))
+    _LOGGER.info("Running %s queries (processes=%s)" % (len(lines), jobs))
+    ok = True
+    if jobs > 1:
+        pool = multiprocessing.get_context('fork').Pool(processes=jobs)
+        replies = pool.imap(_batch_query, lines)
+    else:
+        pool = None
+        replies = map(_batch_query, lines)
+    try:
+        for reply in replies:
+            ok &= reply["status"] == "ok"
+            print(json.dumps(reply), flush=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return ok
+
+
+################################################################################
+
+
 def getargs():
     desc = "Query and visualize call graphs given the callgraph csv "\
         "database (CSV)."
@@ -481,12 +895,13 @@ def getargs():
 
     required_named = parser.add_argument_group('required named arguments')
 
-    help = "function call database csv file"
+    help = "function call database csv file, or callgraph database file "\
+        "converted with convert_callgraph.py"
     required_named.add_argument('--csv', help=help, required=True)
 
-    help = "filter by function name (exact match)"
-    required_named.add_argument(
-        '--function', help=help, required=True)
+    help = "filter by function name (exact match). Required unless --serve "\
+        "or --batch is specified"
+    required_named.add_argument('--function', help=help)
 
     help = "filter by filename (exact match)"
     parser.add_argument('--filename', help=help, default=None)
@@ -505,10 +920,22 @@ def getargs():
         "https://graphviz.org/doc/info/output.html. In addition to graphviz "\
         "supported output formats, the tool supports output in csv to "\
         "allow post-processing the output data. Specify output file with "\
-        ".csv extension to output the query result in textual csv format."
+        ".csv extension to output the query result in textual csv format. "\
+        "For big graphs, specify output file with .html extension to output "\
+        "an interactive graph laid out in the browser with Cytoscape.js, or "\
+        "with .json extension to output the Cytoscape.js graph elements."
     parser.add_argument(
         '--out', nargs='?', help=help, default='graph.png')
 
+    help = "Cytoscape.js file inlined into the html output, so that the page "\
+        "works offline, e.g. cytoscape.min.js %s downloaded from %s. Defaults "\
+        "to '%s': the page loads Cytoscape.js from that url" % (
+            callgraph_dot.CYTOSCAPE_VERSION, callgraph_dot.CYTOSCAPE_URL,
+            callgraph_dot.CYTOSCAPE_CDN)
+    parser.add_argument(
+        '--cytoscape_js', help=help, metavar='FILE',
+        default=callgraph_dot.DEFAULT_CYTOSCAPE_JS)
+
     help = "Add edge labels to graph. This option adds caller "\
         "source line numbers as edge labels to graph."
     parser.add_argument('--edge_labels', help=help, action='store_true')
@@ -534,10 +961,94 @@ def getargs():
         "file."
     parser.add_argument('--coverage_file', help=help)
 
+    help = "Don't follow the calls made by hub functions, which are drawn "\
+        "as collapsed leaf nodes. Hubs are either the functions with at "\
+        "least N distinct callers, or the functions listed in the csv file "\
+        "FILE with the column 'function', and optionally 'filename', for "\
+        "instance the output of find_hubs.py. The queried function is "\
+        "never pruned."
+    parser.add_argument('--prune_hubs', metavar='N|FILE', help=help)
+
+    help = "Collapse the functions by file ('file'), or by directory ('dir'), "\
+        "or by the first N components of the directory ('dir:N', e.g. "\
+        "'dir:2' collapses 'drivers/net/ethernet' into 'drivers/net'). "\
+        "The edges between the files or directories are labelled with the "\
+        "number of calls and drawn with proportional width. With the csv "\
+        "output, the columns are 'caller_group', 'callee_group' and 'calls'."
+    parser.add_argument(
+        '--aggregate', help=help, type=callgraph_aggregate.check_aggregate,
+        metavar='file|dir[:N]')
+
+    help = "Graphviz layout engine used to render the graph: 'dot', 'sfdp', "\
+        "or 'auto' (default), which lays out graphs with more than %s nodes "\
+        "with sfdp, and the others with dot, falling back to sfdp if dot "\
+        "fails or times out" % callgraph_dot.LARGE_GRAPH_NODES
+    parser.add_argument(
+        '--layout', help=help, choices=callgraph_dot.LAYOUTS, default='auto')
+
+    help = "Seconds each layout engine is given to render the graph, "\
+        "defaults to %s" % callgraph_dot.DEFAULT_LAYOUT_TIMEOUT
+    parser.add_argument(
+        '--layout_timeout', help=help, type=check_positive_float,
+        default=callgraph_dot.DEFAULT_LAYOUT_TIMEOUT)
+
+    help = "Stop the traversal when the graph has more than the specified "\
+        "number of nodes. With --max_nodes or --time_budget, the graph is "\
+        "traversed with iterative deepening: the output is written for each "\
+        "completed depth up to --depth, and when the budget runs out, the "\
+        "output of the deepest complete depth is kept."
+    parser.add_argument('--max_nodes', help=help, type=check_positive)
+
+    help = "Stop the traversal after the specified number of seconds, see "\
+        "--max_nodes"
+    parser.add_argument('--time_budget', help=help, type=check_positive_float)
+
+    help = "Serve queries instead of running a single query: the callgraph "\
+        "and coverage data are loaded once and kept in memory between the "\
+        "queries. Queries are read from the specified UNIX socket, or from "\
+        "stdin if no socket is given. Each query is one line of JSON, for "\
+        "example: {\"function\": \"main\", \"depth\": 3, \"out\": \"main.png\"}. "\
+        "Supported keys are: %s. Keys not given in the query default to "\
+        "the values given on the command line. Each query is answered "\
+        "with one line of JSON, reporting the query status and output file." % \
+        ", ".join(QUERY_KEYS)
+    parser.add_argument(
+        '--serve', nargs='?', const='-', metavar='SOCKET', help=help)
+
+    help = "Run the queries listed in the specified manifest file. The "\
+        "manifest contains one query per line in the same JSON format "\
+        "as with --serve. The callgraph and coverage data are loaded once "\
+        "and shared with the processes running the queries. The reply for "\
+        "each query is printed to stdout in the manifest order."
+    parser.add_argument('--batch', metavar='MANIFEST', help=help)
+
+    help = "Number of parallel processes running the --batch queries, "\
+        "defaults to the number of CPUs"
+    parser.add_argument(
+        '--jobs', help=help, type=check_positive,
+        default=multiprocessing.cpu_count())
+
+    help = "Answer the query from the reachability index built with "\
+        "build_reachability.py, instead of drawing the graph: output the "\
+        "entry points of the index that reach --function at any depth "\
+        "with --inverse, otherwise the functions reachable from the entry "\
+        "point --function. The output is csv with the columns 'filename', "\
+        "'function' and 'def_line', so --out must have the .csv extension."
+    parser.add_argument('--reachability', metavar='FILE', help=help)
+
     help = "Set the verbose level (defaults to --v=1)"
     parser.add_argument('--verbose', help=help, type=int, default=1)
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.serve and args.batch:
+        parser.error("--serve and --batch are mutually exclusive")
+    if not args.serve and not args.batch and not args.function:
+        parser.error("the following arguments are required: --function")
+    if args.reachability and (args.serve or args.batch):
+        parser.error("--reachability can't be used with --serve or --batch")
+    if args.reachability and not args.out.endswith(".csv"):
+        parser.error("--reachability requires --out with the .csv extension")
+    return args
 
 
 ################################################################################
@@ -548,10 +1059,26 @@ if __name__ == "__main__":
 
     utils.exit_unless_accessible(args.csv)
     utils.setup_logging(verbosity=args.verbose)
+    if args.reachability:
+        reach = callgraph_reachability.load_for(args.reachability, args.csv)
+        sys.exit(0 if query_reachability(reach, args) else 1)
     gradient_list_generate()
 
     _LOGGER.info("reading input csv")
     g = Grapher(args.csv)
-    g.graph(args)
+    g.layout = args.layout
+    g.layout_timeout = args.layout_timeout
+    g.cytoscape_js = args.cytoscape_js
+    if args.coverage_file is not None:
+        g.load_coverage(args.coverage_file)
+    if args.prune_hubs is not None:
+        g.prune_hubs(args.prune_hubs)
+    if args.serve:
+        serve(g, args, args.serve)
+    elif args.batch:
+        if not batch(g, args, args.batch, args.jobs):
+            sys.exit(1)
+    else:
+        g.graph(args)
 
 ################################################################################
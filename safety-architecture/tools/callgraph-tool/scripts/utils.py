@@ -33,6 +33,37 @@ def exit_unless_accessible(filename):
 ################################################################################
 
 
+def file_signature(filename, with_hash=True):
+    # Identifies the content of the given file: used to tell if files
+    # derived from it (e.g. indexes) are still up-to-date
+    stat = os.stat(filename)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        signature["sha1"] = file_sha1(filename)
+    return signature
+
+
+def file_sha1(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def signature_matches(filename, signature):
+    # Cheap checks first: the hash is only computed if the file
+    # size matches but the modification time has changed
+    current = file_signature(filename, with_hash=False)
+    if not signature or current["size"] != signature.get("size"):
+        return False
+    if current["mtime_ns"] == signature.get("mtime_ns"):
+        return True
+    return file_sha1(filename) == signature.get("sha1")
+
+################################################################################
+
+
 def setup_logging(verbosity=1):
     project_logger = logging.getLogger(LOGGER_NAME)
 
@@ -90,6 +121,9 @@ class CsvWriter():
     def write_arr(self, elems):
         self.writer.writerow(elems)
 
+    def flush(self):
+        self.fp.flush()
+
     def close(self):
         self.fp.close()
         _LOGGER.info("Wrote: %s" % self.filename)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import os
+import pytest
+import shutil
+from pathlib import Path
+import pandas as pd
+
+################################################################################
+
+TESTS_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+TEST_DATA_DIR = TESTS_DIR / "build_reachability_test_data"
+BUILD_REACHABILITY = TESTS_DIR / ".." / "scripts" / "build_reachability.py"
+QUERY_CALLGRAPH = TESTS_DIR / ".." / "scripts" / "query_callgraph.py"
+
+# __sys_a ==> a ==> b ==> a (cycle), b ==> c
+# __sys_b ==> c
+# d ==> e
+CALLS = [
+    ("s.c", "__sys_a", "1", "s.c", "a"),
+    ("s.c", "a", "2", "s.c", "b"),
+    ("s.c", "b", "3", "s.c", "a"),
+    ("s.c", "b", "3", "s.c", "c"),
+    ("s.c", "__sys_b", "4", "s.c", "c"),
+    ("s.c", "d", "5", "s.c", "e"),
+]
+
+################################################################################
+
+
+@pytest.fixture()
+def reach():
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+    os.makedirs(TEST_DATA_DIR)
+    calls = TEST_DATA_DIR / "calls.csv"
+    pd.DataFrame(CALLS, columns=[
+        "caller_filename", "caller_function", "caller_def_line",
+        "callee_filename", "callee_function"]).to_csv(calls, index=False)
+    cmd = [BUILD_REACHABILITY, "--calls", calls, "--entry_regex", "^__sys"]
+    assert subprocess.run(cmd).returncode == 0
+    yield calls, Path("%s.reach" % calls)
+    shutil.rmtree(TEST_DATA_DIR)
+
+
+def query(calls, reach, function, *extra):
+    outfile = TEST_DATA_DIR / "out.csv"
+    cmd = [QUERY_CALLGRAPH, "--csv", calls, "--reachability", reach,
+           "--function", function, "--out", outfile, *extra]
+    if subprocess.run(cmd).returncode != 0:
+        return None
+    return pd.read_csv(outfile)['function'].tolist()
+
+
+def test_help():
+    cmd = [BUILD_REACHABILITY, "-h"]
+    assert subprocess.run(cmd).returncode == 0
+
+
+def test_reached_from_entry(reach):
+    assert query(*reach, "__sys_a") == ["__sys_a", "a", "b", "c"]
+    assert query(*reach, "__sys_b") == ["__sys_b", "c"]
+    # Not an entry point
+    assert query(*reach, "d") is None
+
+
+def test_entries_reaching(reach):
+    assert query(*reach, "c", "--inverse") == ["__sys_a", "__sys_b"]
+    assert query(*reach, "a", "--inverse") == ["__sys_a"]
+    assert query(*reach, "e", "--inverse") == []
+    assert query(*reach, "no_such_function", "--inverse") is None
+
+
+def test_index_of_other_calls(reach):
+    calls, index = reach
+    other = TEST_DATA_DIR / "other.csv"
+    pd.read_csv(calls).head(3).to_csv(other, index=False)
+    assert query(other, index, "c", "--inverse") is None
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import os
+import pytest
+import shutil
+from pathlib import Path
+import pandas as pd
+import test_utils
+
+################################################################################
+
+TESTS_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+TEST_DATA_DIR = TESTS_DIR / "convert_callgraph_test_data"
+CONVERT_CG = TESTS_DIR / ".." / "scripts" / "convert_callgraph.py"
+FILTER_CG = TESTS_DIR / ".." / "scripts" / "filter_callgraph.py"
+QUERY_FC = TESTS_DIR / ".." / "scripts" / "find_callchains.py"
+FILTER_RESOURCES_DIR = TESTS_DIR / "resources" / "filter"
+CHAINS_RESOURCES_DIR = TESTS_DIR / "resources" / "find_callchains"
+
+################################################################################
+
+
+@pytest.fixture()
+def set_up_test_data():
+    print("test setup")
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+    os.makedirs(TEST_DATA_DIR)
+    yield "resource"
+    print("test clean up")
+    shutil.rmtree(TEST_DATA_DIR)
+
+
+def convert(calls, out, *extra):
+    cmd = [CONVERT_CG, "--calls", calls, "--out", out, *extra]
+    assert subprocess.run(cmd).returncode == 0
+    assert Path(out).exists()
+
+
+def test_help():
+    cmd = [CONVERT_CG, "-h"]
+    assert subprocess.run(cmd).returncode == 0
+
+
+def test_convert_missing_input(set_up_test_data):
+    cmd = [
+        CONVERT_CG,
+        "--calls", TEST_DATA_DIR / "calls_foo.csv",
+        "--out", TEST_DATA_DIR / "calls.cgdb"]
+    assert subprocess.run(cmd).returncode == 1
+
+
+def test_filter_from_db(set_up_test_data):
+    db = TEST_DATA_DIR / "calls.cgdb"
+    convert(FILTER_RESOURCES_DIR / "calls.csv", db)
+    filter_out = TEST_DATA_DIR / "mult_col_mult_filter_calls.csv"
+    cmd = [
+        FILTER_CG,
+        "--cols", "caller_function", "callee_filename",
+        "--filters", "^__", "kernel",
+        "--out", filter_out,
+        "--calls", db
+    ]
+    assert subprocess.run(cmd).returncode == 0
+    expected = FILTER_RESOURCES_DIR / "expect_mult_col_mult_filter.csv"
+    df_expected = pd.read_csv(expected)
+    df_generated = pd.read_csv(filter_out)
+    assert df_expected.shape == df_generated.shape
+    df_diff = test_utils.df_difference(df_expected, df_generated)
+    assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_find_callchains_from_db(set_up_test_data):
+    db = TEST_DATA_DIR / "chain_calls.cgdb"
+    convert(CHAINS_RESOURCES_DIR / "chain_calls.csv", db)
+    outfile = TEST_DATA_DIR / "single_chain_right.csv"
+    cmd = [
+        QUERY_FC,
+        "--calls", db,
+        "--from_function", "chain1",
+        "--to_function", "chain3",
+        "--direction", "right",
+        "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    expected = CHAINS_RESOURCES_DIR / "expect_single_chain_right.csv"
+    df_expected = pd.read_csv(expected)
+    df_generated = pd.read_csv(outfile)
+    df_diff = test_utils.df_difference(df_expected, df_generated)
+    assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_duplicates(set_up_test_data):
+    calls = TEST_DATA_DIR / "calls.csv"
+    df = pd.read_csv(CHAINS_RESOURCES_DIR / "chain_calls.csv")
+    pd.concat([df, df]).to_csv(calls, index=False)
+
+    outfile = TEST_DATA_DIR / "filtered.csv"
+    for extra, expected_rows in [([], df.shape[0]), (["--keep_duplicates"], 2 * df.shape[0])]:
+        db = TEST_DATA_DIR / "calls.cgdb"
+        convert(calls, db, *extra)
+        # Filtering with a regex that matches nothing outputs all the rows
+        cmd = [
+            FILTER_CG,
+            "--cols", "caller_function",
+            "--filters", "^no_such_function$",
+            "--out", outfile,
+            "--calls", db
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        assert pd.read_csv(outfile).shape[0] == expected_rows
+
+
+################################################################################
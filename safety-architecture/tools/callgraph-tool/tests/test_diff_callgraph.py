@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import os
+import pytest
+import shutil
+from pathlib import Path
+import pandas as pd
+
+################################################################################
+
+TESTS_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+TEST_DATA_DIR = TESTS_DIR / "diff_callgraph_test_data"
+DIFF_CALLGRAPH = TESTS_DIR / ".." / "scripts" / "diff_callgraph.py"
+
+COLUMNS = [
+    "caller_filename", "caller_function", "caller_line",
+    "callee_filename", "callee_function", "callee_calltype"]
+OLD = [
+    ("a/x.c", "f", "1", "a/x.c", "g", "direct"),
+    ("a/x.c", "f", "2", "a/x.c", "g", "direct"),
+    ("a/x.c", "g", "3", "b/y.c", "h", "direct"),
+    ("b/y.c", "h", "4", "b/y.c", "i", "indirect"),
+]
+NEW = [
+    ("a/x.c", "f", "5", "a/x.c", "g", "direct"),
+    ("b/y.c", "h", "4", "b/y.c", "i", "direct"),
+    ("b/y.c", "i", "6", "a/x.c", "f", "direct"),
+]
+
+################################################################################
+
+
+@pytest.fixture()
+def calls():
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+    os.makedirs(TEST_DATA_DIR)
+    old = TEST_DATA_DIR / "old.csv"
+    new = TEST_DATA_DIR / "new.csv"
+    pd.DataFrame(OLD, columns=COLUMNS).to_csv(old, index=False)
+    pd.DataFrame(NEW, columns=COLUMNS).to_csv(new, index=False)
+    yield old, new
+    shutil.rmtree(TEST_DATA_DIR)
+
+
+def diff(calls, *extra):
+    prefix = TEST_DATA_DIR / "diff"
+    cmd = [DIFF_CALLGRAPH, "--old", calls[0], "--new", calls[1],
+           "--out", prefix, *extra]
+    assert subprocess.run(cmd).returncode == 0
+    return {
+        name: pd.read_csv("%s_%s.csv" % (prefix, name), keep_default_na=False)
+        for name in ["added", "removed", "common"]}
+
+
+def edges(df):
+    return sorted(df["caller_function"] + ">" + df["callee_function"])
+
+
+def test_help():
+    cmd = [DIFF_CALLGRAPH, "-h"]
+    assert subprocess.run(cmd).returncode == 0
+
+
+def test_diff(calls):
+    result = diff(calls, "--chunksize", "1")
+    assert edges(result["added"]) == ["i>f"]
+    assert edges(result["removed"]) == ["g>h"]
+    assert edges(result["common"]) == ["f>g", "h>i"]
+
+
+def test_diff_calltype(calls):
+    result = diff(calls, "--calltype")
+    assert edges(result["added"]) == ["h>i", "i>f"]
+    assert edges(result["removed"]) == ["g>h", "h>i"]
+    assert edges(result["common"]) == ["f>g"]
+    assert result["added"]["callee_calltype"].tolist() == ["direct", "direct"]
+
+
+def test_diff_counts(calls):
+    diff(calls, "--counts", "file", "dir")
+    files = pd.read_csv(TEST_DATA_DIR / "diff_files.csv")
+    assert files.values.tolist() == [
+        ["a/x.c", 0, 1, 1], ["b/y.c", 1, 0, 1]]
+    dirs = pd.read_csv(TEST_DATA_DIR / "diff_dirs.csv")
+    assert dirs.values.tolist() == [["a", 0, 1, 1], ["b", 1, 0, 1]]
@@ -117,4 +117,18 @@ def test_mult_col_mult_filter(set_up_test_data):
     assert subprocess.run(cmd).returncode == 0
 
 
+def test_chunksize_stdin_stdout(set_up_test_data):
+    filter_out = TEST_DATA_DIR / "chunked_calls.csv"
+    cmd = [
+        FILTER_CG,
+        "--cols", "caller_function", "callee_filename",
+        "--filters", "^__", "kernel",
+        "--chunksize", "3",
+        "--calls", "-"
+    ]
+    with open(CALLGRAPH_CSV, 'r') as fin, open(filter_out, 'w') as fout:
+        assert subprocess.run(cmd, stdin=fin, stdout=fout).returncode == 0
+    cmd = ["diff", filter_out, EXPECT_MULT_COL_MULT_FILTER]
+    assert subprocess.run(cmd).returncode == 0
+
 ################################################################################
@@ -13,6 +13,7 @@ import csv
 from pathlib import Path
 import pandas as pd
 import imghdr
+import json
 import test_utils
 
 ################################################################################
@@ -22,6 +23,7 @@ TEST_RESOURCES_DIR = TESTS_DIR / "resources" / "find_callchains"
 TEST_DATA_DIR = TESTS_DIR / "find_callchains_test_data"
 CG_BIN = TESTS_DIR / ".." / "build" / "lib" / "crix-callgraph"
 QUERY_FC = TESTS_DIR / ".." / "scripts" / "find_callchains.py"
+BUILD_REACHABILITY = TESTS_DIR / ".." / "scripts" / "build_reachability.py"
 # BC_GENERATE = TEST_RESOURCES_DIR / "generate_bitcodes.sh"
 # EXPECTED = TEST_RESOURCES_DIR / "expected_calls.csv"
 CALLS_FILE = TEST_RESOURCES_DIR / "chain_calls.csv"
@@ -91,6 +93,17 @@ def test_no_to_function(set_up_test_data):
     assert subprocess.run(cmd).returncode == 1
 
 
+def test_misspelled_from_function(set_up_test_data):
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "chian2",
+           "--to_function", "chain3"]
+    proc = subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    assert proc.returncode == 1
+    assert "did you mean: chain2" in proc.stdout
+
+
 def test_single_chain_right(set_up_test_data):
     EXPECTED = TEST_RESOURCES_DIR / "expect_single_chain_right.csv"
     outfile = TEST_DATA_DIR / "single_chain_right.csv"
@@ -237,3 +250,247 @@ def test_function_specific(set_up_test_data):
 #
 #
 ################################################################################
+
+
+def test_slice_mode(set_up_test_data):
+    for direction, from_function, to_function, expected in [
+            ("right", "chain1", "chain3", "expect_single_chain_right.csv"),
+            ("left", "chain3", "chain1", "expect_single_chain_left.csv"),
+            ("both", "chain2", "^chain[0-9]$", "expect_single_chain_both.csv"),
+            ("right", "recursive_call", "recursive_call", "expect_recursive_chains.csv")]:
+        outfile = TEST_DATA_DIR / ("slice_%s.csv" % direction)
+        cmd = [QUERY_FC,
+               "--calls", CALLS_FILE,
+               "--from_function", from_function,
+               "--to_function", to_function,
+               "--direction", direction,
+               "--mode", "slice",
+               "--out", outfile]
+        assert subprocess.run(cmd).returncode == 0
+        # Slice mode outputs the same calls as the path enumeration
+        df_expected = pd.read_csv(TEST_RESOURCES_DIR / expected)
+        df_generated = pd.read_csv(outfile)
+        df_diff = test_utils.df_difference(df_expected, df_generated)
+        assert df_diff.empty, test_utils.df_to_string(df_diff)
+        assert (TEST_DATA_DIR / ("slice_%s_targets.csv" % direction)).exists()
+
+
+def test_reachability(set_up_test_data):
+    reach = TEST_DATA_DIR / "calls.reach"
+    cmd = [BUILD_REACHABILITY,
+           "--calls", CALLS_FILE,
+           "--entry_regex", "^(chain|main)",
+           "--out", reach]
+    assert subprocess.run(cmd).returncode == 0
+    for direction, from_function, to_function, expected in [
+            ("right", "chain1", "chain3", "expect_single_chain_right.csv"),
+            ("left", "chain3", "chain1", "expect_single_chain_left.csv"),
+            ("both", "chain2", "^chain[0-9]$", "expect_single_chain_both.csv")]:
+        outfile = TEST_DATA_DIR / ("reach_%s.csv" % direction)
+        cmd = [QUERY_FC,
+               "--calls", CALLS_FILE,
+               "--from_function", from_function,
+               "--to_function", to_function,
+               "--direction", direction,
+               "--reachability", reach,
+               "--out", outfile]
+        assert subprocess.run(cmd).returncode == 0
+        # Pruning the unreachable functions doesn't change the output
+        df_expected = pd.read_csv(TEST_RESOURCES_DIR / expected)
+        df_generated = pd.read_csv(outfile)
+        df_diff = test_utils.df_difference(df_expected, df_generated)
+        assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_reachability_no_entries(set_up_test_data):
+    # Index without entry points prunes nothing
+    reach = TEST_DATA_DIR / "calls.reach"
+    cmd = [BUILD_REACHABILITY,
+           "--calls", CALLS_FILE,
+           "--entry_regex", "^nomatch$",
+           "--out", reach]
+    assert subprocess.run(cmd).returncode == 0
+    for direction, from_function, to_function, expected in [
+            ("right", "chain1", "chain3", "expect_single_chain_right.csv"),
+            ("left", "chain3", "chain1", "expect_single_chain_left.csv")]:
+        outfile = TEST_DATA_DIR / ("reach_%s.csv" % direction)
+        cmd = [QUERY_FC,
+               "--calls", CALLS_FILE,
+               "--from_function", from_function,
+               "--to_function", to_function,
+               "--direction", direction,
+               "--reachability", reach,
+               "--out", outfile]
+        assert subprocess.run(cmd).returncode == 0
+        df_expected = pd.read_csv(TEST_RESOURCES_DIR / expected)
+        df_generated = pd.read_csv(outfile)
+        df_diff = test_utils.df_difference(df_expected, df_generated)
+        assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_slice_mode_summary(set_up_test_data):
+    outfile = TEST_DATA_DIR / "slice.csv"
+    summary = TEST_DATA_DIR / "summary.csv"
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "main",
+           "--to_function", "^(say_hello|chain2)$",
+           "--mode", "slice",
+           "--summary", summary,
+           "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    df_summary = pd.read_csv(summary)
+    assert df_summary[["function", "shortest_chain", "chains"]].values.tolist() == [
+        # main->say_hello, main->recursive_call->say_hello, and
+        # main->start_of_longer_call_chain->chain1->chain2->chain3->say_hello
+        ["say_hello", 1, 3],
+        # main->start_of_longer_call_chain->chain1->chain2
+        ["chain2", 3, 1],
+    ]
+
+    # Shorter cutoff leaves out the longest chain
+    cmd += ["--cutoff", "4"]
+    assert subprocess.run(cmd).returncode == 0
+    df_summary = pd.read_csv(summary)
+    assert df_summary[["function", "shortest_chain", "chains"]].values.tolist() == [
+        ["say_hello", 1, 2],
+        ["chain2", 3, 1],
+    ]
+
+
+def test_top_k(set_up_test_data):
+    outfile = TEST_DATA_DIR / "top_k.csv"
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "main",
+           "--to_function", "say_hello",
+           "--direction", "right",
+           "--top_k", "2",
+           "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    df_generated = pd.read_csv(outfile)
+    # The two shortest chains: main->say_hello (two calls), and
+    # main->recursive_call->say_hello
+    chains = df_generated.groupby("chain")["link"].max().to_dict()
+    assert chains == {1: 1, 2: 2}
+    assert df_generated[df_generated["chain"] == 1].shape[0] == 2
+    df_chain = df_generated[df_generated["chain"] == 2].sort_values(by="link")
+    assert df_chain["caller_function"].tolist() == ["main", "recursive_call"]
+    assert df_chain["callee_function"].tolist() == ["recursive_call", "say_hello"]
+
+    # All the chains, compared to the default search
+    cmd[-3:-2] = ["100"]
+    assert subprocess.run(cmd).returncode == 0
+    df_top_k = pd.read_csv(outfile)
+    assert df_top_k["chain"].nunique() == 3
+    outfile_all = TEST_DATA_DIR / "all.csv"
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "main",
+           "--to_function", "say_hello",
+           "--direction", "right",
+           "--out", outfile_all]
+    assert subprocess.run(cmd).returncode == 0
+    df_expected = pd.read_csv(outfile_all)
+    df_top_k = df_top_k.drop(columns=["chain", "link", "direction"]).drop_duplicates()
+    df_diff = test_utils.df_difference(df_expected, df_top_k)
+    assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_aggregate(set_up_test_data):
+    for aggregate, group in [("file", "test-chain.c"), ("dir", ".")]:
+        outfile = TEST_DATA_DIR / ("aggregate_%s.csv" % aggregate)
+        cmd = [QUERY_FC,
+               "--calls", CALLS_FILE,
+               "--from_function", "chain1",
+               "--to_function", "chain3",
+               "--aggregate", aggregate,
+               "--out", outfile]
+        assert subprocess.run(cmd).returncode == 0
+        # Both calls of the chain are within the same file
+        df = pd.read_csv(outfile, keep_default_na=False)
+        assert df.to_dict('records') == [
+            {"caller_group": group, "callee_group": group, "calls": 2}]
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "chain1",
+           "--to_function", "chain3",
+           "--aggregate", "dir:x"]
+    assert subprocess.run(cmd).returncode != 0
+
+
+def test_aggregate_paths(set_up_test_data):
+    # Top-level files are in '.', absolute paths keep their root, and only
+    # the missing filenames are in the group ''
+    calls = TEST_DATA_DIR / "calls_paths.csv"
+    pd.DataFrame({
+        'caller_filename': ["./main.c", "/usr/include/sys/io.h", "lib/a/f.c"],
+        'caller_function': ["main", "io", "f"],
+        'callee_filename': ["/usr/include/sys/io.h", "lib/a/f.c", ""],
+        'callee_function': ["io", "f", "leaf"],
+    }).to_csv(calls, index=False)
+    for aggregate, groups in [
+            ("dir", [".", "/usr/include/sys", "lib/a", ""]),
+            ("dir:1", [".", "/usr", "lib", ""])]:
+        outfile = TEST_DATA_DIR / "aggregate_paths.csv"
+        cmd = [QUERY_FC,
+               "--calls", calls,
+               "--from_function", "main",
+               "--to_function", "^leaf$",
+               "--direction", "right",
+               "--aggregate", aggregate,
+               "--out", outfile]
+        assert subprocess.run(cmd).returncode == 0
+        df = pd.read_csv(outfile, keep_default_na=False)
+        edges = set(zip(df['caller_group'], df['callee_group']))
+        assert edges == set(zip(groups[:-1], groups[1:]))
+
+
+def test_browser_output(set_up_test_data):
+    outfile = TEST_DATA_DIR / "chains.json"
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "chain1",
+           "--to_function", "chain3",
+           "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    with open(outfile) as f:
+        elements = json.load(f)["elements"]
+    functions = sorted(node["data"]["function"] for node in elements["nodes"])
+    assert functions == ["chain1", "chain2", "chain3"]
+    assert len(elements["edges"]) == 2
+    ids = set(node["data"]["id"] for node in elements["nodes"])
+    for edge in elements["edges"]:
+        assert edge["data"]["source"] in ids
+        assert edge["data"]["target"] in ids
+
+    # By default, the html page loads the pinned Cytoscape.js version
+    outfile = TEST_DATA_DIR / "chains_cdn.html"
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "chain1",
+           "--to_function", "chain3",
+           "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    page = outfile.read_text()
+    assert '<script src="https://unpkg.com/cytoscape@3.31.0/' in page
+    assert "cytoscape(" in page
+
+    # Given a file, Cytoscape.js is inlined into the html page
+    cytoscape_js = TEST_DATA_DIR / "cytoscape.min.js"
+    cytoscape_js.write_text("window.cytoscape = function () { return '</script>'; };")
+    outfile = TEST_DATA_DIR / "chains.html"
+    cmd = [QUERY_FC,
+           "--calls", CALLS_FILE,
+           "--from_function", "chain1",
+           "--to_function", "chain3",
+           "--cytoscape_js", cytoscape_js,
+           "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    page = outfile.read_text()
+    assert "window.cytoscape = function () { return '<\\/script>'; };" in page
+    assert "cytoscape(" in page
+    assert "<script src=" not in page
+    # Missing Cytoscape.js fails instead of writing a page that draws nothing
+    cmd[cmd.index(cytoscape_js)] = TEST_DATA_DIR / "missing.js"
+    assert subprocess.run(cmd).returncode != 0
@@ -10,6 +10,7 @@ import shutil
 import csv
 from pathlib import Path
 import pandas as pd
+import test_utils
 
 ################################################################################
 
@@ -61,6 +62,26 @@ def test_find_gaps_basic(set_up_test_data):
     assert missing_cols, "Missing expected columns: %s" % required_cols
 
 
+def test_find_gaps_jobs(set_up_test_data):
+    calls = TEST_DATA_DIR / "calls.csv"
+    coverage = TEST_DATA_DIR / "coverage.csv"
+    outputs = []
+    for jobs in ["1", "3"]:
+        outfile = TEST_DATA_DIR / ("gaps_%s.csv" % jobs)
+        cmd = [
+            FIND_GAPS,
+            "--calls", calls,
+            "--coverage", coverage,
+            "--out", outfile,
+            "--caller_function_regex", ".",
+            "--jobs", jobs
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        outputs.append(Path(outfile).read_bytes())
+    assert outputs[0] == outputs[1]
+    assert not list(TEST_DATA_DIR.glob(".gaps-*"))
+
+
 def test_find_gaps_no_regex_matches(set_up_test_data):
     calls = TEST_DATA_DIR / "calls.csv"
     coverage = TEST_DATA_DIR / "coverage.csv"
@@ -107,6 +128,180 @@ def test_find_gaps_missing_func(set_up_test_data):
     assert missing_cols, "Missing expected columns: %s" % required_cols
 
 
+def test_find_gaps_regex_chars_in_name(set_up_test_data):
+    # Callees are matched by the exact function name, so names with regex
+    # special characters are followed as any other name
+    calls = TEST_DATA_DIR / "calls_special.csv"
+    coverage = TEST_DATA_DIR / "coverage_special.csv"
+    outfile = TEST_DATA_DIR / "gaps.csv"
+    pd.DataFrame({
+        'caller_filename': ["a.c", "a.c", "a.c"],
+        'caller_function': ["main", "op+", "op+"],
+        'callee_filename': ["a.c", "a.c", "a.c"],
+        'callee_function': ["op+", "foo", "bar"],
+    }).to_csv(calls, index=False)
+    pd.DataFrame({
+        'Filename': ["a.c", "a.c", "a.c", "a.c"],
+        'Function': ["main", "op+", "foo", "bar"],
+        'Percent': [100, 50, 0, 100],
+    }).to_csv(coverage, index=False)
+    cmd = [
+        FIND_GAPS,
+        "--calls", calls,
+        "--coverage", coverage,
+        "--out", outfile,
+        "--caller_function_regex", "^main$"
+    ]
+    assert subprocess.run(cmd).returncode == 0
+    df = pd.read_csv(outfile)
+    assert df['call_stack'].tolist() == ["'main' ==> 'op+' ==> 'foo'", "'main' ==> 'op+'"]
+    assert df['callee_subtree_size'].tolist() == [0, 2]
+    assert df['callee_coverage_gap'].tolist() == [0.0, 1.0]
+
+
+def test_find_gaps_unbounded(set_up_test_data):
+    # 'a' and 'b' call each other: the calls between them are counted once
+    calls = TEST_DATA_DIR / "calls_cycle.csv"
+    coverage = TEST_DATA_DIR / "coverage_cycle.csv"
+    outfile = TEST_DATA_DIR / "gaps.csv"
+    pd.DataFrame({
+        'caller_filename': ["a.c", "a.c", "a.c", "a.c", "a.c"],
+        'caller_function': ["main", "main", "a", "b", "b"],
+        'callee_filename': ["a.c", "a.c", "a.c", "a.c", "a.c"],
+        'callee_function': ["a", "c", "b", "a", "c"],
+    }).to_csv(calls, index=False)
+    pd.DataFrame({
+        'Filename': ["a.c", "a.c", "a.c", "a.c"],
+        'Function': ["main", "a", "b", "c"],
+        'Percent': [100, 0, 50, 100],
+    }).to_csv(coverage, index=False)
+    cmd = [
+        FIND_GAPS,
+        "--calls", calls,
+        "--coverage", coverage,
+        "--out", outfile,
+        "--caller_function_regex", "^(b|main)$",
+        "--unbounded"
+    ]
+    assert subprocess.run(cmd).returncode == 0
+    df = pd.read_csv(outfile)
+    assert df['caller_function'].tolist() == ["main", "b"]
+    assert df['scc_size'].tolist() == [1, 2]
+    assert df['subtree_size'].tolist() == [5, 3]
+    assert df['coverage_gap'].tolist() == [2.5, 1.5]
+
+
+def test_find_gaps_unbounded_diamonds(set_up_test_data):
+    # 1100 layers of two functions, each calling both functions of the
+    # next layer: the number of call paths overflows float64
+    calls = TEST_DATA_DIR / "calls_diamonds.csv"
+    coverage = TEST_DATA_DIR / "coverage_diamonds.csv"
+    outfile = TEST_DATA_DIR / "gaps.csv"
+    layers = 1100
+    rows = [("root", "L0_%s" % j) for j in range(2)]
+    rows += [
+        ("L%s_%s" % (i, j), "L%s_%s" % (i + 1, k))
+        for i in range(layers - 1) for j in range(2) for k in range(2)]
+    pd.DataFrame({
+        'caller_filename': "a.c",
+        'caller_function': [caller for caller, _callee in rows],
+        'callee_filename': "a.c",
+        'callee_function': [callee for _caller, callee in rows],
+    }).to_csv(calls, index=False)
+    pd.DataFrame({
+        'Filename': ["a.c"],
+        'Function': ["root"],
+        'Percent': [100],
+    }).to_csv(coverage, index=False)
+    cmd = [
+        FIND_GAPS,
+        "--calls", calls,
+        "--coverage", coverage,
+        "--out", outfile,
+        "--caller_function_regex", "^(root|L1097_0)$",
+        "--unbounded"
+    ]
+    assert subprocess.run(cmd).returncode == 0
+    df = pd.read_csv(outfile)
+    assert df['caller_function'].tolist() == ["root", "L1097_0"]
+    # The sums of the root saturate, the sums near the leaves don't
+    assert df['subtree_size'].tolist() == [2**53, 6]
+    assert df['coverage_gap'].tolist() == [2**53, 6]
+
+
+def test_find_gaps_unbounded_state(set_up_test_data):
+    calls = TEST_DATA_DIR / "calls.csv"
+    coverage = TEST_DATA_DIR / "coverage.csv"
+    coverage_new = TEST_DATA_DIR / "coverage_new.csv"
+    state = TEST_DATA_DIR / "state.npz"
+    df = pd.read_csv(coverage)
+    df['Percent'] = 10
+    df.to_csv(coverage_new, index=False)
+
+    def find_gaps(cov, outfile, *extra):
+        cmd = [
+            FIND_GAPS,
+            "--calls", calls,
+            "--coverage", cov,
+            "--out", outfile,
+            "--caller_function_regex", ".",
+            "--unbounded", *extra
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        return pd.read_csv(outfile)
+
+    find_gaps(coverage, TEST_DATA_DIR / "gaps_old.csv", "--state", state)
+    assert Path(state).exists()
+    # Coverage changed: the scores are updated from the state
+    df_updated = find_gaps(coverage_new, TEST_DATA_DIR / "gaps_updated.csv", "--state", state)
+    df_expected = find_gaps(coverage_new, TEST_DATA_DIR / "gaps_full.csv")
+    assert df_expected.shape[0] > 1
+    df_diff = test_utils.df_difference(df_expected, df_updated)
+    assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_find_gaps_prune_hubs(set_up_test_data):
+    # 'log' is called from 'main', 'a' and 'b': with the threshold 3 it is a
+    # hub and the calls it makes are not followed
+    calls = TEST_DATA_DIR / "calls_hubs.csv"
+    coverage = TEST_DATA_DIR / "coverage_hubs.csv"
+    hubs = TEST_DATA_DIR / "hubs.csv"
+    pd.DataFrame({
+        'caller_filename': ["a.c"] * 6,
+        'caller_function': ["main", "main", "main", "a", "b", "log"],
+        'callee_filename': ["a.c"] * 6,
+        'callee_function': ["a", "b", "log", "log", "log", "c"],
+    }).to_csv(calls, index=False)
+    pd.DataFrame({
+        'Filename': ["a.c"] * 5,
+        'Function': ["main", "a", "b", "log", "c"],
+        'Percent': [100, 0, 0, 50, 0],
+    }).to_csv(coverage, index=False)
+    pd.DataFrame({'function': ["log"]}).to_csv(hubs, index=False)
+
+    def find_gaps(outfile, *extra):
+        cmd = [
+            FIND_GAPS,
+            "--calls", calls,
+            "--coverage", coverage,
+            "--out", outfile,
+            "--caller_function_regex", "^main$",
+            *extra
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        return pd.read_csv(outfile)
+
+    df = find_gaps(TEST_DATA_DIR / "gaps.csv")
+    assert (df['callee_function'] == "c").any()
+    for prune_hubs in ["3", hubs]:
+        df = find_gaps(TEST_DATA_DIR / "gaps_pruned.csv", "--prune_hubs", prune_hubs)
+        assert not (df['callee_function'] == "c").any()
+        assert (df['callee_function'] == "log").any()
+        df = find_gaps(
+            TEST_DATA_DIR / "gaps_unbounded.csv", "--unbounded", "--prune_hubs", prune_hubs)
+        assert df['subtree_size'].tolist() == [5]
+
+
 def test_find_gaps_err_invalid_cov(set_up_test_data):
     calls = TEST_DATA_DIR / "calls.csv"
     coverage = TEST_DATA_DIR / "coverage_foo.csv"
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import os
+import pytest
+import shutil
+from pathlib import Path
+import pandas as pd
+
+################################################################################
+
+TESTS_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+TEST_DATA_DIR = TESTS_DIR / "find_hubs_test_data"
+FIND_HUBS = TESTS_DIR / ".." / "scripts" / "find_hubs.py"
+
+COLUMNS = ["caller_filename", "caller_function", "callee_filename", "callee_function"]
+# 'log' is called from four functions, 'g' from two
+CALLS = [
+    ("a.c", "main", "a.c", "f"),
+    ("a.c", "main", "a.c", "g"),
+    ("a.c", "main", "a.c", "log"),
+    ("a.c", "f", "a.c", "g"),
+    ("a.c", "f", "a.c", "log"),
+    ("a.c", "f", "a.c", "log"),
+    ("a.c", "g", "a.c", "log"),
+    ("a.c", "h", "a.c", "log"),
+    ("a.c", "log", "a.c", "h"),
+]
+
+################################################################################
+
+
+@pytest.fixture()
+def calls():
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+    os.makedirs(TEST_DATA_DIR)
+    calls = TEST_DATA_DIR / "calls.csv"
+    pd.DataFrame(CALLS, columns=COLUMNS).to_csv(calls, index=False)
+    yield calls
+    shutil.rmtree(TEST_DATA_DIR)
+
+
+def find_hubs(calls, *extra):
+    outfile = TEST_DATA_DIR / "hubs.csv"
+    cmd = [FIND_HUBS, "--calls", calls, "--out", outfile, *extra]
+    assert subprocess.run(cmd).returncode == 0
+    return pd.read_csv(outfile)
+
+
+def test_help():
+    cmd = [FIND_HUBS, "-h"]
+    assert subprocess.run(cmd).returncode == 0
+
+
+def test_threshold(calls):
+    df = find_hubs(calls, "--threshold", "2")
+    assert df['function'].tolist() == ["log", "g"]
+    assert df['fan_in'].tolist() == [4, 2]
+    assert df['fan_out'].tolist() == [1, 1]
+    assert df['calls'].tolist() == [5, 2]
+
+
+def test_top(calls):
+    df = find_hubs(calls, "--top", "1")
+    assert df['function'].tolist() == ["log"]
+
+
+def test_err_invalid_threshold(calls):
+    cmd = [FIND_HUBS, "--calls", calls, "--threshold", "0"]
+    assert subprocess.run(cmd).returncode != 0
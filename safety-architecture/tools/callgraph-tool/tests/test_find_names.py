@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import os
+import pytest
+import shutil
+from pathlib import Path
+import pandas as pd
+
+################################################################################
+
+TESTS_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+TEST_DATA_DIR = TESTS_DIR / "find_names_test_data"
+FIND_NAMES = TESTS_DIR / ".." / "scripts" / "find_names.py"
+
+COLUMNS = ["caller_filename", "caller_function", "callee_filename", "callee_function"]
+CALLS = [
+    ("fs/open.c", "do_sys_open", "fs/namei.c", "do_filp_open"),
+    ("fs/open.c", "do_sys_open", "mm/slab.c", "kmalloc"),
+    ("fs/namei.c", "do_filp_open", "fs/namei.c", "path_openat"),
+    ("fs/namei.c", "path_openat", "mm/slab.c", "kfree"),
+    ("mm/slab.c", "kmalloc", "", ""),
+]
+
+################################################################################
+
+
+@pytest.fixture()
+def calls():
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+    os.makedirs(TEST_DATA_DIR)
+    calls = TEST_DATA_DIR / "calls.csv"
+    pd.DataFrame(CALLS, columns=COLUMNS).to_csv(calls, index=False)
+    yield calls
+    shutil.rmtree(TEST_DATA_DIR)
+
+
+def find_names(calls, *extra):
+    cmd = [FIND_NAMES, "--calls", calls, *extra]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0
+    return proc.stdout.split()
+
+
+def test_help():
+    cmd = [FIND_NAMES, "-h"]
+    assert subprocess.run(cmd).returncode == 0
+
+
+def test_closest(calls):
+    assert find_names(calls, "--closest", "kmaloc")[0] == "kmalloc"
+    assert find_names(calls, "--closest", "do_filp_opne", "--limit", "1") == \
+        ["do_filp_open"]
+    # The index was saved next to the callgraph, and is used again
+    assert Path("%s.names" % calls).exists()
+    assert find_names(calls, "--closest", "kmaloc")[0] == "kmalloc"
+
+
+def test_prefix(calls):
+    assert find_names(calls, "--prefix", "do_") == ["do_filp_open", "do_sys_open"]
+    assert find_names(calls, "--prefix", "fs/", "--kind", "filename") == \
+        ["fs/namei.c", "fs/open.c"]
+
+
+def test_regex(calls):
+    assert find_names(calls, "--regex", "^k") == ["kfree", "kmalloc"]
+    assert find_names(calls, "--regex", "open") == \
+        ["do_filp_open", "do_sys_open", "path_openat"]
+    assert find_names(calls, "--regex", "slab", "--kind", "filename") == ["mm/slab.c"]
+
+
+def test_err_no_lookup(calls):
+    cmd = [FIND_NAMES, "--calls", calls]
+    assert subprocess.run(cmd).returncode != 0
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2020 Bayerische Motoren Werke Aktiengesellschaft (BMW AG)
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import subprocess
+import os
+import json
+import pytest
+import shutil
+from pathlib import Path
+import pandas as pd
+
+################################################################################
+
+TESTS_DIR = Path(os.path.dirname(os.path.realpath(__file__)))
+TEST_DATA_DIR = TESTS_DIR / "find_related_test_data"
+FIND_RELATED = TESTS_DIR / ".." / "scripts" / "find_related.py"
+BUILD_REACHABILITY = TESTS_DIR / ".." / "scripts" / "build_reachability.py"
+CONVERT_CG = TESTS_DIR / ".." / "scripts" / "convert_callgraph.py"
+
+# __sys_a ==> mid ==> f1
+# __sys_a ==> f2
+# __sys_b ==> f1, __sys_b ==> f2
+# other ==> f1, other ==> f2
+CALLS = [
+    ("s.c", "__sys_a", "10", "s.c", "mid"),
+    ("s.c", "mid", "20", "s.c", "f1"),
+    ("s.c", "__sys_a", "10", "s.c", "f2"),
+    ("s.c", "__sys_b", "30", "s.c", "f1"),
+    ("s.c", "__sys_b", "30", "s.c", "f2"),
+    ("s.c", "other", "40", "s.c", "f1"),
+    ("s.c", "other", "40", "s.c", "f2"),
+]
+
+################################################################################
+
+
+@pytest.fixture()
+def calls():
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+    os.makedirs(TEST_DATA_DIR)
+    calls = TEST_DATA_DIR / "calls.csv"
+    pd.DataFrame(CALLS, columns=[
+        "caller_filename", "caller_function", "caller_def_line",
+        "callee_filename", "callee_function"]).to_csv(calls, index=False)
+    yield calls
+    shutil.rmtree(TEST_DATA_DIR)
+
+
+def find_related(calls, *extra):
+    outfile = TEST_DATA_DIR / "related.json"
+    cmd = [FIND_RELATED, "--calls", calls, "--out", outfile, *extra]
+    assert subprocess.run(cmd).returncode == 0
+    with open(outfile) as f:
+        return json.load(f)
+
+
+def test_help():
+    cmd = [FIND_RELATED, "-h"]
+    assert subprocess.run(cmd).returncode == 0
+
+
+def test_ancestor(calls):
+    lca = find_related(calls, "--function1", "f1", "--function2", "f2")
+    assert [(x['function'], x['distance1'], x['distance2']) for x in lca] == [
+        ("__sys_b", 1, 1), ("__sys_a", 2, 1)]
+    assert lca[0]['def_line'] == "30"
+
+
+def test_ancestor_cutoff(calls):
+    lca = find_related(
+        calls, "--function1", "f1", "--function2", "f2", "--cutoff", "1",
+        "--ancestor_regex", ".")
+    assert sorted(x['function'] for x in lca) == ["__sys_b", "other"]
+
+
+def test_ancestor_pairs(calls):
+    pairs = TEST_DATA_DIR / "pairs.csv"
+    pd.DataFrame({
+        'function1': ["f1", "mid", "no_such_function", "mid_", "f2"],
+        'function2': ["f2", "s.c:f2", "f2", "f2", "mid_"]}).to_csv(pairs, index=False)
+    result = find_related(calls, "--pairs", pairs)
+    assert len(result) == 5
+    assert [x['function'] for x in result[0]['ancestors']] == ["__sys_b", "__sys_a"]
+    assert [x['function'] for x in result[1]['ancestors']] == ["__sys_a"]
+    assert 'error' in result[2]
+    # Misspelled functions are suggested the closest names
+    assert "did you mean: mid?" in result[3]['error']
+    assert "did you mean: mid?" in result[4]['error']
+
+
+def test_ancestor_missing_function(calls):
+    cmd = [
+        FIND_RELATED, "--calls", calls,
+        "--function1", "no_such_function", "--function2", "f2",
+        "--out", TEST_DATA_DIR / "related.json"]
+    assert subprocess.run(cmd).returncode == 1
+
+
+def test_ancestor_reachability(calls):
+    reach = TEST_DATA_DIR / "calls.reach"
+    cmd = [BUILD_REACHABILITY, "--calls", calls, "--entry_regex", "^__sys",
+           "--out", reach]
+    assert subprocess.run(cmd).returncode == 0
+    common = find_related(
+        calls, "--function1", "f1", "--function2", "f2", "--cutoff", "1",
+        "--reachability", reach)
+    assert common == [
+        {'function': "__sys_a", 'filename': "s.c", 'def_line': "10"},
+        {'function': "__sys_b", 'filename': "s.c", 'def_line': "30"}]
+
+
+def test_offspring(calls):
+    # Three callgraphs with the common calls f1 ==> g ==> h
+    columns = [
+        "caller_filename", "caller_function", "caller_def_line", "caller_line",
+        "callee_filename", "callee_function", "callee_line", "callee_calltype"]
+    common = [
+        ("s.c", "f1", "1", "2", "s.c", "g", "5", "direct"),
+        ("s.c", "g", "5", "6", "s.c", "h", "9", "direct")]
+    inputs = []
+    for k, extra in enumerate([
+            ("s.c", "g", "5", "7", "s.c", "i", "12", "direct"),
+            ("s.c", "f2", "3", "4", "s.c", "g", "5", "direct"),
+            ("s.c", "f2", "3", "4", "s.c", "g", "5", "direct")]):
+        inputs.append(TEST_DATA_DIR / ("calls%s.csv" % k))
+        pd.DataFrame(common + [extra], columns=columns).to_csv(inputs[-1], index=False)
+    outfile = TEST_DATA_DIR / "offspring.csv"
+    cmd = [FIND_RELATED, "--calls", *inputs, "--functions", "f1", "f2", "f2",
+           "--algorithm", "offspring", "--chunksize", "1", "--out", outfile]
+    assert subprocess.run(cmd).returncode == 0
+    df = pd.read_csv(outfile, dtype=str, keep_default_na=False)
+    assert df[columns[:2] + columns[4:6]].values.tolist() == [
+        ["s.c", "f1", "s.c", "g"],
+        ["s.c", "g", "s.c", "h"],
+        ["___", "___", "s.c", "f1"],
+        ["___", "___", "s.c", "f2"],
+        ["___", "___", "s.c", "f2"],
+        ["s.c", "f1", "s.c", "g"],
+        ["s.c", "f2", "s.c", "g"],
+        ["s.c", "f2", "s.c", "g"]]
+
+
+def test_offspring_mixed_inputs(calls):
+    # The same calls from a csv with float line numbers and from a database
+    # converted from a csv with integer line numbers
+    columns = [
+        "caller_filename", "caller_function", "caller_def_line", "caller_line",
+        "callee_filename", "callee_function", "callee_line", "callee_calltype"]
+    rows = [
+        ("s.c", "f1", "1", "2", "s.c", "g", "5", "direct"),
+        ("s.c", "g", "5", "6", "s.c", "h", "9", "direct")]
+    floats = TEST_DATA_DIR / "calls_float.csv"
+    pd.DataFrame(
+        [row[:2] + tuple("%s.0" % x for x in row[2:4]) + row[4:6] + ("%s.0" % row[6],) +
+         row[7:] for row in rows],
+        columns=columns).to_csv(floats, index=False)
+    ints = TEST_DATA_DIR / "calls_int.csv"
+    pd.DataFrame(rows, columns=columns).to_csv(ints, index=False)
+    db = TEST_DATA_DIR / "calls.cgdb"
+    assert subprocess.run([CONVERT_CG, "--calls", ints, "--out", db]).returncode == 0
+    for inputs in [[floats, db], [db, floats]]:
+        outfile = TEST_DATA_DIR / "offspring.csv"
+        cmd = [FIND_RELATED, "--calls", *inputs, "--functions", "f1", "f1",
+               "--algorithm", "offspring", "--out", outfile]
+        assert subprocess.run(cmd).returncode == 0
+        df = pd.read_csv(outfile, dtype=str, keep_default_na=False)
+        # Both common calls are kept, with the line numbers as integers
+        assert df[df['caller_function'] != "___"].values.tolist()[:2] == \
+            [list(row) for row in rows]
+
+
+################################################################################
+
+if __name__ == '__main__':
+    pytest.main([__file__])
+
+################################################################################
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import subprocess
+import json
 import os
 import sys
 import pytest
@@ -100,6 +101,33 @@ def test_png_graph(set_up_test_data):
     assert imghdr.what(query_out) == 'png'
 
 
+def test_png_graph_coverage(set_up_test_data):
+    callgraph_csv = TEST_DATA_DIR / "calls.csv"
+    generate_call_graph_from("test-chain.bclist", callgraph_csv)
+    query_out = TEST_DATA_DIR / "graph.png"
+
+    # Tab separated coverage data for some of the functions in the callgraph
+    df_calls = pd.read_csv(callgraph_csv)
+    df_cov = df_calls[['caller_filename', 'caller_function']].drop_duplicates()
+    df_cov.columns = ['Filename', 'Function']
+    df_cov['Percent'] = [i * 10 % 101 for i in range(df_cov.shape[0])]
+    coverage = TEST_DATA_DIR / "coverage.tsv"
+    df_cov.to_csv(coverage, sep='\t', index=False)
+
+    cmd = [
+        QUERY_CG,
+        "--csv", callgraph_csv,
+        "--function", "main",
+        "--depth", "10",
+        "--coverage_file", coverage,
+        "--out", query_out
+    ]
+
+    assert subprocess.run(cmd).returncode == 0
+    assert Path(query_out).exists()
+    assert imghdr.what(query_out) == 'png'
+
+
 def test_png_graph_edge_labels(set_up_test_data):
     callgraph_csv = TEST_DATA_DIR / "calls.csv"
     generate_call_graph_from("test-chain.bclist", callgraph_csv)
@@ -235,3 +263,174 @@ def test_csv_graph_duplicate(set_up_test_data):
 
 
 ################################################################################
+
+
+def test_csv_graph_index(set_up_test_data):
+    callgraph_csv = TEST_DATA_DIR / "calls.csv"
+    generate_call_graph_from("test-chain.bclist", callgraph_csv)
+    index_dir = TEST_DATA_DIR / "calls.csv.cgindex"
+
+    def query(out):
+        cmd = [
+            QUERY_CG,
+            "--csv", callgraph_csv,
+            "--function", "main",
+            "--depth", "10",
+            "--out", out
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        assert Path(out).exists()
+        return pd.read_csv(out)
+
+    # First query builds the index, second query uses it
+    df_first = query(TEST_DATA_DIR / "graph_first.csv")
+    assert index_dir.exists()
+    df_second = query(TEST_DATA_DIR / "graph_second.csv")
+    df_diff = test_utils.df_difference(df_first, df_second)
+    assert df_diff.empty, test_utils.df_to_string(df_diff)
+    # The query follows the call chains beyond the first call
+    assert df_first['call_depth'].max() > 1
+
+    # Index is rebuilt when the callgraph changes
+    df_calls = pd.read_csv(callgraph_csv)
+    df_calls = df_calls[df_calls['caller_function'] != 'main']
+    df_calls.to_csv(callgraph_csv, index=False)
+    cmd = [
+        QUERY_CG,
+        "--csv", callgraph_csv,
+        "--function", "main",
+        "--out", TEST_DATA_DIR / "graph_third.csv"
+    ]
+    assert subprocess.run(cmd).returncode == 0
+    assert not Path(TEST_DATA_DIR / "graph_third.csv").exists()
+
+
+def test_csv_graph_serve(set_up_test_data):
+    callgraph_csv = TEST_DATA_DIR / "calls.csv"
+    generate_call_graph_from("test-chain.bclist", callgraph_csv)
+    query_out = TEST_DATA_DIR / "graph.csv"
+
+    cmd = [
+        QUERY_CG,
+        "--csv", callgraph_csv,
+        "--function", "main",
+        "--depth", "10",
+        "--out", query_out
+    ]
+    assert subprocess.run(cmd).returncode == 0
+    df_expected = pd.read_csv(query_out)
+
+    # Same query twice, a query that matches nothing, and invalid queries
+    queries = [
+        {"function": "main", "out": str(TEST_DATA_DIR / "serve_1.csv")},
+        {"function": "main", "out": str(TEST_DATA_DIR / "serve_2.csv")},
+        {"function": "no_such_function"},
+        {"function": "main", "depth": 0},
+        {"no_such_key": "main"},
+    ]
+    cmd = [QUERY_CG, "--csv", callgraph_csv, "--depth", "10", "--serve"]
+    proc = subprocess.run(
+        cmd, input="\n".join(json.dumps(q) for q in queries),
+        stdout=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0
+    replies = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [r["status"] for r in replies] == ["ok", "ok", "ok", "error", "error"]
+    assert [r.get("written") for r in replies[:3]] == [True, True, False]
+    for out in ["serve_1.csv", "serve_2.csv"]:
+        df_generated = pd.read_csv(TEST_DATA_DIR / out)
+        df_diff = test_utils.df_difference(df_expected, df_generated)
+        assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_csv_graph_batch(set_up_test_data):
+    callgraph_csv = TEST_DATA_DIR / "calls.csv"
+    generate_call_graph_from("test-chain.bclist", callgraph_csv)
+    df_calls = pd.read_csv(callgraph_csv)
+    functions = sorted(df_calls['caller_function'].dropna().unique())
+
+    manifest = TEST_DATA_DIR / "manifest.jsonl"
+    with open(manifest, 'w') as f:
+        for function in functions:
+            out = TEST_DATA_DIR / ("batch_%s.csv" % function)
+            query = {"function": function, "out": str(out)}
+            f.write("%s\n" % json.dumps(query))
+
+    cmd = [
+        QUERY_CG,
+        "--csv", callgraph_csv,
+        "--depth", "10",
+        "--batch", manifest,
+        "--jobs", "2",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0
+    replies = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert len(replies) == len(functions)
+
+    # Batch outputs match the outputs from single queries
+    for function, reply in zip(functions, replies):
+        assert reply["status"] == "ok"
+        query_out = TEST_DATA_DIR / ("single_%s.csv" % function)
+        cmd = [
+            QUERY_CG,
+            "--csv", callgraph_csv,
+            "--function", function,
+            "--depth", "10",
+            "--out", query_out
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        df_expected = pd.read_csv(query_out)
+        df_generated = pd.read_csv(reply["out"])
+        df_diff = test_utils.df_difference(df_expected, df_generated)
+        assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+
+def test_csv_graph_budget(set_up_test_data):
+    callgraph_csv = TEST_DATA_DIR / "calls.csv"
+    generate_call_graph_from("test-chain.bclist", callgraph_csv)
+
+    def query(out, *extra):
+        cmd = [
+            QUERY_CG,
+            "--csv", callgraph_csv,
+            "--function", "main",
+            "--depth", "10",
+            "--out", out,
+            *extra
+        ]
+        assert subprocess.run(cmd).returncode == 0
+
+    # The budget is not exhausted: same output as without the budget
+    query(TEST_DATA_DIR / "graph.csv")
+    query(TEST_DATA_DIR / "graph_budget.csv", "--max_nodes", "100000", "--time_budget", "600")
+    df_expected = pd.read_csv(TEST_DATA_DIR / "graph.csv")
+    df_generated = pd.read_csv(TEST_DATA_DIR / "graph_budget.csv")
+    df_diff = test_utils.df_difference(df_expected, df_generated)
+    assert df_diff.empty, test_utils.df_to_string(df_diff)
+
+    # The budget runs out on the first call: no complete depth to output
+    query(TEST_DATA_DIR / "graph_none.csv", "--max_nodes", "1")
+    assert not Path(TEST_DATA_DIR / "graph_none.csv").exists()
+
+
+def test_csv_graph_aggregate(set_up_test_data):
+    callgraph_csv = TEST_DATA_DIR / "calls.csv"
+    generate_call_graph_from("test-chain.bclist", callgraph_csv)
+
+    def query(out, *extra):
+        cmd = [
+            QUERY_CG,
+            "--csv", callgraph_csv,
+            "--function", "main",
+            "--depth", "10",
+            "--out", out,
+            *extra
+        ]
+        assert subprocess.run(cmd).returncode == 0
+        return pd.read_csv(out, keep_default_na=False)
+
+    df_calls = query(TEST_DATA_DIR / "graph.csv")
+    df = query(TEST_DATA_DIR / "graph_file.csv", "--aggregate", "file")
+    assert list(df.columns) == ["caller_group", "callee_group", "calls"]
+    # Each call drawn is counted once
+    assert 0 < df['calls'].sum() <= len(df_calls)